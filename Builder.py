@@ -0,0 +1,377 @@
+import os
+import io
+import time
+import contextlib
+import traceback
+import concurrent.futures
+import multiprocessing.util
+
+from Pipeline import Pipeline
+from IncludeFileFilter import IncludeFileFilter
+from RemoveExtraIntroFilter import RemoveExtraIntroFilter
+from CommentFilter import CommentFilter
+from ExecuteCodeFilter import ExecuteCodeFilter
+from TableOfContentsFilter import TableOfContentsFilter
+from MatlabPool import MatlabPool
+from Trace import Trace
+
+workerPool = None # MatlabPool of the worker process.
+
+def createPipeline(no_exec, intro, path=None, cache=None, matlabPool=None,
+        matlabBatch=False, parallelExec=1,
+        tocDepth=TableOfContentsFilter.DEPTH, trace=None, matlabCommand=None,
+        matlabTimeout=None, maxOutput=None, spill=False, spillPath=None,
+        log=None):
+    """ CREATEPIPELINE
+    @brief: Set up the full pipeline of filters used by parse and make.
+
+    @param: no_exec True if we dont want to execute code.
+          : intro True if we want to remove double intros.
+          : path Directory used to resolve includes and execute code. If
+            None, the current working directory is used.
+          : cache ExecCache with the results of executed code. If None, all
+            the code is executed.
+          : matlabPool MatlabPool shared with other documents. If None,
+            MATLAB is started and stopped for this document.
+          : matlabBatch True if we want to send all the MATLAB code of the
+            document to MATLAB at once.
+          : parallelExec Number of independent blocks of code executed at the
+            same time.
+          : tocDepth Deepest level of the titles in the table of contents.
+          : trace Trace where the work of the filters is recorded. If None,
+            nothing is recorded.
+          : matlabCommand Command that runs MATLAB, as a list. If None,
+            matlab is used.
+          : matlabTimeout Maximum time in seconds of each MATLAB block. If
+            None, there is no limit.
+          : maxOutput Maximum number of lines of output of each block of code.
+            If None, there is no limit.
+          : spill True if we want to write the full output of the blocks that
+            are cut to a file next to the output document.
+          : spillPath Directory of those files, from
+            ExecuteCodeFilter.spillPathFor.
+          : log Stream where the filters write their progress. If None, it is
+            written to the stdout.
+
+    @return: pipeline Pipeline ready to run.
+    """
+
+    pipeline = Pipeline(trace, log)
+
+    pipeline.addFilter( CommentFilter() )
+    pipeline.addFilter( IncludeFileFilter(path) )
+    pipeline.addFilter( TableOfContentsFilter(tocDepth) )
+
+    pipeline.addFilter( ExecuteCodeFilter(
+        no_exec, path, cache, matlabPool, matlabBatch, parallelExec,
+        matlabCommand, matlabTimeout, maxOutput, spill, spillPath
+        ) )
+
+    if intro:
+        pipeline.addFilter( RemoveExtraIntroFilter() )
+
+    return pipeline
+
+def outputName(file):
+    """ OUTPUTNAME
+    @brief: Name of the .md file generated from a .mdoc file.
+
+    @param: file Path to the .mdoc file.
+
+    @return: name Path to the .md file.
+    """
+
+    return os.path.splitext(file)[0] + '.md'
+
+def initWorker(prestart, command=None):
+    """ INITWORKER
+    @brief: Set up the MATLAB session of a worker process. The session lives
+            as long as the worker and it is reused by all its documents.
+
+    @param: prestart True if we want to start MATLAB right away.
+          : command Command that runs MATLAB. If None, matlab is used.
+
+    @return: void
+    """
+
+    global workerPool
+
+    workerPool = MatlabPool(1, os.getcwd(), command)
+
+    # Stop MATLAB when the worker process exits.
+    multiprocessing.util.Finalize(workerPool, stopWorker, exitpriority=10)
+
+    if prestart:
+        # The start is not part of the log of any document. If it fails, the
+        # error is reported by the documents that need MATLAB.
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                workerPool.start()
+            except Exception:
+                pass
+
+def stopWorker():
+    """ STOPWORKER
+    @brief: Stop the MATLAB session of a worker process.
+
+    @return: void
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        workerPool.stop()
+
+def usesMatlab(file, options):
+    """ USESMATLAB
+    @brief: Check if a .mdoc file has MATLAB code to execute that is not in
+            the cache.
+
+    @param: file Path to the .mdoc file.
+          : options Dictionary with the options of createPipeline.
+
+    @return: found True if MATLAB has to be started for the file.
+    """
+
+    try:
+        with open(file,'r') as fd:
+            data = fd.read()
+    except OSError:
+        return False
+
+    f = ExecuteCodeFilter(
+        no_exec = False,
+        path = os.path.dirname(file),
+        cache = options.get('cache'),
+        matlabCommand = options.get('matlabCommand')
+        )
+
+    return f.needsMatlab(data)
+
+def renderFile(file, options, matlabPool=None, trace=False,
+        traceMemory=False):
+    """ RENDERFILE
+    @brief: Parse a .mdoc file into a .md file next to it.
+
+    This function is the unit of work of the make command, so it can run in a
+    worker process. The directory of the file is used as the working
+    directory of the pipeline without changing the cwd of the process, and
+    the progress of the filters is written to a log of the document, so the
+    log of each document is kept together.
+
+    @param: file Absolute path to the .mdoc file.
+          : options Dictionary with the options of createPipeline.
+          : matlabPool MatlabPool used to execute MATLAB code. If None, the
+            pool of the worker process is used.
+          : trace True if we want to record the work of the filters.
+          : traceMemory True if we want to record the memory of the filters.
+
+    @return: result Tuple (file, ok, log, deps, events) where deps is the
+             list of files included by the document and events the list of
+             events recorded in its Trace.
+    """
+
+    log = io.StringIO()
+    ok = True
+    deps = []
+    start = time.time()
+
+    fileTrace = Trace(file, traceMemory) if trace else None
+
+    if matlabPool is None:
+        matlabPool = workerPool
+
+    try:
+        with open(file,'r') as fd:
+            data = fd.read()
+
+        path = os.path.dirname(file)
+        pipeline = createPipeline(
+            path = path, matlabPool = matlabPool, trace = fileTrace,
+            spillPath = ExecuteCodeFilter.spillPathFor(outputName(file)),
+            log = log, **options
+            )
+        data = pipeline.run(data)
+        deps = pipeline.dependencies()
+
+        with open(outputName(file),'w') as fd:
+            fd.write(data)
+    except Exception:
+        traceback.print_exc(file=log)
+        ok = False
+
+    if fileTrace is None:
+        return (file, ok, log.getvalue(), deps, [])
+
+    fileTrace.add('document', 'document', start, time.time(), ok = ok)
+
+    return (file, ok, log.getvalue(), deps, fileTrace.events)
+
+class Builder:
+    """ BUILDER
+
+    Parse a set of .mdoc files into .md files using a pool of worker
+    processes.
+    """
+
+    def __init__(self, jobs, options, manifest=None, force=False,
+            matlabWorkers=1, trace=None, matlabPool=None):
+        """ __INIT__
+        @brief: Init of the Builder.
+
+        @param: jobs Number of worker processes. If None, the number of CPUs
+                is used.
+              : options Dictionary with the options of createPipeline (no_exec,
+                intro, cache, matlabBatch, parallelExec, tocDepth,
+                matlabCommand, matlabTimeout, maxOutput, spill).
+              : manifest Manifest used to skip the files that are up to date.
+                If None, all the files are parsed.
+              : force True if we want to parse the files even if they are up
+                to date.
+              : matlabWorkers Number of MATLAB sessions started for the
+                documents with MATLAB code.
+              : trace Trace where the work of every document is recorded. If
+                None, nothing is recorded.
+              : matlabPool MatlabPool kept by the caller between builds. It is
+                used when the files are parsed in this process (one job or
+                one file). If None, MATLAB is started and stopped for each
+                build.
+        """
+
+        self.jobs = jobs or os.cpu_count() or 1
+        self.options = options
+        self.manifest = manifest
+        self.force = force
+        self.matlabWorkers = matlabWorkers
+        self.trace = trace
+        self.matlabPool = matlabPool
+
+    def manifestOptions(self):
+        """ MANIFESTOPTIONS
+        @brief: Options of the pipeline that change the output of a file.
+
+        @return: options Dictionary with the options.
+        """
+
+        options = {
+            'no_exec': self.options.get('no_exec', False),
+            'intro': self.options.get('intro', False),
+            'tocDepth': self.options.get('tocDepth', TableOfContentsFilter.DEPTH)
+            }
+
+        # The options that are not set are left out, so the files built
+        # before they existed are still up to date. The files built with a
+        # stand-in of MATLAB are built again with MATLAB.
+        for name in ('matlabCommand', 'maxOutput', 'spill'):
+            if self.options.get(name):
+                options[name] = self.options[name]
+
+        return options
+
+    def build(self, files):
+        """ BUILD
+        @brief: Parse all the files and print the log of each one.
+
+        @param: files List of absolute paths to .mdoc files.
+
+        @return: failed List of files that could not be parsed.
+        """
+
+        failed = []
+        options = self.manifestOptions()
+
+        # Skip the files that did not change since the last build.
+        if self.manifest and not self.force:
+            pending = []
+            for file in files:
+                if self.manifest.isUpToDate(file, outputName(file), options):
+                    print('Up to date %s' % file)
+                else:
+                    pending.append(file)
+            files = pending
+
+        for file, ok, log, deps, events in self.results(files):
+            print('Parsing %s' % file)
+            print(log, end='')
+
+            if self.trace is not None:
+                self.trace.extend(events)
+
+            if not ok:
+                print('Error: failed to parse %s' % file)
+                failed.append(file)
+
+            if self.manifest:
+                if ok:
+                    self.manifest.update(file, outputName(file), options, deps)
+                else:
+                    self.manifest.remove(file)
+
+        if self.manifest:
+            self.manifest.save()
+
+        return failed
+
+    def results(self, files):
+        """ RESULTS
+        @brief: Parse the files and yield the results as they are done.
+
+        MATLAB is slow to start, so the documents with MATLAB code are parsed
+        by their own pool of workers. Each of them starts MATLAB once and
+        reuses it for all its documents.
+
+        @param: files List of absolute paths to .mdoc files.
+
+        @return: results Iterator of (file, ok, log, deps, events) tuples.
+        """
+
+        trace = (self.trace is not None, self.trace is not None and self.trace.memory)
+        command = self.options.get('matlabCommand')
+
+        # Do not pay the pool start up for a single worker.
+        if self.jobs == 1 or len(files) <= 1:
+            matlabPool = self.matlabPool or MatlabPool(1, os.getcwd(), command)
+            try:
+                for file in files:
+                    yield renderFile(file, self.options, matlabPool, *trace)
+            finally:
+                if matlabPool is not self.matlabPool:
+                    matlabPool.stop()
+            return
+
+        matlabFiles = []
+        if not self.options.get('no_exec'):
+            matlabFiles = [file for file in files if usesMatlab(file, self.options)]
+        otherFiles = [file for file in files if not file in matlabFiles]
+
+        executors = []
+        futures = []
+
+        try:
+            for group, workers, prestart in [
+                    (otherFiles, self.jobs, False),
+                    (matlabFiles, self.matlabWorkers, True)
+                    ]:
+                if not group:
+                    continue
+
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    min(workers, len(group)),
+                    initializer = initWorker,
+                    initargs = (prestart, command)
+                    )
+                executors.append(executor)
+
+                futures += [
+                    executor.submit(renderFile, file, self.options, None, *trace)
+                    for file in group
+                    ]
+
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for executor in executors:
+                executor.shutdown()
+
+        # Each worker only counts what it stored in the cache of executed
+        # code, so the size of the cache is checked once with all of them.
+        if self.options.get('cache') is not None:
+            self.options['cache'].evict()
@@ -1,34 +1,77 @@
 from Filter import Filter
+from Document import Document, Token
 
 class CommentFilter(Filter):
     """ COMMENTFILTER
 
     Remove commented text and avoids its processing in the pipeline.
     """
-    
+
+    KINDS = frozenset([Token.COMMENT])
+    TRIGGERS = (r'<!--',)
+
     def run(self,data):
         """ RUN
-        @brief: Run the filter.
+        @brief: Run the filter. The text is scanned once from start to end and
+                the output is joined once, so the time grows linearly with
+                the size of the text and the number of comments.
         
         @param: data Input text to process.
                 
-        @return: void Output text processed.
+        @return: data Output text processed.
         """
-        
-        while True:
-            # Search comment tags.
-            commentStart = self.searchReg(data,r'<!--')
-            commentEnd = self.searchReg(data,r'-->')
-            
-            # If not found anything, break loop.
-            if not commentStart:
-                break
-
-            # Get index interval to delete.
-            indexStart = commentStart.span(0)[0]
-            indexEnd = commentEnd.span(0)[1]
-
-            # Delete index interval.
-            data = data[0: indexStart:] + data[indexEnd: :]
+
+        data, comments = Document.removeComments(data)
 
         return data
+    
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter line by line. A comment can span several
+                lines, so whether we are in a comment is kept between lines.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
+
+        comment = False
+
+        for line in self.lines(chunks):
+            pieces = []
+            index = 0
+            # The end of a comment is searched after "<!".
+            search = 0
+
+            while True:
+                if comment:
+                    end = line.find('-->', search)
+                    if end == -1:
+                        break
+                    index = end + 3
+                    comment = False
+                else:
+                    start = line.find('<!--', index)
+                    if start == -1:
+                        pieces.append(line[index:])
+                        break
+                    pieces.append(line[index:start])
+                    search = start + 2
+                    comment = True
+
+            if pieces:
+                yield ''.join(pieces)
+
+    def runDocument(self,document):
+        """ RUNDOCUMENT
+        @brief: Run the filter.
+        
+        @param: document Document to process. The comments are taken out of
+                the text when it is parsed, so they are only dropped here.
+                
+        @return: void
+        """
+
+        print('%d comments removed' % len(document.comments), file=self.log)
+
+        document.comments = []
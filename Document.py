@@ -0,0 +1,350 @@
+import re
+
+class Token:
+    """ TOKEN
+
+    Block of a document found by the Document parser.
+
+    The text of a token parsed from a document is not copied: the token
+    keeps the bounds (start, end) of its text in the source. The text is only
+    sliced when it is read, and it is stored in the token when a filter
+    changes it.
+    """
+
+    TEXT = 'text'
+    COMMENT = 'comment'
+    INCLUDE = 'include'
+    TOC = 'toc'
+    HEADING = 'heading'
+    FENCE = 'fence'
+
+    def __init__(self,kind,text,**attrs):
+        """ __INIT__
+        @brief: Init of the Token.
+
+        @param: kind Kind of the token (TEXT, COMMENT, INCLUDE, TOC, HEADING
+                or FENCE).
+              : text Text of the token in the document.
+              : attrs Data of the token, depending on its kind:
+                HEADING: level, title.
+                TOC: level, title if the marker is in a heading.
+                FENCE: start, code, end, language, opts.
+        """
+
+        self.kind = kind
+        self.attrs = attrs
+        self.source = None
+        self.bounds = (0, 0)
+        self.text = text
+
+    @classmethod
+    def span(cls,kind,source,bounds,**attrs):
+        """ SPAN
+        @brief: Create a token that references a span of a text.
+
+        @param: kind Kind of the token.
+              : source Text the token is taken from.
+              : bounds Tuple (start, end) with the offset of the first
+                character of the token and the offset after the last one.
+              : attrs Data of the token.
+
+        @return: token Token object.
+        """
+
+        token = cls(kind, None, **attrs)
+        token.source = source
+        token.bounds = bounds
+
+        return token
+
+    @property
+    def text(self):
+        """ TEXT
+        @brief: Text of the token.
+
+        @return: text Text of the token.
+        """
+
+        if self.source is not None:
+            start, end = self.bounds
+            return self.source[start:end]
+
+        return self._text
+
+    @text.setter
+    def text(self,text):
+        """ TEXT
+        @brief: Change the text of the token. The span is dropped.
+
+        @param: text New text of the token.
+        """
+
+        self.source = None
+        self._text = text
+
+class Document:
+    """ DOCUMENT
+
+    Document parsed into a list of tokens, so the filters of a pipeline do
+    not have to search the whole text again.
+
+    The document is parsed in a single pass. First the comments are removed,
+    then the remaining text is read line by line looking for exec fences,
+    include directives, [TOC] markers and headings. Everything else is kept
+    as text. Lines inside fenced code are never headings.
+    """
+
+    KINDS = frozenset([
+        Token.COMMENT,
+        Token.INCLUDE,
+        Token.TOC,
+        Token.HEADING,
+        Token.FENCE
+        ])
+
+    INCLUDEREG = re.compile(r'@\[(.*?)]\((.*?)\)', re.M|re.I)
+    TOCREG = re.compile(r'\[TOC\]', re.M|re.I)
+    HEADINGREG = re.compile(r'(?m)^(#{1,5}) (?!#)(.*)', re.I)
+    FENCESTARTREG = re.compile(r'```(.*?)exec(.*?)\n', re.M|re.I)
+    FENCEENDREG = re.compile(r'```\n', re.M|re.I)
+    CODEFENCEREG = re.compile(r'[ \t]{0,3}(```|~~~)')
+
+    # Lines that can be a fence, a heading, an include directive or a [TOC]
+    # marker.
+    CANDIDATEREG = re.compile(r'^#.*\n?|^.*?(?:```|~~~|@\[|\[TOC\]).*\n?', re.M|re.I)
+
+    def __init__(self,tokens,kinds=KINDS,comments=None):
+        """ __INIT__
+        @brief: Init of the Document.
+
+        @param: tokens List of tokens.
+              : kinds Kinds of tokens recognized by the parser.
+              : comments List of COMMENT tokens removed from the text.
+        """
+
+        self.tokens = tokens
+        self.kinds = frozenset(kinds)
+        self.comments = comments or []
+
+    @classmethod
+    def parse(cls,data,kinds=KINDS):
+        """ PARSE
+        @brief: Parse a text into a document.
+
+        @param: data Text to parse.
+              : kinds Kinds of tokens to recognize. The rest is kept as text.
+
+        @return: document Document object.
+        """
+
+        comments = []
+
+        if Token.COMMENT in kinds:
+            data, comments = cls.removeComments(data)
+
+        return cls(cls.tokenize(data,kinds), kinds, comments)
+
+    @staticmethod
+    def removeComments(data):
+        """ REMOVECOMMENTS
+        @brief: Remove the text between "<!--" and "-->" marks in one pass.
+
+        @param: data Text to process.
+
+        @return: result Tuple (data, comments) with the text without the
+                 comments and the list of COMMENT tokens removed.
+        """
+
+        pieces = []
+        comments = []
+        index = 0
+
+        while True:
+            start = data.find('<!--', index)
+            if start == -1:
+                break
+
+            # A comment not closed goes until the end of the text.
+            end = data.find('-->', start + 2)
+            end = len(data) if end == -1 else end + 3
+
+            pieces.append(data[index:start])
+            comments.append(Token.span(Token.COMMENT, data, (start, end)))
+            index = end
+
+        pieces.append(data[index:])
+
+        return (''.join(pieces), comments)
+
+    @classmethod
+    def tokenize(cls,data,kinds=KINDS):
+        """ TOKENIZE
+        @brief: Split a text without comments into tokens. The tokens are
+                spans of the text, so the text is not copied.
+
+        @param: data Text to split.
+              : kinds Kinds of tokens to recognize. The rest is kept as text.
+
+        @return: tokens List of tokens.
+        """
+
+        tokens = []
+
+        # End of the last token, the text from here is not in a token yet.
+        pos = 0
+
+        # Marker of the fenced code (not executed) we are in, if any.
+        codeFence = None
+
+        # Only the lines that can be something else than text are visited,
+        # the rest of the text is skipped by the regular expression.
+        candidates = cls.CANDIDATEREG.finditer(data)
+
+        for searchObj in candidates:
+            line = searchObj.group()
+            start, end = searchObj.span()
+
+            if Token.FENCE in kinds and '```' in line:
+                fenceStart = cls.FENCESTARTREG.search(line)
+                if fenceStart:
+                    # The fence is closed by the next line with "```".
+                    codeEnd = stop = len(data)
+                    for endObj in candidates:
+                        if cls.FENCEENDREG.search(endObj.group()):
+                            codeEnd, stop = endObj.span()
+                            break
+
+                    if start > pos:
+                        tokens.append(Token.span(Token.TEXT, data, (pos, start)))
+
+                    tokens.append(Token.span(
+                        Token.FENCE, data, (start, stop),
+                        start = line,
+                        code = data[end:codeEnd],
+                        end = data[codeEnd:stop],
+                        language = fenceStart.group(1),
+                        opts = fenceStart.group(2).split()
+                        ))
+                    pos = stop
+                    continue
+
+            kind = None
+            attrs = {}
+
+            fence = cls.CODEFENCEREG.match(line)
+            if fence:
+                if codeFence is None:
+                    codeFence = fence.group(1)
+                elif fence.group(1) == codeFence:
+                    codeFence = None
+
+            if Token.HEADING in kinds and codeFence is None and line[:1] == '#':
+                heading = cls.HEADINGREG.match(line)
+                if heading:
+                    kind = Token.HEADING
+                    attrs = {
+                        'level': len(heading.group(1)),
+                        'title': heading.group(2)
+                        }
+
+            # A [TOC] marker in a heading keeps the data of the heading.
+            if Token.INCLUDE in kinds and '@[' in line and cls.INCLUDEREG.search(line):
+                kind = Token.INCLUDE
+            elif Token.TOC in kinds and '[' in line and cls.TOCREG.search(line):
+                kind = Token.TOC
+
+            if kind is None:
+                continue
+
+            if start > pos:
+                tokens.append(Token.span(Token.TEXT, data, (pos, start)))
+
+            tokens.append(Token.span(kind, data, (start, end), **attrs))
+            pos = end
+
+        if len(data) > pos:
+            tokens.append(Token.span(Token.TEXT, data, (pos, len(data))))
+
+        return tokens
+
+    def serialize(self):
+        """ SERIALIZE
+        @brief: Join the tokens into a text. Consecutive tokens that are
+                contiguous spans of the same text are sliced at once.
+
+        @return: data Text of the document.
+        """
+
+        pieces = []
+        source = None
+        start = end = 0
+
+        for token in self.tokens:
+            if source is not None and token.source is source and token.bounds[0] == end:
+                end = token.bounds[1]
+                continue
+
+            if source is not None:
+                pieces.append(source[start:end])
+
+            source = token.source
+            if source is not None:
+                start, end = token.bounds
+            else:
+                pieces.append(token.text)
+
+        if source is not None:
+            pieces.append(source[start:end])
+
+        return ''.join(pieces)
+
+    def size(self):
+        """ SIZE
+        @brief: Length of the text of the document, without joining it.
+
+        @return: size Number of characters.
+        """
+
+        size = 0
+
+        for token in self.tokens:
+            if token.source is not None:
+                size += token.bounds[1] - token.bounds[0]
+            else:
+                size += len(token.text)
+
+        return size
+
+    def find(self,kind):
+        """ FIND
+        @brief: Find the tokens of a kind.
+
+        @param: kind Kind of the tokens.
+
+        @return: tokens List of (index, token) tuples.
+        """
+
+        return [
+            (index, token) for index, token in enumerate(self.tokens)
+            if token.kind == kind
+            ]
+
+    def replace(self,replacements):
+        """ REPLACE
+        @brief: Replace tokens by lists of tokens.
+
+        @param: replacements Dictionary with the list of new tokens for the
+                index of each token to replace.
+
+        @return: void
+        """
+
+        tokens = []
+
+        for index, token in enumerate(self.tokens):
+            if index in replacements:
+                tokens += replacements[index]
+            else:
+                tokens.append(token)
+
+        self.tokens = tokens
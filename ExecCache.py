@@ -0,0 +1,224 @@
+import os
+import json
+import hashlib
+import threading
+
+class ExecCache:
+    """ EXECCACHE
+
+    Persistent cache of the output of executed code blocks.
+
+    Each result is stored in its own file named after the hash of everything
+    that can change it (language, code, options, working directory and the
+    contents of the watched files). The cache is bounded in size: when it
+    grows over the limit, the least recently used results are removed.
+
+    The size of the cache is measured once, on the first store, and then
+    kept up to date by each store, so the directory is only walked again
+    when the cache has to be trimmed.
+    """
+
+    MAXSIZE = 100*1024*1024 # Default size limit in bytes.
+    LOWWATER = 0.9 # Fraction of the limit left after trimming the cache.
+
+    def __init__(self,path,maxSize=MAXSIZE,refresh=False):
+        """ __INIT__
+        @brief: Init of the ExecCache.
+
+        @param: path Directory where the results are stored.
+              : maxSize Maximum size of the cache in bytes.
+              : refresh True if we want to execute all the code again and
+                overwrite the cached results.
+        """
+
+        self.path = os.path.abspath(path)
+        self.maxSize = maxSize
+        self.refresh = refresh
+        self.size = None # Bytes used by the results, None until measured.
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        """ __GETSTATE__
+        @brief: State sent to the worker processes of make, without the
+                lock.
+
+        @return: state Dictionary with the attributes.
+        """
+
+        state = self.__dict__.copy()
+        del state['lock']
+
+        return state
+
+    def __setstate__(self,state):
+        """ __SETSTATE__
+        @brief: Rebuild the cache in a worker process.
+
+        @param: state Dictionary with the attributes.
+
+        @return: void
+        """
+
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def key(self,*parts):
+        """ KEY
+        @brief: Compute the key of a result.
+
+        @param: parts Values that identify the result. They must be JSON
+                serializable.
+
+        @return: key Hex digest of the parts.
+        """
+
+        data = json.dumps(parts, sort_keys=True)
+
+        return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+    def fileHash(self,filepath):
+        """ FILEHASH
+        @brief: Hash of the contents of a watched file.
+
+        @param: filepath Path to the file.
+
+        @return: h Hex digest of the file, None if it does not exist.
+        """
+
+        try:
+            with open(filepath,'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def filename(self,key):
+        """ FILENAME
+        @brief: File where a result is stored.
+
+        @param: key Key of the result.
+
+        @return: filename Path to the file.
+        """
+
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self,key):
+        """ GET
+        @brief: Look for a result in the cache.
+
+        @param: key Key of the result.
+
+        @return: output Cached output, None if it is not cached.
+        """
+
+        if self.refresh:
+            return None
+
+        filename = self.filename(key)
+
+        try:
+            with open(filename,'r') as f:
+                output = json.load(f)['output']
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Mark the result as recently used.
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+        return output
+
+    def put(self,key,output):
+        """ PUT
+        @brief: Store a result in the cache.
+
+        @param: key Key of the result.
+              : output Output of the code.
+
+        @return: void
+        """
+
+        filename = self.filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Several processes and threads can write in the cache at the same
+        # time, so write to a temporary file and move it into place.
+        tmp = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+        with open(tmp,'w') as f:
+            json.dump({'output': output}, f)
+
+        # The result can replace an older one of the same key.
+        added = os.stat(tmp).st_size
+        try:
+            added -= os.stat(filename).st_size
+        except OSError:
+            pass
+
+        os.replace(tmp, filename)
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.measure()
+            else:
+                self.size += added
+            full = self.size > self.maxSize
+
+        if full:
+            self.evict()
+
+    def measure(self):
+        """ MEASURE
+        @brief: Walk the cache and add the size of its results.
+
+        @return: size Bytes used by the results.
+        """
+
+        size = 0
+
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                try:
+                    size += os.stat(os.path.join(root, name)).st_size
+                except OSError:
+                    continue
+
+        return size
+
+    def evict(self):
+        """ EVICT
+        @brief: If the cache is over its size limit, remove the least
+                recently used results until it is under LOWWATER of the
+                limit, so the next stores do not trim it again.
+
+        @return: void
+        """
+
+        entries = []
+        size = 0
+
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                filename = os.path.join(root, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, filename))
+                size += st.st_size
+
+        if size > self.maxSize:
+            entries.sort()
+
+            for mtime, fileSize, filename in entries:
+                if size <= self.maxSize*self.LOWWATER:
+                    break
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+                size -= fileSize
+
+        with self.lock:
+            self.size = size
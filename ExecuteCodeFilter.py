@@ -1,8 +1,17 @@
 from Filter import Filter
+from Document import Document, Token
+from ShellSession import ShellSession
+from MatlabSession import MatlabSession
 import os
 import io
-import subprocess
 import re
+import glob
+import math
+import threading
+import time
+import signal
+import subprocess
+import concurrent.futures
 
 class ExecuteCodeFilter(Filter):
     """ EXECUTECODEFILTER(FILTER)
@@ -10,89 +19,321 @@ class ExecuteCodeFilter(Filter):
     Execute code and append the ouptut of the execution.
     """
 
-    def __init__(self,no_exec):
+    KINDS = frozenset([Token.FENCE])
+    TRIGGERS = (r'```.*?exec',)
+    COST = 100 # MATLAB and the shells are started.
+    SPILLSUFFIX = '.output' # Directory of the full outputs of a document.
+
+    # Options that change what a block executes or its output, with the
+    # number of values they take. Only these are part of the cache key.
+    EXECOPTS = {'--path': 1, '--stderr': 0, '--independent': 0}
+
+    def __init__(self,no_exec,path=None,cache=None,matlabPool=None,
+            matlabBatch=False,parallelExec=1,matlabCommand=None,
+            matlabTimeout=None,maxOutput=None,spill=False,spillPath=None):
         """ __INIT__
         @brief: Init of the ExecuteCodeFilter.
         
         @param: no_exec True if we dont want to execute code.
+              : path Workspace directory where the code is executed. If None,
+                the current working directory is used.
+              : cache ExecCache with the results of previous executions. If
+                None, all the code is executed.
+              : matlabPool MatlabPool shared with other documents. If None,
+                MATLAB is started for this document and stopped at the end.
+              : matlabBatch True if we want to send all the MATLAB code of
+                the document to MATLAB at once.
+              : parallelExec Number of independent blocks executed at the
+                same time.
+              : matlabCommand Command that runs MATLAB, as a list. If None,
+                the default of MatlabSession is used. It is not used if there
+                is a matlabPool, the pool has its own.
+              : matlabTimeout Maximum time in seconds of each MATLAB block,
+                unless the block has its own --timeout. If None, there is no
+                limit.
+              : maxOutput Maximum number of lines of output of a block in the
+                document, unless the block has its own --max-output. Longer
+                outputs are cut to their first and last lines. If None, there
+                is no limit.
+              : spill True if we want to write the full output of the blocks
+                that are cut to a file, linked from the document.
+              : spillPath Directory of those files. It must be next to the
+                output document. If None, the outputs are only cut.
         """
 
         self.no_exec = no_exec
-        self.matlabProcess = -1 # -1 if process is shutdown.
-        self.workspacePath = os.getcwd()
+        self.matlabPool = matlabPool
+        self.matlabBatch = matlabBatch
+        self.parallelExec = parallelExec
+        self.matlabCommand = matlabCommand
+        self.matlabTimeout = matlabTimeout
+        self.maxOutput = maxOutput
+        self.spill = spill
+        self.spillPath = spillPath
+        self.blockCount = 0 # Blocks of code of the document, for naming files.
+        self.spilled = set() # Files written to spillPath.
+        self.matlabSession = None
+        self.matlabError = None # Error raised while starting MATLAB.
+        self.matlabThread = None # Thread starting MATLAB in background.
+        self.matlabLock = threading.Lock()
+        self.shellSession = None
+        self.workspacePath = os.path.abspath(path) if path else os.getcwd()
+        self.cache = cache
+        self.chains = {} # Key of the last block executed in each session.
+        self.watched = [] # Files watched by the blocks executed.
+        self.pending = {} # Blocks of each session taken from the cache.
     
-    def run(self,data):
-        """ RUN
+    @staticmethod
+    def hasMatlabCode(data):
+        """ HASMATLABCODE
+        @brief: Check if a text has MATLAB code to execute.
+        
+        @param: data Input text.
+                
+        @return: found True if there is MATLAB code to execute.
+        """
+
+        return re.search(r'```(matlab|MATLAB|Matlab) exec',data) is not None
+
+    @staticmethod
+    def spillPathFor(filename):
+        """ SPILLPATHFOR
+        @brief: Directory of the full outputs of a document, next to it.
+        
+        @param: filename Path to the output document.
+                
+        @return: path Path to the directory.
+        """
+
+        return os.path.splitext(filename)[0] + ExecuteCodeFilter.SPILLSUFFIX
+
+    def needsMatlab(self,data):
+        """ NEEDSMATLAB
+        @brief: Check if a text has MATLAB code to execute that is not in the
+                cache. The keys of the blocks are computed as they would be
+                executed, without changing the state of the filter.
+        
+        @param: data Input text.
+                
+        @return: found True if MATLAB has to be started.
+        """
+
+        if not self.hasMatlabCode(data):
+            return False
+
+        if self.cache is None:
+            return True
+
+        fnc = self.executeMatlabCode
+        chains = self.chains
+        self.chains = dict(chains)
+
+        try:
+            document = Document.parse(data,[Token.COMMENT, Token.FENCE])
+            for index, token in document.find(Token.FENCE):
+                language = token.attrs['language'][:-1]
+                opts = token.attrs['opts']
+                if not token.attrs['end'] or self.languageFunction(language,opts) != fnc:
+                    continue
+                if '--no-cache' in opts:
+                    return True
+                key = self.blockKey(fnc,language,token.attrs['code'],opts,self.workspace(opts))
+                if self.cache.get(key) is None:
+                    return True
+        finally:
+            self.chains = chains
+
+        return False
+
+    def prepare(self,data):
+        """ PREPARE
+        @brief: Start MATLAB in background if the text has MATLAB code that
+                is not in the cache, so it starts while the previous filters
+                are running.
+        
+        @param: data Input text of the pipeline.
+                
+        @return: void
+        """
+
+        if self.no_exec or self.matlabSession or self.matlabThread:
+            return
+
+        if not self.needsMatlab(data):
+            return
+
+        self.matlabThread = threading.Thread(
+                target = self.prewarmMatlabSession,
+                daemon = True
+                )
+        self.matlabThread.start()
+
+    def runDocument(self,document):
+        """ RUNDOCUMENT
         @brief: Run the filter.
         
-        @param: data Input text to process.
+        @param: document Document to process.
                 
-        @return: dataOut Output text processed.
+        @return: void
         """
 
-        # Set a buffer with the data to process.
-        buff = io.StringIO(data)
+        self.watched = []
 
-        dataOut = ''
+        try:
+            self.executeDocument(document)
+        finally:
+            self.closeSessions()
+            self.cleanSpill()
+
+    def skip(self):
+        """ SKIP
+        @brief: The document has no code to execute. Remove the full outputs
+                written by previous runs of the document.
         
-        while True:
-            # We process the data line per line.
-            line = buff.readline()
+        @return: void
+        """
 
-            # If buff is ended, break the loop.
-            if not line:
-                break
+        self.cleanSpill()
 
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter line by line. Each block of code is executed
+                when its fence is closed. The batch and parallel modes
+                execute blocks ahead of time, so they read the whole text.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
 
-            # Look for the start of a code to execute.
-            codeStart = self.searchReg(line, r'```(.*?)exec(.*?)\n')
+        if self.matlabBatch or self.parallelExec > 1:
+            yield from super().stream(chunks)
+            return
 
-            if not codeStart:
-                # Save lines readed in dataOut.
-                dataOut += line
-                continue
+        fenceStart = None
+        code = []
+        self.watched = []
+
+        try:
+            for line in self.lines(chunks):
+                if fenceStart is None:
+                    fenceStart = '```' in line and Document.FENCESTARTREG.search(line)
+                    if not fenceStart:
+                        fenceStart = None
+                        yield line
+                        continue
+
+                    # Start MATLAB while the code of the block is read. With
+                    # a cache, it is only known if the block needs MATLAB
+                    # when the block is closed.
+                    if self.cache is None:
+                        self.prepare(line)
+                    code = []
 
-            code = ''
+                elif Document.FENCEENDREG.search(line):
+                    yield self.executeCode(
+                        ''.join(code),
+                        fenceStart.group(1),
+                        fenceStart.group(2).split()
+                        )
+                    fenceStart = None
 
-            # Read the code to execute.
-            if codeStart:
-                while True:
-                    line = buff.readline()
-                    if not line:
-                        break
-                    #dataOut += line
+                else:
+                    code.append(line)
 
-                    # Look for the end of code to execute.
-                    codeEnd = self.searchReg(line, r'```\n')
+            # A block that is not closed is removed from the document.
+        finally:
+            self.closeSessions()
+            self.cleanSpill()
 
-                    if codeEnd:
-                        # Execute the code.
-                        language = codeStart.group(1)
-                        opts = codeStart.group(2).split()
+    def executeDocument(self,document):
+        """ EXECUTEDOCUMENT
+        @brief: Replace the blocks of code of a document with their output.
+        
+        @param: document Document to process.
+                
+        @return: void
+        """
 
-                        codeOut = self.executeCode(code,language,opts)
-                        dataOut += codeOut
+        # Blocks of code to execute, with their position in the document. A
+        # block that is not closed is removed from the document.
+        blocks = [
+            (index, (token.attrs['code'], token.attrs['language'], token.attrs['opts']))
+            for index, token in document.find(Token.FENCE)
+            if token.attrs['end']
+            ]
 
-                        break
-                    else:
-                        code += line
+        # Output of the blocks executed before writing the document.
+        results = {}
 
-        if not self.matlabProcess == -1:
-            self.stopMatlabProcess()
+        # Execute all the MATLAB code at once if requested.
+        if self.matlabBatch and not self.no_exec:
+            matlabBlocks = [
+                (index, block) for index, block in blocks
+                if self.languageFunction(block[1][:-1],block[2]) == self.executeMatlabCode
+                and not self.optionsError(block[2])
+                ]
+            if matlabBlocks:
+                codeOuts = self.executeMatlabBatch([block for index, block in matlabBlocks])
+                for (index, block), codeOut in zip(matlabBlocks, codeOuts):
+                    results[index] = codeOut
 
-        return dataOut
+        # Execute the independent blocks at the same time if requested.
+        if self.parallelExec > 1 and not self.no_exec:
+            independentBlocks = [
+                (index, block) for index, block in blocks
+                if self.languageFunction(block[1][:-1],block[2]) == self.executeIndependentCode
+                and not self.optionsError(block[2])
+                ]
+            if independentBlocks:
+                results.update(self.executeParallel(independentBlocks))
 
-    def executeCode(self,code,language,opts):
-        """ EXECUTECODE
-        @brief: Execute the code.
+        replacements = {index: [] for index, token in document.find(Token.FENCE)}
+
+        for index, (code, language, opts) in blocks:
+            # Execute the code.
+            codeOut = self.executeCode(code,language,opts,results.get(index))
+            replacements[index] = [Token(Token.TEXT, codeOut)]
+
+        document.replace(replacements)
+
+    def closeSessions(self):
+        """ CLOSESESSIONS
+        @brief: Close the MATLAB and shell sessions used by the document.
         
-        @param: code Code to execute.
-              : language Code language (Matlab, python, etc)
+        @return: void
+        """
+
+        # If MATLAB is still starting, the thread closes it when it is ready.
+        with self.matlabLock:
+            self.matlabThread = None
+            self.matlabError = None
+
+        if self.matlabSession:
+            self.closeMatlabSession(self.matlabSession)
+            self.matlabSession = None
+
+        if self.shellSession:
+            self.shellSession.stop()
+            self.shellSession = None
+
+        self.chains = {}
+        self.pending = {}
+
+    def languageFunction(self,language,opts):
+        """ LANGUAGEFUNCTION
+        @brief: Get the function that executes the code of a language.
+        
+        @param: language Code language (Matlab, python, etc)
               : opts Options for executing the code.
                 
-        @return: codeOut Output of the code.
+        @return: fnc Function that executes the code.
         """
 
+        # Independent shell blocks do not use the shell of the document.
+        if language == 'sh' and '--independent' in opts:
+            return self.executeIndependentCode
+
         languages = {
                 'matlab':self.executeMatlabCode,
                 'MATLAB':self.executeMatlabCode,
@@ -100,10 +341,39 @@ class ExecuteCodeFilter(Filter):
                 'sh':self.executeBashCode
                 }
 
-        fnc = languages.get(
-            language[:-1], 
-            lambda code, opts:'ERROR: Code language is not supported.'
+        return languages.get(language, self.executeUnsupportedCode)
+
+    def workspace(self,opts):
+        """ WORKSPACE
+        @brief: Get the workspace path needed for a block of code. The cwd of
+                the process is never changed, so several documents can be
+                parsed at the same time.
+        
+        @param: opts Options for executing the code.
+                
+        @return: cwd Absolute workspace path.
+        """
+
+        if not '--path' in opts:
+            return self.workspacePath
+
+        return os.path.normpath(
+            os.path.join(self.workspacePath,opts[opts.index('--path')+1])
             )
+
+    def executeCode(self,code,language,opts,codeResult=None):
+        """ EXECUTECODE
+        @brief: Execute the code.
+        
+        @param: code Code to execute.
+              : language Code language (Matlab, python, etc)
+              : opts Options for executing the code.
+              : codeResult Output of the code if it was already executed.
+                
+        @return: codeOut Output of the code.
+        """
+
+        fnc = self.languageFunction(language[:-1],opts)
         
         codeOut = ''
 
@@ -112,93 +382,453 @@ class ExecuteCodeFilter(Filter):
             codeOut += code
             codeOut += '```\n\n'
 
-        # Change workspace path to the one needed for the command.
-        if '--path' in opts:
-            os.chdir(opts[opts.index('--path')+1])
+        cwd = self.workspace(opts)
 
         # Check if we want to execute the code.
         if not self.no_exec:
-            codeResult = fnc(code,opts)
+            for name, filepath in self.watchedFiles(opts,cwd):
+                if not filepath in self.watched:
+                    self.watched.append(filepath)
+
+            # A block with wrong options is not executed nor cached.
+            error = self.optionsError(opts)
+            if error:
+                codeResult = self.errorOutput(error)
+            elif codeResult is None:
+                codeResult = self.tracedExecute(fnc,language[:-1],code,opts,cwd)
             if not '--no-echo' in opts:
+                link = ''
+                if not error:
+                    codeResult, link = self.limitOutput(codeResult,opts)
                 if not '--raw' in opts:
                     codeOut += '```\n'
                 codeOut += codeResult
                 if not '--raw' in opts:
                     codeOut += '\n```\n'
-    
-        # Change workspace path to the original.
-        os.chdir(self.workspacePath)
+                codeOut += link
 
         return codeOut
 
-    def startMatlabProcess(self):
-        """ STARTMATLABPROCESS
-        @brief: Start MATLAB as a subprocess for executing code.
+    def limitOutput(self,codeResult,opts):
+        """ LIMITOUTPUT
+        @brief: Cut the output of a block that has more lines than allowed to
+                its first and last lines. If spilling is enabled, the full
+                output is written to a file and a link to it is added.
+        
+        @param: codeResult Output of the code.
+              : opts Options for executing the code.
+                
+        @return: result Tuple (codeResult, link) with the output to show and
+                 the text of the link to the full output, empty if there is
+                 none.
+        """
+
+        self.blockCount += 1
+
+        # The value of the option is checked by optionsError.
+        maxOutput = self.maxOutput
+        if '--max-output' in opts[:-1]:
+            maxOutput = int(opts[opts.index('--max-output')+1])
+
+        if not maxOutput:
+            return (codeResult, '')
+
+        # Count the lines without splitting the output, it may be big.
+        lines = codeResult.count('\n')
+        if codeResult and not codeResult.endswith('\n'):
+            lines += 1
+
+        if lines <= maxOutput:
+            return (codeResult, '')
+
+        head = (maxOutput + 1) // 2
+        tail = maxOutput - head
+
+        end = 0
+        for i in range(head):
+            end = codeResult.find('\n', end) + 1
+
+        start = len(codeResult)
+        if codeResult.endswith('\n'):
+            start -= 1
+        for i in range(tail):
+            start = codeResult.rfind('\n', 0, start)
+        if tail:
+            start += 1
+
+        excerpt = '%s[... %d lines not shown ...]\n%s' % (
+            codeResult[:end], lines - maxOutput, codeResult[start:] if tail else ''
+            )
+        if not tail:
+            excerpt = excerpt[:-1]
+
+        link = ''
+        if self.spillPath and (self.spill or '--spill' in opts):
+            filename = 'block-%d.txt' % self.blockCount
+            os.makedirs(self.spillPath, exist_ok=True)
+            with open(os.path.join(self.spillPath, filename),'w') as f:
+                f.write(codeResult)
+            self.spilled.add(filename)
+
+            print('Full output written to %s' % filename, file=self.log)
+
+            link = '\n[Full output (%d lines)](%s/%s)\n' % (
+                lines, os.path.basename(self.spillPath), filename
+                )
+
+        return (excerpt, link)
+
+    def cleanSpill(self):
+        """ CLEANSPILL
+        @brief: Remove the files of full outputs left by previous runs of the
+                document that were not written again.
         
         @return: void
         """
 
-        self.matlabProcess = subprocess.Popen(
-                args=['matlab', '-nosplash', '-nodesktop', '-nodisplay'],
-                stdin = subprocess.PIPE,
-                stdout = subprocess.PIPE,
-                encoding = 'utf8'
+        if self.spillPath:
+            for filepath in glob.glob(os.path.join(self.spillPath, 'block-*.txt')):
+                if not os.path.basename(filepath) in self.spilled:
+                    os.remove(filepath)
+
+            # Do not leave an empty directory next to the document.
+            if os.path.isdir(self.spillPath) and not os.listdir(self.spillPath):
+                os.rmdir(self.spillPath)
+
+        self.blockCount = 0
+        self.spilled = set()
+
+    def executeParallel(self,blocks):
+        """ EXECUTEPARALLEL
+        @brief: Execute independent blocks of code at the same time.
+        
+        @param: blocks List of (index, (code, language, opts)) tuples.
+                
+        @return: results Dictionary with the output of each block by index.
+        """
+
+        print('Executing %d independent blocks in parallel' % len(blocks), file=self.log)
+
+        with concurrent.futures.ThreadPoolExecutor(self.parallelExec) as executor:
+            futures = {}
+            for index, (code, language, opts) in blocks:
+                future = executor.submit(
+                    self.tracedExecute,
+                    self.executeIndependentCode,
+                    language[:-1],
+                    code,
+                    opts,
+                    self.workspace(opts)
+                    )
+                futures[index] = future
+
+            # Keep the results by index, so they are written in the order of
+            # the document.
+            return {index: future.result() for index, future in futures.items()}
+
+    def tracedExecute(self,fnc,language,code,opts,cwd):
+        """ TRACEDEXECUTE
+        @brief: Execute the code or take its output from the cache, and
+                record the time it took in the trace.
+        
+        @param: fnc Function that executes the code.
+              : language Code language.
+              : code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: codeOut Output of the code.
+        """
+
+        start = time.time()
+
+        codeOut = self.cachedExecute(fnc,language,code,opts,cwd)
+
+        if self.trace is not None:
+            self.trace.add(
+                language, 'exec', start, time.time(),
+                code = code.strip().split('\n')[0],
+                lines = code.count('\n'),
+                opts = opts
                 )
 
-        print('Waiting for MATLAB to start')
+        return codeOut
+
+    def cachedExecute(self,fnc,language,code,opts,cwd):
+        """ CACHEDEXECUTE
+        @brief: Execute the code or take its output from the cache.
+
+        MATLAB and the shell keep their state between blocks, so the key of a
+        block also depends on the blocks executed before it in the same
+        session. When a block has to be executed, the previous blocks taken
+        from the cache are executed first to restore the state of the session.
         
-        self.matlabProcess.stdin.write('disp(\"#########\")\n')
-        self.matlabProcess.stdin.flush()
+        @param: fnc Function that executes the code.
+              : language Code language.
+              : code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: codeOut Output of the code.
+        """
 
-        while True:
-            line = self.matlabProcess.stdout.readline()
-            # print(line,end='')
-            searchObj = re.search(r'>> #########',line,re.M|re.I)
-            if searchObj: 
-                break
+        if self.cache is None:
+            return self.executeBlock(fnc,code,opts,cwd)[0]
+
+        stateful = self.isStateful(fnc)
+        session = fnc.__name__
 
-        print('MATLAB started')
+        key = self.blockKey(fnc,language,code,opts,cwd)
+
+        useCache = not '--no-cache' in opts
+
+        if useCache:
+            codeOut = self.cache.get(key)
+            if codeOut is not None:
+                print('Output taken from the cache', file=self.log)
+                if stateful:
+                    self.pending.setdefault(session,[]).append((code,opts,cwd))
+                return codeOut
+
+        # Restore the state of the session before executing the code.
+        for args in self.pending.pop(session,[]):
+            print('Restoring the state of the session', file=self.log)
+            self.executeBlock(fnc,*args)
+
+        codeOut, finished = self.executeBlock(fnc,code,opts,cwd)
+
+        # A block that did not finish is executed again the next time.
+        if useCache and finished:
+            self.cache.put(key,codeOut)
+
+        return codeOut
+
+    def executeBlock(self,fnc,code,opts,cwd):
+        """ EXECUTEBLOCK
+        @brief: Execute a block of code. If it does not finish in time, its
+                output is an error and the following blocks are executed in
+                the interrupted session, or in a new one if it did not
+                answer.
+        
+        @param: fnc Function that executes the code.
+              : code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: result Tuple (codeOut, finished) where finished is False if
+                 the code did not finish in time.
+        """
+
+        try:
+            return (fnc(code,opts,cwd), True)
+        except TimeoutError as e:
+            return (self.errorOutput(e), False)
+
+    def errorOutput(self,error):
+        """ ERROROUTPUT
+        @brief: Output of a block that could not be executed or did not
+                finish in time.
+        
+        @param: error Error message or TimeoutError raised by the session.
+                
+        @return: codeOut Error message.
+        """
+
+        print('Error: %s' % error, file=self.log)
+
+        return 'ERROR: %s.' % error
+
+    def isStateful(self,fnc):
+        """ ISSTATEFUL
+        @brief: Check if the code of a language is executed in a session that
+                keeps its state between blocks.
+        
+        @param: fnc Function that executes the code.
+                
+        @return: stateful True if the session keeps its state.
+        """
+
+        return fnc in (self.executeMatlabCode, self.executeBashCode)
+
+    def blockKey(self,fnc,language,code,opts,cwd):
+        """ BLOCKKEY
+        @brief: Compute the key of a block of code in the cache. The blocks
+                must be given in the order they are executed.
+        
+        @param: fnc Function that executes the code.
+              : language Code language.
+              : code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: key Key of the block in the cache.
+        """
+
+        stateful = self.isStateful(fnc)
+        session = fnc.__name__
+
+        # Files watched by the code, their contents are part of the key.
+        watched = [
+            [name, self.cache.fileHash(filepath)]
+            for name, filepath in self.watchedFiles(opts,cwd)
+            ]
+
+        parts = [language, code, self.execOptions(opts), cwd, watched]
+        # The output of a stand-in of MATLAB must not be taken as the output
+        # of MATLAB.
+        if fnc == self.executeMatlabCode and self.matlabCommand:
+            parts.append(self.matlabCommand)
+        if stateful:
+            parts.append(self.chains.get(session))
+
+        key = self.cache.key(*parts)
+
+        if stateful:
+            self.chains[session] = key
+
+        return key
+
+    @classmethod
+    def execOptions(cls,opts):
+        """ EXECOPTIONS
+        @brief: Options of a block that change what is executed or its output,
+                with their values. The rest only change how the output is
+                shown in the document (--raw, --no-code, --max-output...).
+        
+        @param: opts Options of the block.
+                
+        @return: opts List with the options that change the output.
+        """
+
+        result = []
+
+        for i, opt in enumerate(opts):
+            if opt in cls.EXECOPTS:
+                result += opts[i:i+1+cls.EXECOPTS[opt]]
+
+        return result
+
+    @staticmethod
+    def watchedFiles(opts,cwd):
+        """ WATCHEDFILES
+        @brief: Files watched by a block with --watch. The block is executed
+                again when they change.
+        
+        @param: opts Options of the block.
+              : cwd Workspace path of the code.
+                
+        @return: files List of (name, path) tuples.
+        """
+
+        return [
+            (opts[i+1], os.path.join(cwd,opts[i+1]))
+            for i, opt in enumerate(opts[:-1])
+            if opt == '--watch'
+            ]
+
+    def dependencies(self):
+        """ DEPENDENCIES
+        @brief: Files watched by the blocks executed in the last run, so the
+                document is parsed again when they change.
+        
+        @return: files List of paths to the files.
+        """
+
+        return self.watched
+
+    def openMatlabSession(self):
+        """ OPENMATLABSESSION
+        @brief: Get a MATLAB session for executing code, from the pool if
+                there is one.
+        
+        @return: session MatlabSession ready to execute code.
+        """
+
+        if self.matlabPool:
+            return self.matlabPool.acquire(self.workspacePath, self.log)
+
+        session = MatlabSession(self.workspacePath, self.matlabCommand, self.log)
+        session.start()
+
+        return session
                 
-    def stopMatlabProcess(self):
-        """ STOPMATLABPROCESS
-        @brief: Stop the MATLAB process.
+    def closeMatlabSession(self,session):
+        """ CLOSEMATLABSESSION
+        @brief: Stop a MATLAB session, or give it back to the pool.
+        
+        @param: session MatlabSession taken with openMatlabSession.
+
+        @return: void
+        """
+
+        if self.matlabPool:
+            self.matlabPool.release(session)
+        else:
+            session.stop()
+
+    def prewarmMatlabSession(self):
+        """ PREWARMMATLABSESSION
+        @brief: Start a MATLAB session in background.
         
         @return: void
         """
 
-        print('Closing Matlab')
+        session = None
+        error = None
 
-        stdout_value = self.matlabProcess.communicate()[0]
-        # print(stdout_value)
+        try:
+            session = self.openMatlabSession()
+        except Exception as e:
+            error = e
 
-        print('Matlab closed')
-        self.matlabProcess = -1       
+        with self.matlabLock:
+            if self.matlabThread is threading.current_thread():
+                self.matlabSession = session
+                self.matlabError = error
+                return
+
+        # The document was finished before MATLAB was ready.
+        if session:
+            self.closeMatlabSession(session)
+
+    def waitMatlabSession(self):
+        """ WAITMATLABSESSION
+        @brief: Wait for the MATLAB session started in background, or start
+                one if there is none.
         
-    def executeMatlabCode(self,code,opts):
-        """ EXECUTEMATLABCODE
-        @brief: Execute matlab code.
+        @return: void
+        """
+
+        if self.matlabThread:
+            self.matlabThread.join()
+            self.matlabThread = None
+
+            if self.matlabError:
+                error = self.matlabError
+                self.matlabError = None
+                raise error
+
+        if self.matlabSession is None:
+            self.matlabSession = self.openMatlabSession()
+
+    def matlabCode(self,code,opts,cwd):
+        """ MATLABCODE
+        @brief: Prepare MATLAB code to be sent to MATLAB in a single line.
         
         @param: code Code to execute.
               : opts Options for executing the code.
+              : cwd Workspace path of the code.
                 
-        @return: codeOut Output of the code.
+        @return: code Code in a single line.
         """
 
-        if self.matlabProcess == -1:
-            self.startMatlabProcess()
-
         buff = io.StringIO(code)
         code = ''
 
         # Matlab is executed as a process that is reused in each execution.
-        # So the code in executeCode only works one time to change the path.
         # Therefore it is necesary to change the path if needed.
         if '--path' in opts:
-            os.chdir(self.workspacePath)
-            pathRelative = opts[opts.index('--path')+1]
-            pathAbsolute = os.path.abspath(pathRelative)
-
-            code = code + "cd %s," % pathAbsolute
+            code = code + "cd %s," % cwd
 
         while True:
             line = buff.readline()
@@ -216,66 +846,256 @@ class ExecuteCodeFilter(Filter):
         code = code.split('\n')
         code = ','.join(code)
 
-        # We dont need to change the path anymore.
-        #if '--path' in opts:
-            #code = 'cd ' + opts[opts.index('--path')+1]  +';'+ code
+        return code
 
-        print('Code to execute in MATLAB:')
-        print(code)  
-        print('Send command to MATLAB')
+    def optionsError(self,opts):
+        """ OPTIONSERROR
+        @brief: Check the values of the options of a block.
+        
+        @param: opts Options for executing the code.
+                
+        @return: error Error message, None if the options are valid.
+        """
 
-        self.matlabProcess.stdin.write(code+'\n')
-        self.matlabProcess.stdin.flush()
+        if '--timeout' in opts[:-1]:
+            value = opts[opts.index('--timeout')+1]
+            try:
+                timeout = float(value)
+            except ValueError:
+                timeout = math.nan
+            if not 0 < timeout < math.inf:
+                return 'The value of --timeout is not a positive number: %s' % value
 
-        self.matlabProcess.stdin.write('disp(\"#########\")\n')
-        self.matlabProcess.stdin.flush()
+        if '--max-output' in opts[:-1]:
+            value = opts[opts.index('--max-output')+1]
+            if not value.isdecimal():
+                return 'The value of --max-output is not a number of lines: %s' % value
 
-        print('Command output')
+        return None
 
+    def blockTimeout(self,opts,default=None):
+        """ BLOCKTIMEOUT
+        @brief: Maximum time of a block, from its --timeout option.
         
-        codeOut = ''
-        while True:
-            line = self.matlabProcess.stdout.readline()
-            print(line,end='')
-            searchObj = re.search(r'>> #########',line,re.M|re.I)
-            if searchObj: 
-                break
-            # Do not include the promt in the output of the command.
-            if not re.search(r'>>',line,re.M|re.I):
-                codeOut += line
+        @param: opts Options for executing the code.
+              : default Time used if the block has no --timeout, None if
+                there is no limit.
+                
+        @return: timeout Time in seconds, None if there is no limit. The
+                 value is checked by optionsError.
+        """
+
+        if '--timeout' in opts[:-1]:
+            return float(opts[opts.index('--timeout')+1])
+
+        return default
+
+    def executeMatlabCode(self,code,opts,cwd):
+        """ EXECUTEMATLABCODE
+        @brief: Execute matlab code.
+        
+        @param: code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: codeOut Output of the code.
+        """
+
+        self.waitMatlabSession()
+
+        code = self.matlabCode(code,opts,cwd)
+
+        print('Code to execute in MATLAB:', file=self.log)
+        print(code, file=self.log)
+        print('Send command to MATLAB', file=self.log)
+        print('Command output', file=self.log)
+
+        codeOut = self.matlabSession.execute(code,self.blockTimeout(opts,self.matlabTimeout))
 
         codeOut = codeOut[:-2]
 
-        print('End of command output')
+        print('End of command output', file=self.log)
 
         return codeOut
+
+    def executeMatlabBatch(self,blocks):
+        """ EXECUTEMATLABBATCH
+        @brief: Execute all the MATLAB blocks of a document in a single round
+                trip. If all of them are in the cache, MATLAB is not used.
+        
+        @param: blocks List of (code, language, opts) tuples in document order.
+                
+        @return: codeOuts List with the output of each block.
+        """
+
+        fnc = self.executeMatlabCode
+        keys = []
+        codeOuts = []
+
+        for code, language, opts in blocks:
+            codeOut = None
+
+            if self.cache is not None:
+                key = self.blockKey(fnc,language[:-1],code,opts,self.workspace(opts))
+                keys.append(key)
+                if not '--no-cache' in opts:
+                    codeOut = self.cache.get(key)
+
+            codeOuts.append(codeOut)
+
+        if blocks and not None in codeOuts:
+            print('Output taken from the cache', file=self.log)
+            return codeOuts
+
+        # The blocks share the state of MATLAB, so all of them are executed.
+        codes = [
+            self.matlabCode(code,opts,self.workspace(opts))
+            for code, language, opts in blocks
+            ]
+
+        start = time.time()
+
+        self.waitMatlabSession()
+
+        print('Code to execute in MATLAB in a single batch:', file=self.log)
+        for code in codes:
+            print(code, file=self.log)
+        print('Command output', file=self.log)
+
+        timeouts = [
+            self.blockTimeout(opts,self.matlabTimeout)
+            for code, language, opts in blocks
+            ]
+
+        codeOuts = []
+        finished = []
+        for codeOut in self.matlabSession.executeBatch(codes,timeouts):
+            finished.append(not isinstance(codeOut, TimeoutError))
+            if finished[-1]:
+                codeOuts.append(codeOut[:-2])
+            else:
+                codeOuts.append(self.errorOutput(codeOut))
+
+        print('End of command output', file=self.log)
+
+        if self.trace is not None:
+            self.trace.add(
+                'MATLAB batch', 'exec', start, time.time(),
+                code = '%d blocks' % len(blocks),
+                lines = sum(code.count('\n') for code, language, opts in blocks)
+                )
+
+        if self.cache is not None:
+            for key, codeOut, done, (code, language, opts) in zip(keys, codeOuts, finished, blocks):
+                if done and not '--no-cache' in opts:
+                    self.cache.put(key,codeOut)
+
+        return codeOuts
          
-    def executeBashCode(self,code,opts):
+    def bashOutput(self,stdout,stderr,status,opts):
+        """ BASHOUTPUT
+        @brief: Report the error output and exit status of bash code and get
+                its output.
+        
+        @param: stdout Standard output of the code.
+              : stderr Error output of the code.
+              : status Exit status of the code.
+              : opts Options for executing the code.
+                
+        @return: codeOut Output of the code.
+        """
+
+        if stderr:
+            print('Command error output:', file=self.log)
+            print(stderr, end='', file=self.log)
+
+        if status != 0:
+            print('Command exited with status %d' % status, file=self.log)
+
+        codeOut = stdout
+
+        # Append the error output if requested.
+        if '--stderr' in opts:
+            codeOut += stderr
+
+        return codeOut
+
+    def executeBashCode(self,code,opts,cwd):
         """ EXECUTEBASHCODE
         @brief: Execute bash code.
         
         @param: code Code to execute.
               : opts Options for executing the code.
+              : cwd Workspace path of the code.
                 
         @return: codeOut Output of the code.
         """
 
-        code = code.split('\n')
-        # Remove empty strings in the code
-        aux = []
-        for line in code:
-            if (line != ""):
-                aux.append(line)
+        print('Code to execute in the shell:', file=self.log)
+        print(code, end='', file=self.log)
+
+        # The shell is started once per document and reused in each block.
+        if self.shellSession is None:
+            self.shellSession = ShellSession(self.workspacePath)
+
+        # As in MATLAB, the directory is only changed if it is requested.
+        path = cwd if '--path' in opts else None
+
+        stdout, stderr, status = self.shellSession.execute(
+            code, path, self.blockTimeout(opts)
+            )
+
+        return self.bashOutput(stdout,stderr,status,opts)
+
+    def executeIndependentCode(self,code,opts,cwd):
+        """ EXECUTEINDEPENDENTCODE
+        @brief: Execute bash code that does not depend on other blocks in its
+                own shell.
+        
+        @param: code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: codeOut Output of the code.
+        """
 
-        code = aux
+        print('Code to execute in an independent shell:', file=self.log)
+        print(code, end='', file=self.log)
 
-        code = '&&'.join(code)
+        timeout = self.blockTimeout(opts)
 
-        print('Code to execute in the shell:')
-        print(code)  
+        # In its own process group, so everything it started can be killed.
+        process = subprocess.Popen(
+                code,
+                shell = True,
+                stdin = subprocess.DEVNULL,
+                stdout = subprocess.PIPE,
+                stderr = subprocess.PIPE,
+                cwd = cwd,
+                encoding = 'utf8',
+                start_new_session = True
+                )
 
-        ans = os.popen(code).read()
+        try:
+            stdout, stderr = process.communicate(timeout = timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            raise TimeoutError(
+                'The shell did not finish the code in %g seconds' % timeout
+                ) from None
 
-        codeOut = ans
+        return self.bashOutput(stdout,stderr,process.returncode,opts)
 
-        return codeOut
+    def executeUnsupportedCode(self,code,opts,cwd):
+        """ EXECUTEUNSUPPORTEDCODE
+        @brief: Output used for the languages that are not supported.
+        
+        @param: code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+                
+        @return: codeOut Error message.
+        """
+
+        return 'ERROR: Code language is not supported.'
@@ -1,11 +1,63 @@
-from abc import ABC, abstractmethod
 import re
 
-class Filter(ABC):
+from Document import Document
+
+class Filter:
     """ FILTER
 
-    Abstract filter class.
+    Base filter class.
+
+    A filter works either on the text (override run) or on a Document
+    (set KINDS and override runDocument). The pipeline parses the text once
+    for all the filters that work on a Document. A subclass that does
+    neither is rejected when it is defined.
+
+    A filter that only works on some markers of the text sets TRIGGERS, so
+    the pipeline can skip it when the text does not have them.
+
+    Filters that can work line by line also override stream, which is used
+    by the streaming mode of the pipeline to keep the memory bounded.
     """
+
+    # Kinds of tokens of the Document used by the filter. None if the filter
+    # works on the text.
+    KINDS = None
+
+    # Regular expressions of the markers of the text the filter works on. The
+    # pipeline skips the filter if none of them is found. None if the filter
+    # always has work to do. They must not have capturing groups.
+    TRIGGERS = None
+
+    # Relative cost of running the filter, in passes over the text. It is
+    # shown in the plan of the pipeline.
+    COST = 1
+
+    # Trace where the filter records its work, set by the pipeline.
+    trace = None
+
+    # Stream where the filter writes its progress, set by the pipeline. If
+    # None, the progress is written to the stdout.
+    log = None
+
+    def __init_subclass__(cls,**kwargs):
+        """ __INIT_SUBCLASS__
+        @brief: Check that a filter overrides run or runDocument, and that a
+                filter that works on a Document sets KINDS.
+
+        @return: void
+        """
+
+        super().__init_subclass__(**kwargs)
+
+        overridesRun = cls.run is not Filter.run
+        overridesDocument = cls.runDocument is not Filter.runDocument
+
+        if not overridesRun and not overridesDocument:
+            raise TypeError('%s must override run or runDocument' % cls.__name__)
+
+        if not overridesRun and cls.KINDS is None:
+            raise TypeError('%s overrides runDocument but does not set KINDS' % cls.__name__)
+
     def __init__(self):
         """
         @brief: Constructor of Filter class.
@@ -22,10 +74,19 @@ class Filter(ABC):
         @return: data Output text processed.
         """
 
-        print("\t=== " + self.__class__.__name__.upper()+ " ===")
-        print("Start")
+        print("\t=== " + self.__class__.__name__.upper()+ " ===", file=self.log)
+        print("Start", file=self.log)
+
+    def prepare(self,data):
+        """ PREPARE
+        @brief: Called with the input of the pipeline before any filter runs.
+                Filters can use it to start slow work in background.
+        
+        @param: data Input text of the pipeline.
+                
+        @return: void
+        """
 
-    @abstractmethod
     def run(self,data):
         """ RUN
         @brief: Run the filter
@@ -35,7 +96,94 @@ class Filter(ABC):
         @return: data Output text processed.
         """
 
-        # Override this method.
+        # Override this method, or runDocument.
+        document = Document.parse(data,self.KINDS)
+        self.runDocument(document)
+
+        return document.serialize()
+
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter on a stream of text. By default the whole
+                stream is read and processed with run.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
+
+        # Override this method if the filter can work line by line.
+        data = ''.join(chunks)
+        self.prepare(data)
+
+        yield self.run(data)
+
+    @staticmethod
+    def lines(chunks):
+        """ LINES
+        @brief: Split a stream of text into lines.
+        
+        @param: chunks Iterator of pieces of text.
+                
+        @return: lines Iterator of lines, each one ending with a newline but
+                 maybe the last one.
+        """
+
+        rest = ''
+
+        for chunk in chunks:
+            if not '\n' in chunk:
+                rest += chunk
+                continue
+
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+
+            for line in lines:
+                yield line + '\n'
+
+        if rest:
+            yield rest
+
+    def runDocument(self,document):
+        """ RUNDOCUMENT
+        @brief: Run the filter on a parsed document.
+        
+        @param: document Document to process. It is modified in place.
+                
+        @return: void
+        """
+
+        # Override this method, or run.
+        raise NotImplementedError
+
+    def skip(self):
+        """ SKIP
+        @brief: Called instead of running the filter when the pipeline finds
+                none of its TRIGGERS in the text.
+        
+        @return: void
+        """
+
+    def inserted(self):
+        """ INSERTED
+        @brief: Text added by the filter in the last run that can have the
+                markers of the filters after it, like included files. The
+                pipeline searches it for the filters that it skipped.
+        
+        @return: texts List of the pieces of text added.
+        """
+
+        return []
+
+    def dependencies(self):
+        """ DEPENDENCIES
+        @brief: Files read by the filter in the last run.
+        
+        @return: files List of paths to the files.
+        """
+
+        return []
 
     def searchReg(self,data,reg):
         """ SEARCHREG
@@ -1,4 +1,8 @@
 from Filter import Filter
+from Document import Document, Token
+import os
+
+from IncludeStore import IncludeStore
 
 class IncludeFileFilter(Filter):
     """ INCLUDEFILEFILTER(FILTER)
@@ -6,32 +10,102 @@ class IncludeFileFilter(Filter):
     Include text from other file.
     """
 
-    def run(self,data):
-        """ RUN
+    KINDS = frozenset([Token.INCLUDE])
+    TRIGGERS = (r'@\[',)
+    COST = 2 # The included files are read.
+
+    def __init__(self,path=None,store=None):
+        """ __INIT__
+        @brief: Init of the IncludeFileFilter.
+        
+        @param: path Directory used to resolve relative file paths. If None,
+                the current working directory is used.
+              : store IncludeStore used to read the files. If None, the store
+                shared by the whole process is used.
+        """
+
+        super().__init__()
+
+        self.path = path
+        self.store = store or IncludeStore.default()
+        self.files = []
+        self.included = {} # Text of each file and section included.
+
+    def runDocument(self,document):
+        """ RUNDOCUMENT
         @brief: Run the filter.
         
-        @param: data Input text to process.
+        @param: document Document to process.
                 
-        @return: data Output text processed.
+        @return: void
         """
 
-        reg = r'@\[(.*?)]\((.*?)\)'
+        self.files = []
+        self.included = {}
 
-        while True:
-            searchObj = self.searchReg(data,reg);
-            # Exit the loop if nothing is found.
-            if not searchObj:
-                break
-            text = self.includeFile(searchObj)
-            data = self.replaceReg(data,reg,text)
+        # The included text is parsed as the rest of the document, but its
+        # comments are kept because they are included after removing them.
+        kinds = document.kinds - set([Token.COMMENT])
+
+        replacements = {}
+
+        for index, token in enumerate(document.tokens):
+            if token.kind == Token.INCLUDE:
+                text = self.expand(token.text,self.path)
+                replacements[index] = Document.tokenize(text,kinds)
+
+            # The code to execute can also include text.
+            elif token.kind == Token.FENCE:
+                code = self.expand(token.attrs['code'],self.path)
+                token.attrs['code'] = code
+                token.text = token.attrs['start'] + code + token.attrs['end']
+
+        document.replace(replacements)
+
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter line by line. The included files are read
+                whole, only the document is streamed.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
+
+        self.files = []
+        self.included = {}
+
+        for line in self.lines(chunks):
+            if '@[' in line:
+                line = self.expand(line,self.path)
+            yield line
+
+    def expand(self,data,path=None,stack=()):
+        """ EXPAND
+        @brief: Replace the include directives of a text. The included text
+                is expanded too, so all the directives are replaced in a
+                single pass.
+        
+        @param: data Input text to process.
+              : path Directory used to resolve relative file paths.
+              : stack Files being included, used to detect cycles.
+                
+        @return: data Output text processed.
+        """
 
-        return data
+        return Document.INCLUDEREG.sub(
+            lambda searchObj: self.includeFile(searchObj,path,stack),
+            data
+            )
                 
-    def includeFile(self,searchObj):
+    def includeFile(self,searchObj,path=None,stack=()):
         """ INCLUDEFILE
-        @brief: Search and return text to be included.
+        @brief: Search and return text to be included, with its own include
+                directives expanded relative to its directory.
         
         @param: searchObj Result of regular expression search.
+              : path Directory used to resolve relative file paths.
+              : stack Files being included, used to detect cycles.
                 
         @return: text Text to include.
         """
@@ -47,47 +121,84 @@ class IncludeFileFilter(Filter):
 
         filepath = searchObj.group(2)
 
-        f = open(filepath,'r')
+        # Resolve relative paths from the directory of the including file.
+        if path:
+            filepath = os.path.join(path,filepath)
 
-        if not "ini" in opts:
-            text =  f.read()
+        if not filepath in self.files:
+            self.files.append(filepath)
 
+        realpath = os.path.realpath(filepath)
+
+        if realpath in stack:
+            cycle = [os.path.relpath(f) for f in stack + (realpath,)]
+            raise RuntimeError('Include cycle: %s' % ' -> '.join(cycle))
+
+        if not "ini" in opts:
+            ini = end = None
         else:
             ini = opts[opts.index("ini")+1]
             end = opts[opts.index("end")+1]
 
-            ini_found = -1
-            text = ""
+        key = (realpath, ini, end)
+
+        if key not in self.included:
+            text = self.readSection(realpath,ini,end)
+            text = self.expand(
+                text,
+                os.path.dirname(realpath),
+                stack + (realpath,)
+                )
+            self.included[key] = text
+
+        return self.included[key]
+
+    def readSection(self,filepath,ini=None,end=None):
+        """ READSECTION
+        @brief: Read a file, or the lines of a file between the line that
+                contains ini and the line that contains end. The files are
+                read through the include store, so each one is loaded once.
         
-            while True:
-                # Read a line from input file.
-                aux = f.readline()
-                # In no line is read, end loop.
-                if not aux:
-                    break
-            
-                if aux.find(end) != -1 and ini_found == 1:
-                    break
-            
-                if ini_found == 1:
-                    text += aux
-            
-                if aux.find(ini) != -1:
-                    ini_found = 1
-
-        # Remove all the intros in the start of the file.
-        while True:
-            if text[1] == '\n':
-                text = text[:1:]
-            else:
-                break
+        @param: filepath Path to the file.
+              : ini Text of the line before the section. If None, the whole
+                file is returned.
+              : end Text of the line after the section.
+                
+        @return: text Text of the section.
+        """
+
+        if ini is None:
+            text = self.store.read(filepath)
+        else:
+            text = self.store.section(filepath,ini,end)
+
+        # Remove all the intros in the start of the file but one.
+        while text[:2] == '\n\n':
+            text = text[1:]
 
         # Remove all the intros in the end of the file.
-        while True:
+        while text:
             if text[-1] == '\n':
                 text = text[:-1:]
             else:
                 break
 
         return text
- 
+
+    def inserted(self):
+        """ INSERTED
+        @brief: Text of the files included in the last run.
+        
+        @return: texts List of the texts included.
+        """
+
+        return list(self.included.values())
+
+    def dependencies(self):
+        """ DEPENDENCIES
+        @brief: Files included in the last run.
+        
+        @return: files List of paths to the files.
+        """
+
+        return self.files
@@ -0,0 +1,286 @@
+import os
+import mmap
+import bisect
+import threading
+import collections
+from array import array
+
+class IncludeFile:
+    """ INCLUDEFILE
+
+    Contents of a file kept by the IncludeStore, with the offsets of the
+    lines that contain the markers searched in it.
+    """
+
+    def __init__(self,filepath,mmapSize):
+        """ __INIT__
+        @brief: Init of the IncludeFile. Big files are memory-mapped instead
+                of read.
+
+        @param: filepath Path to the file.
+              : mmapSize Minimum size in bytes of the files memory-mapped.
+        """
+
+        st = os.stat(filepath)
+
+        self.mtime = st.st_mtime_ns
+        self.size = st.st_size
+        self.map = None
+        self.markers = {}
+
+        with open(filepath,'rb') as f:
+            if self.size and self.size >= mmapSize:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = self.map
+            else:
+                self.data = f.read()
+
+    def close(self):
+        """ CLOSE
+        @brief: Release the memory map of the file.
+
+        @return: void
+        """
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.data = b''
+
+    def isValid(self,st):
+        """ ISVALID
+        @brief: Check if the file changed since it was loaded.
+
+        @param: st Result of os.stat of the file.
+
+        @return: valid True if the modification time and size did not change.
+        """
+
+        return self.mtime == st.st_mtime_ns and self.size == st.st_size
+
+    def text(self,start=0,stop=None):
+        """ TEXT
+        @brief: Decode a part of the file, with the line endings translated
+                the same way as a file opened in text mode.
+
+        @param: start Offset of the first byte.
+              : stop Offset after the last byte. If None, the end of the file.
+
+        @return: text Decoded text.
+        """
+
+        if stop is None:
+            stop = self.size
+
+        text = self.data[start:stop].decode('utf8')
+
+        return text.replace('\r\n','\n')
+
+    def markerLines(self,marker):
+        """ MARKERLINES
+        @brief: Lines that contain a marker, computed once for each marker.
+
+        @param: marker Text to search.
+
+        @return: lines Tuple (starts, stops) of sorted arrays with the offset
+                 of the start of each line and the offset after its end.
+        """
+
+        if marker not in self.markers:
+            starts = array('q')
+            stops = array('q')
+            pattern = marker.encode('utf8')
+            data = self.data
+
+            index = data.find(pattern)
+            while index != -1 and index < self.size:
+                start = data.rfind(b'\n', 0, index) + 1
+                stop = data.find(b'\n', index)
+                stop = self.size if stop == -1 else stop + 1
+                starts.append(start)
+                stops.append(stop)
+                # Continue in the next line, each line is counted once.
+                index = data.find(pattern, stop)
+
+            self.markers[marker] = (starts, stops)
+
+        return self.markers[marker]
+
+    def section(self,ini,end):
+        """ SECTION
+        @brief: Text between the first line that contains ini and the next
+                line that contains end. Neither line is included.
+
+        @param: ini Text of the line before the section.
+              : end Text of the line after the section.
+
+        @return: text Text of the section. Empty if ini is not found, and
+                 until the end of the file if end is not found.
+        """
+
+        iniStarts, iniStops = self.markerLines(ini)
+        if not iniStarts:
+            return ''
+
+        start = iniStops[0]
+
+        endStarts, endStops = self.markerLines(end)
+        i = bisect.bisect_left(endStarts, start)
+        stop = endStarts[i] if i < len(endStarts) else self.size
+
+        return self.text(start, stop)
+
+class IncludeStore:
+    """ INCLUDESTORE
+
+    Cache of the files included by the documents, shared by all the
+    documents parsed in the same process.
+
+    Each file is loaded once and kept until its modification time or size
+    changes. Files bigger than a limit are memory-mapped, so only the parts
+    that are included are read and decoded. The offsets of the lines that
+    contain each ini/end marker are indexed the first time they are needed.
+
+    The store is bounded, so the long-running commands (serve, watch,
+    preview) do not keep every file they ever included: when it has more
+    files or bytes than its limits, the least recently used files are
+    removed and their memory maps closed.
+    """
+
+    MMAPSIZE = 1024*1024 # Files from this size in bytes are memory-mapped.
+    MAXFILES = 1024 # Default maximum number of files kept.
+    MAXBYTES = 256*1024*1024 # Default maximum size in bytes of the files kept.
+
+    shared = None
+    sharedLock = threading.Lock() # Protects the creation of the shared store.
+
+    def __init__(self,mmapSize=MMAPSIZE,maxFiles=MAXFILES,maxBytes=MAXBYTES):
+        """ __INIT__
+        @brief: Init of the IncludeStore.
+
+        @param: mmapSize Minimum size in bytes of the files memory-mapped.
+              : maxFiles Maximum number of files kept.
+              : maxBytes Maximum size in bytes of the files kept. The last
+                file used is kept even if it is bigger.
+        """
+
+        self.mmapSize = mmapSize
+        self.maxFiles = maxFiles
+        self.maxBytes = maxBytes
+        self.files = collections.OrderedDict() # LRU of IncludeFile objects.
+        self.bytes = 0 # Size of the files kept.
+        self.lock = threading.RLock()
+
+    @classmethod
+    def default(cls):
+        """ DEFAULT
+        @brief: Store shared by all the filters of the process. It is
+                created once even if several threads ask for it at the same
+                time.
+
+        @return: store IncludeStore object.
+        """
+
+        with cls.sharedLock:
+            if cls.shared is None:
+                cls.shared = cls()
+
+        return cls.shared
+
+    def file(self,filepath):
+        """ FILE
+        @brief: Get a file from the store, loading it again if it changed.
+
+        @param: filepath Path to the file.
+
+        @return: file IncludeFile object.
+        """
+
+        filepath = os.path.realpath(filepath)
+        st = os.stat(filepath)
+
+        with self.lock:
+            entry = self.files.get(filepath)
+
+            if entry is not None and entry.isValid(st):
+                self.files.move_to_end(filepath)
+                return entry
+
+            if entry is not None:
+                self.remove(filepath)
+
+            entry = IncludeFile(filepath, self.mmapSize)
+            self.files[filepath] = entry
+            self.bytes += entry.size
+
+            self.evict()
+
+        return entry
+
+    def remove(self,filepath):
+        """ REMOVE
+        @brief: Remove a file from the store and close it.
+
+        @param: filepath Real path to the file.
+
+        @return: void
+        """
+
+        with self.lock:
+            entry = self.files.pop(filepath)
+            self.bytes -= entry.size
+            entry.close()
+
+    def evict(self):
+        """ EVICT
+        @brief: Remove the least recently used files while the store is over
+                its limits. The last file used is always kept.
+
+        @return: void
+        """
+
+        with self.lock:
+            while len(self.files) > 1 and (
+                    len(self.files) > self.maxFiles or self.bytes > self.maxBytes
+                    ):
+                self.remove(next(iter(self.files)))
+
+    def read(self,filepath):
+        """ READ
+        @brief: Read the whole text of a file.
+
+        @param: filepath Path to the file.
+
+        @return: text Text of the file.
+        """
+
+        with self.lock:
+            return self.file(filepath).text()
+
+    def section(self,filepath,ini,end):
+        """ SECTION
+        @brief: Read the lines of a file between the line that contains ini
+                and the line that contains end.
+
+        @param: filepath Path to the file.
+              : ini Text of the line before the section.
+              : end Text of the line after the section.
+
+        @return: text Text of the section.
+        """
+
+        with self.lock:
+            return self.file(filepath).section(ini, end)
+
+    def clear(self):
+        """ CLEAR
+        @brief: Remove all the files from the store.
+
+        @return: void
+        """
+
+        with self.lock:
+            for entry in self.files.values():
+                entry.close()
+            self.files = collections.OrderedDict()
+            self.bytes = 0
@@ -0,0 +1,218 @@
+import os
+import json
+import hashlib
+
+class Manifest:
+    """ MANIFEST
+
+    Build manifest used by make to skip the documents that are up to date.
+
+    For each document it records the hash of the source, the hashes of the
+    files it includes, the options of the pipeline and the hash of the output.
+    The hash of every file is stored together with its modification time and
+    size, so files that have not been touched are not read again.
+    """
+
+    CACHEDIR = '.mdoc-cache'
+    FILENAME = 'manifest.json'
+    VERSION = 1
+
+    def __init__(self,path):
+        """ __INIT__
+        @brief: Init of the Manifest. Load the manifest if it exists.
+
+        @param: path Root directory of the build. The manifest is stored in
+                PATH/.mdoc-cache/manifest.json.
+        """
+
+        self.root = os.path.abspath(path)
+        self.filename = os.path.join(self.root, self.CACHEDIR, self.FILENAME)
+
+        self.files = {}
+        self.documents = {}
+
+        self.load()
+
+    def load(self):
+        """ LOAD
+        @brief: Load the manifest from disk. A missing or corrupted manifest
+                is treated as empty.
+
+        @return: void
+        """
+
+        try:
+            with open(self.filename,'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get('version') != self.VERSION:
+            return
+
+        self.files = data.get('files',{})
+        self.documents = data.get('documents',{})
+
+    def save(self):
+        """ SAVE
+        @brief: Write the manifest to disk.
+
+        @return: void
+        """
+
+        # Only keep the files referenced by some document.
+        used = set()
+        for entry in self.documents.values():
+            used.add(entry['source'][0])
+            used.add(entry['output'][0])
+            used.update(dep for dep, h in entry['deps'])
+
+        self.files = {k:v for k, v in self.files.items() if k in used}
+
+        data = {
+            'version': self.VERSION,
+            'files': self.files,
+            'documents': self.documents
+            }
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        # Write to a temporary file first so the manifest is never left
+        # half written.
+        tmp = self.filename + '.tmp'
+        with open(tmp,'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def key(self,file):
+        """ KEY
+        @brief: Key used to store a file in the manifest.
+
+        @param: file Path to the file.
+
+        @return: key Path relative to the root of the build.
+        """
+
+        return os.path.relpath(os.path.abspath(file), self.root)
+
+    def fileHash(self,key):
+        """ FILEHASH
+        @brief: Hash of the contents of a file. The file is only read if its
+                modification time or size changed.
+
+        @param: key Key of the file.
+
+        @return: h Hex digest of the file, None if it does not exist.
+        """
+
+        path = os.path.join(self.root, key)
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self.files.get(key)
+        if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return entry['hash']
+
+        with open(path,'rb') as f:
+            h = hashlib.sha256(f.read()).hexdigest()
+
+        self.files[key] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'hash': h}
+
+        return h
+
+    def isUpToDate(self,file,output,options):
+        """ ISUPTODATE
+        @brief: Check if a document needs to be parsed again.
+
+        @param: file Path to the source of the document.
+              : output Path to the output of the document.
+              : options Dictionary with the options of the pipeline.
+
+        @return: upToDate True if nothing changed since the last build.
+        """
+
+        entry = self.documents.get(self.key(file))
+
+        if not entry or entry['options'] != options:
+            return False
+
+        if entry['output'][0] != self.key(output):
+            return False
+
+        for key, h in [entry['source'], entry['output']] + entry['deps']:
+            if self.fileHash(key) != h:
+                return False
+
+        return True
+
+    def update(self,file,output,options,deps):
+        """ UPDATE
+        @brief: Record a document that has just been parsed.
+
+        @param: file Path to the source of the document.
+              : output Path to the output of the document.
+              : options Dictionary with the options of the pipeline.
+              : deps List of paths to the files included by the document.
+
+        @return: void
+        """
+
+        source = self.key(file)
+        output = self.key(output)
+
+        deps = sorted(set(self.key(dep) for dep in deps))
+
+        self.documents[source] = {
+            'options': options,
+            'source': [source, self.fileHash(source)],
+            'output': [output, self.fileHash(output)],
+            'deps': [[dep, self.fileHash(dep)] for dep in deps]
+            }
+
+    def remove(self,file):
+        """ REMOVE
+        @brief: Forget a document, so it is parsed again in the next build.
+
+        @param: file Path to the source of the document.
+
+        @return: void
+        """
+
+        self.documents.pop(self.key(file), None)
+
+    def dependents(self,files):
+        """ DEPENDENTS
+        @brief: Documents that have to be parsed again when some files
+                change: the documents themselves and the documents that
+                include them.
+
+        @param: files List of paths to the changed files.
+
+        @return: documents Set of absolute paths to the sources of the
+                 documents.
+        """
+
+        keys = set(self.key(file) for file in files)
+
+        documents = set()
+        for source, entry in self.documents.items():
+            if source in keys or any(dep in keys for dep, h in entry['deps']):
+                documents.add(os.path.normpath(os.path.join(self.root, source)))
+
+        return documents
+
+    def dependencies(self):
+        """ DEPENDENCIES
+        @brief: Files included by the documents of the last builds.
+
+        @return: files Set of absolute paths to the files.
+        """
+
+        return set(
+            os.path.normpath(os.path.join(self.root, dep))
+            for entry in self.documents.values()
+            for dep, h in entry['deps']
+            )
@@ -0,0 +1,133 @@
+import threading
+
+from MatlabSession import MatlabSession
+
+class MatlabPool:
+    """ MATLABPOOL
+
+    Pool of MATLAB sessions that are started once and reused by several
+    documents.
+
+    A session is reset (clear all, close all, cd) before it is given to a
+    document. If MATLAB does not answer to the reset, the session is
+    discarded and a new one is started in its place.
+    """
+
+    def __init__(self,size,cwd,command=None):
+        """ __INIT__
+        @brief: Init of the MatlabPool.
+
+        @param: size Maximum number of MATLAB sessions.
+              : cwd Initial working directory of the sessions.
+              : command Command that runs MATLAB. If None, the default of
+                MatlabSession is used.
+        """
+
+        self.size = size
+        self.cwd = cwd
+        self.command = command
+        self.idle = []
+        self.count = 0
+        self.condition = threading.Condition()
+
+    def start(self):
+        """ START
+        @brief: Start all the sessions of the pool.
+
+        @return: void
+        """
+
+        with self.condition:
+            while self.count < self.size:
+                session = MatlabSession(self.cwd, self.command)
+                session.start()
+                self.idle.append(session)
+                self.count += 1
+
+    def stop(self):
+        """ STOP
+        @brief: Stop all the idle sessions of the pool.
+
+        @return: void
+        """
+
+        with self.condition:
+            for session in self.idle:
+                session.stop()
+                self.count -= 1
+            self.idle = []
+
+    def acquire(self,cwd,log=None):
+        """ ACQUIRE
+        @brief: Take a session from the pool. If all the sessions are in use,
+                wait until one is released.
+
+        @param: cwd Working directory for the session.
+              : log Stream where the session writes its progress while it is
+                used. If None, it is written to the stdout.
+
+        @return: session MatlabSession ready to execute code.
+        """
+
+        with self.condition:
+            while not self.idle and self.count >= self.size:
+                self.condition.wait()
+
+            if self.idle:
+                session = self.idle.pop()
+            else:
+                session = None
+                self.count += 1
+
+        if session is not None:
+            session.log = log
+            if session.reset(cwd):
+                return session
+
+            # Recycle a session that failed the reset.
+            print('MATLAB session is not responding, starting a new one', file=log)
+            session.stop()
+
+        session = MatlabSession(cwd, self.command, log)
+        try:
+            session.start()
+        except Exception:
+            self.discard(session)
+            raise
+
+        return session
+
+    def release(self,session):
+        """ RELEASE
+        @brief: Give a session back to the pool.
+
+        @param: session MatlabSession taken with acquire.
+
+        @return: void
+        """
+
+        if not session.isAlive():
+            self.discard(session)
+            return
+
+        # The document that used it is done.
+        session.log = None
+
+        with self.condition:
+            self.idle.append(session)
+            self.condition.notify()
+
+    def discard(self,session):
+        """ DISCARD
+        @brief: Stop a session and remove it from the pool.
+
+        @param: session MatlabSession taken with acquire.
+
+        @return: void
+        """
+
+        session.stop()
+
+        with self.condition:
+            self.count -= 1
+            self.condition.notify()
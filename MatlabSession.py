@@ -0,0 +1,447 @@
+import os
+import re
+import time
+import queue
+import codecs
+import signal
+import subprocess
+import threading
+
+class MatlabSession:
+    """ MATLABSESSION
+
+    MATLAB process used to execute code blocks.
+
+    The code is written to the stdin of MATLAB followed by a command that
+    displays a marker. The output is read until the marker is found.
+
+    The output is read by a thread in big chunks, so a block that prints a
+    lot does not wait for MATLAB line by line. If a block does not finish in
+    time, MATLAB is interrupted, and restarted if it does not answer, and
+    TimeoutError is raised for that block.
+    """
+
+    MARKER = '#########'
+    COMMAND = ['matlab']
+    ARGS = ['-nosplash', '-nodesktop', '-nodisplay']
+    CHUNKSIZE = 65536 # Bytes read from MATLAB at once.
+    ECHOLIMIT = 10000 # Characters of the output of a block shown in the console.
+    GRACE = 10 # Seconds given to MATLAB to answer after an interrupt.
+    STOPTIMEOUT = 30 # Seconds given to MATLAB to exit.
+
+    # Lines with the prompt are not part of the output of the code.
+    PROMPTREG = re.compile(r'^.*>>.*\n?', re.M)
+
+    def __init__(self,cwd,command=None,log=None):
+        """ __INIT__
+        @brief: Init of the MatlabSession.
+
+        @param: cwd Initial working directory of MATLAB.
+              : command List with the program that runs MATLAB and its first
+                arguments, for example a stand-in for testing. If None,
+                COMMAND is used.
+              : log Stream where the progress and the output of MATLAB are
+                written. If None, they are written to the stdout. The
+                document using the session can change it.
+        """
+
+        self.cwd = cwd
+        self.command = list(command or self.COMMAND)
+        self.log = log
+        self.process = None
+        self.chunks = None # Queue with the output read by the reader thread.
+        self.decoder = None
+        self.pending = '' # Output read after the last marker.
+
+    def start(self):
+        """ START
+        @brief: Start MATLAB and wait until it is ready.
+
+        @return: void
+        """
+
+        self.process = subprocess.Popen(
+                args=self.command + self.ARGS,
+                stdin = subprocess.PIPE,
+                stdout = subprocess.PIPE,
+                cwd = self.cwd,
+                encoding = 'utf8'
+                )
+
+        self.chunks = queue.Queue()
+        self.decoder = codecs.getincrementaldecoder('utf8')('replace')
+        self.pending = ''
+
+        reader = threading.Thread(
+                target = self.readOutput,
+                args = (self.process, self.chunks),
+                daemon = True
+                )
+        reader.start()
+
+        print('Waiting for MATLAB to start', file=self.log)
+
+        self.send('')
+        self.read(echo = False)
+
+        print('MATLAB started', file=self.log)
+
+    def stop(self):
+        """ STOP
+        @brief: Stop the MATLAB process.
+
+        @return: void
+        """
+
+        if self.process is None:
+            return
+
+        print('Closing Matlab', file=self.log)
+
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout = self.STOPTIMEOUT)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+        print('Matlab closed', file=self.log)
+        self.process = None
+
+    def kill(self):
+        """ KILL
+        @brief: Kill the MATLAB process. It is started again by the next
+                execution.
+
+        @return: void
+        """
+
+        if self.process is None:
+            return
+
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    @staticmethod
+    def readOutput(process,chunks):
+        """ READOUTPUT
+        @brief: Read the output of MATLAB until it exits. It runs in its own
+                thread.
+
+        @param: process MATLAB process.
+              : chunks Queue where the output is put, as bytes. None is put
+                when MATLAB exits.
+
+        @return: void
+        """
+
+        fd = process.stdout.fileno()
+
+        while True:
+            try:
+                data = os.read(fd, MatlabSession.CHUNKSIZE)
+            except OSError:
+                data = b''
+
+            if not data:
+                chunks.put(None)
+                return
+
+            chunks.put(data)
+
+    def isAlive(self):
+        """ ISALIVE
+        @brief: Check if the MATLAB process is running.
+
+        @return: alive True if MATLAB is running.
+        """
+
+        return self.process is not None and self.process.poll() is None
+
+    def send(self,code,marker=MARKER):
+        """ SEND
+        @brief: Send code to MATLAB followed by the marker.
+
+        @param: code Code to execute, in a single line.
+              : marker Marker displayed after the code.
+
+        @return: void
+        """
+
+        self.process.stdin.write(self.script(code,marker))
+        self.process.stdin.flush()
+
+    def script(self,code,marker=MARKER):
+        """ SCRIPT
+        @brief: Text sent to MATLAB to execute code followed by a marker.
+
+        @param: code Code to execute, in a single line.
+              : marker Marker displayed after the code.
+
+        @return: script Text to write in the stdin of MATLAB.
+        """
+
+        script = ''
+        if code:
+            script += code+'\n'
+        script += 'disp(\"%s\")\n' % marker
+
+        return script
+
+    def read(self,echo=True,marker=MARKER,timeout=None):
+        """ READ
+        @brief: Read the output of MATLAB until the marker is found. If the
+                marker does not arrive in time, MATLAB is interrupted and
+                TimeoutError is raised.
+
+        @param: echo True if we want to print the output in the console.
+              : marker Marker that ends the output.
+              : timeout Maximum time in seconds. If None, there is no limit.
+
+        @return: codeOut Output of MATLAB without the prompts.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            return self.collect(marker,deadline,echo)
+        except TimeoutError:
+            self.interrupt(marker)
+            raise TimeoutError(
+                'MATLAB did not finish the code in %g seconds' % timeout
+                ) from None
+
+    def collect(self,marker,deadline,echo):
+        """ COLLECT
+        @brief: Take the output of MATLAB from the reader thread until the
+                marker is found. The marker is searched in each chunk
+                together with the end of the previous one, so it is found
+                even if it is split between two chunks.
+
+        @param: marker Marker that ends the output.
+              : deadline Time from time.monotonic() when we stop waiting. If
+                None, we wait forever.
+              : echo True if we want to print the output in the console.
+
+        @return: codeOut Output of MATLAB without the prompts.
+        """
+
+        # The marker must not be followed by other characters, so the marker
+        # of a block is not mistaken with the one of another block.
+        markerReg = re.compile(r'>> ' + re.escape(marker) + r'[ \t\r]*\n', re.I)
+        keep = len(marker) + 8
+
+        codeOut = []
+        echoed = 0
+        text = self.pending
+        self.pending = ''
+
+        while True:
+            searchObj = markerReg.search(text)
+            if searchObj:
+                # The rest belongs to the next block of a batch.
+                self.pending = text[searchObj.end():]
+                text = text[:searchObj.start()]
+                break
+
+            done = text[:-keep]
+            text = text[-keep:]
+            codeOut.append(done)
+            if echo:
+                echoed = self.echo(done,echoed)
+
+            try:
+                text += self.nextChunk(deadline)
+            except TimeoutError:
+                # Keep what was read for the interrupt.
+                self.pending = ''.join(codeOut) + text
+                raise
+
+        codeOut.append(text)
+        if echo:
+            echoed = self.echo(text,echoed)
+            if echoed > self.ECHOLIMIT:
+                print('\n[%d more characters of output not shown]' % (echoed - self.ECHOLIMIT), file=self.log)
+
+        codeOut = ''.join(codeOut).replace('\r\n','\n')
+
+        # Do not include the promt in the output of the command.
+        if '>>' in codeOut:
+            codeOut = self.PROMPTREG.sub('', codeOut)
+
+        return codeOut
+
+    def nextChunk(self,deadline):
+        """ NEXTCHUNK
+        @brief: Wait for the next chunk of output of MATLAB.
+
+        @param: deadline Time from time.monotonic() when we stop waiting. If
+                None, we wait forever.
+
+        @return: text Text of the chunk.
+        """
+
+        timeout = None
+        if deadline is not None:
+            timeout = max(0, deadline - time.monotonic())
+
+        try:
+            data = self.chunks.get(timeout = timeout)
+        except queue.Empty:
+            raise TimeoutError()
+
+        if data is None:
+            # Let the following reads know that MATLAB exited.
+            self.chunks.put(None)
+            raise RuntimeError('MATLAB exited while executing code')
+
+        return self.decoder.decode(data)
+
+    def echo(self,text,echoed):
+        """ ECHO
+        @brief: Print output of MATLAB in the console, up to ECHOLIMIT
+                characters per block.
+
+        @param: text Output to print.
+              : echoed Characters of the block already given to echo.
+
+        @return: echoed Characters of the block given to echo, with text.
+        """
+
+        if echoed < self.ECHOLIMIT:
+            print(text[:self.ECHOLIMIT - echoed],end='', file=self.log)
+
+        return echoed + len(text)
+
+    def interrupt(self,marker):
+        """ INTERRUPT
+        @brief: Interrupt the code running in MATLAB, as Ctrl+C does, and wait
+                for the marker that follows it. If MATLAB does not answer, it
+                is killed.
+
+        @param: marker Marker sent after the code.
+
+        @return: void
+        """
+
+        print('Interrupting MATLAB', file=self.log)
+
+        try:
+            self.process.send_signal(signal.SIGINT)
+            self.collect(marker,time.monotonic() + self.GRACE,False)
+        except (OSError, RuntimeError):
+            print('MATLAB is not responding, it will be restarted', file=self.log)
+            self.kill()
+
+    def execute(self,code,timeout=None):
+        """ EXECUTE
+        @brief: Execute code in MATLAB.
+
+        @param: code Code to execute, in a single line.
+              : timeout Maximum time in seconds. If None, there is no limit.
+
+        @return: codeOut Output of the code.
+        """
+
+        if not self.isAlive():
+            self.start()
+
+        self.send(code)
+
+        return self.read(timeout = timeout)
+
+    def executeBatch(self,codes,timeouts=None):
+        """ EXECUTEBATCH
+        @brief: Execute several blocks of code in MATLAB in a single round
+                trip. Each block is followed by its own marker, which is used
+                to split the output.
+
+        @param: codes List of blocks of code, each one in a single line.
+              : timeouts List with the maximum time in seconds of each block.
+                If None, there is no limit.
+
+        @return: codeOuts List with the output of each block, or the
+                 TimeoutError of the blocks that did not finish in time.
+        """
+
+        if not self.isAlive():
+            self.start()
+
+        markers = ['%s-%d' % (self.MARKER, i) for i in range(len(codes))]
+        timeouts = timeouts or [None]*len(codes)
+
+        script = ''
+        for code, marker in zip(codes, markers):
+            script += self.script(code,marker)
+
+        # Write from another thread, so a big batch can not block MATLAB
+        # while we are not reading its output.
+        writer = threading.Thread(target=self.write, args=(script,))
+        writer.start()
+
+        codeOuts = []
+
+        try:
+            for marker, timeout in zip(markers, timeouts):
+                try:
+                    codeOuts.append(self.read(marker = marker, timeout = timeout))
+                except TimeoutError as e:
+                    codeOuts.append(e)
+                    # MATLAB did not answer the interrupt and it was killed
+                    # with the rest of the batch.
+                    if not self.isAlive():
+                        break
+        except RuntimeError:
+            # The rest of the batch is still in MATLAB, start again.
+            self.kill()
+            raise
+        finally:
+            writer.join()
+
+        # Send the rest of the batch to a new MATLAB.
+        done = len(codeOuts)
+        if done < len(codes):
+            codeOuts += self.executeBatch(codes[done:], timeouts[done:])
+
+        return codeOuts
+
+    def write(self,script):
+        """ WRITE
+        @brief: Write text to the stdin of MATLAB.
+
+        @param: script Text to write.
+
+        @return: void
+        """
+
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            # MATLAB exited, the error is reported by the reader.
+            pass
+
+    def reset(self,cwd):
+        """ RESET
+        @brief: Clear the state of MATLAB and change its working directory.
+                It is used to reuse the session in another document and to
+                check that MATLAB is still working.
+
+        @param: cwd New working directory.
+
+        @return: ok True if MATLAB answered.
+        """
+
+        if not self.isAlive():
+            return False
+
+        try:
+            self.send("clear all, close all, cd '%s'" % cwd.replace("'","''"))
+            self.read(echo = False, timeout = self.GRACE)
+        except (OSError, ValueError, RuntimeError, TimeoutError):
+            return False
+
+        self.cwd = cwd
+
+        return True
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+import click
+import os
+import re
+import sys
+import time
+import math
+
+class MatlabStandIn:
+    """ MATLABSTANDIN
+
+    Small interpreter that speaks the same protocol as MATLAB started with
+    -nodesktop: it shows the '>> ' prompt, reads one line of commands
+    separated by commas and prints their output like MATLAB does.
+
+    It understands disp, cd, clear, close, pause, exit and simple numeric
+    expressions and assignments. Ctrl+C (SIGINT) stops the running line. It
+    is used to test and profile the code that talks to MATLAB in machines
+    without MATLAB. The start up time, the time of each line of code and the
+    amount of output can be set to simulate MATLAB under load.
+    """
+
+    PROMPT = '>> '
+
+    def __init__(self,startDelay=0.0,latency=0.0,outputLines=0,
+            stdin=None,stdout=None):
+        """ __INIT__
+        @brief: Init of the MatlabStandIn.
+
+        @param: startDelay Time in seconds before the first prompt.
+              : latency Time in seconds taken by each line of code.
+              : outputLines Number of extra lines printed by each command.
+              : stdin File where the commands are read. If None, sys.stdin.
+              : stdout File where the output is written. If None, sys.stdout.
+        """
+
+        self.startDelay = startDelay
+        self.latency = latency
+        self.outputLines = outputLines
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.variables = {}
+
+    def run(self):
+        """ RUN
+        @brief: Read and execute lines until the end of the input or exit.
+
+        @return: void
+        """
+
+        time.sleep(self.startDelay)
+
+        self.stdout.write('\n                     MATLAB stand-in\n\n')
+
+        while True:
+            self.stdout.write(self.PROMPT)
+            self.stdout.flush()
+
+            try:
+                line = self.stdin.readline()
+                if not line:
+                    break
+
+                if not self.executeLine(line):
+                    break
+            except KeyboardInterrupt:
+                # Ctrl+C stops the running code, as in MATLAB.
+                self.error('Operation terminated by user.')
+
+        self.stdout.flush()
+
+    def executeLine(self,line):
+        """ EXECUTELINE
+        @brief: Execute a line of commands separated by commas.
+
+        @param: line Line read from the input.
+
+        @return: running False if the line asked to exit.
+        """
+
+        commands = [c.strip() for c in self.splitCommands(line)]
+        commands = [c for c in commands if c]
+
+        # Only the code is slow, the markers are answered right away.
+        if any(not c.startswith('disp(') for c in commands):
+            time.sleep(self.latency)
+
+        for command in commands:
+            if command in ('exit', 'quit'):
+                return False
+            self.execute(command)
+
+        return True
+
+    @staticmethod
+    def splitCommands(line):
+        """ SPLITCOMMANDS
+        @brief: Split a line by the commas that are not inside quotes or
+                brackets.
+
+        @param: line Line of code.
+
+        @return: commands List of commands.
+        """
+
+        commands = []
+        start = 0
+        depth = 0
+        quote = None
+
+        for i, c in enumerate(line):
+            if quote:
+                if c == quote:
+                    quote = None
+            elif c in '\'"':
+                quote = c
+            elif c in '([{':
+                depth += 1
+            elif c in ')]}':
+                depth -= 1
+            elif c in ',;\n' and depth == 0:
+                # Keep the semicolon, it hides the output of the command.
+                commands.append(line[start:i+1] if c == ';' else line[start:i])
+                start = i + 1
+
+        commands.append(line[start:])
+
+        return commands
+
+    def execute(self,command):
+        """ EXECUTE
+        @brief: Execute a single command and print its output.
+
+        @param: command Command without the separator, except a final ';'.
+
+        @return: void
+        """
+
+        quiet = command.endswith(';')
+        command = command.rstrip(';').strip()
+
+        searchObj = re.match(r'disp\(\s*(["\'])(.*)\1\s*\)$', command)
+        if searchObj:
+            self.stdout.write(searchObj.group(2) + '\n')
+            return
+
+        searchObj = re.match(r'cd\s*(?:\(\s*)?([\'"]?)(.*?)\1\s*\)?$', command)
+        if searchObj:
+            try:
+                os.chdir(searchObj.group(2).replace("''", "'"))
+            except OSError:
+                self.error('Cannot CD to %s (Name is nonexistent or not a directory).' % searchObj.group(2))
+            return
+
+        searchObj = re.match(r'pause\((.*)\)$', command)
+        if searchObj:
+            time.sleep(self.evaluate(searchObj.group(1)))
+            return
+
+        if re.match(r'(clear|close|clc|format)\b', command):
+            if command.startswith('clear'):
+                self.variables = {}
+            return
+
+        name = 'ans'
+        searchObj = re.match(r'([A-Za-z]\w*)\s*=(?!=)\s*(.*)$', command)
+        if searchObj:
+            name, command = searchObj.groups()
+
+        try:
+            value = self.evaluate(command)
+        except NameError as e:
+            self.error("Unrecognized function or variable '%s'." % e.name)
+            return
+        except Exception:
+            self.error('Invalid expression.')
+            return
+
+        self.variables[name] = value
+
+        if not quiet:
+            self.stdout.write('\n%s =\n\n%s\n\n' % (name, self.display(value)))
+            for i in range(self.outputLines):
+                self.stdout.write('    output line %d\n' % i)
+
+    def evaluate(self,expression):
+        """ EVALUATE
+        @brief: Evaluate a numeric expression with the variables of the
+                workspace.
+
+        @param: expression MATLAB expression.
+
+        @return: value Result of the expression.
+        """
+
+        expression = expression.replace('^', '**')
+        expression = expression.replace('~=', '!=')
+
+        scope = {'pi': math.pi, 'sqrt': math.sqrt, 'abs': abs}
+        scope.update(self.variables)
+
+        return eval(expression, {'__builtins__': {}}, scope)
+
+    @staticmethod
+    def display(value):
+        """ DISPLAY
+        @brief: Format a value as MATLAB does with format short.
+
+        @param: value Number to format.
+
+        @return: text Formatted value.
+        """
+
+        if isinstance(value, bool):
+            value = int(value)
+
+        if isinstance(value, float) and value.is_integer() and abs(value) < 1e9:
+            value = int(value)
+
+        if isinstance(value, int):
+            return '%6d' % value
+
+        return '%10.4f' % value
+
+    def error(self,message):
+        """ ERROR
+        @brief: Print an error as MATLAB does.
+
+        @param: message Text of the error.
+
+        @return: void
+        """
+
+        self.stdout.write('%s\n\n' % message)
+
+@click.command(context_settings={'ignore_unknown_options': True})
+@click.option('--start-delay', type=float, default=0.0, show_default=True, help="Seconds before the first prompt.")
+@click.option('--latency', type=float, default=0.0, show_default=True, help="Seconds taken by each line of code.")
+@click.option('--output-lines', type=click.IntRange(min=0), default=0, show_default=True, help="Extra lines printed by each command.")
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def main(start_delay, latency, output_lines, args):
+    """ Stand-in for MATLAB that reads commands from the stdin. The ARGS given
+    to MATLAB (-nosplash, -nodesktop...) are accepted and ignored, so it can
+    be used as the MATLAB command of mdoc:
+
+    \b
+    \t mdoc parse --matlab-command "python3 MatlabStandIn.py --latency 0.1" doc.mdoc
+    """
+
+    MatlabStandIn(start_delay, latency, output_lines).run()
+
+if __name__ == '__main__':
+    main()
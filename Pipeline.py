@@ -1,15 +1,26 @@
+import re
+
+from Document import Document
+
 class Pipeline:
     """ PIPELINE
 
     This class manages and set up all the filters we want to use in the
     pipeline.
     """
-    def __init__(self):
+    def __init__(self,trace=None,log=None):
         """
         @brief: Constructor of Pipeline.
+
+        @param: trace Trace where the time of each filter is recorded. If
+                None, nothing is recorded.
+              : log Stream where the filters write their progress. If None,
+                it is written to the stdout.
         """
 
         self.filters = [];
+        self.trace = trace
+        self.log = log
 
     def addFilter(self,f):
         """ ADDFILTER
@@ -20,23 +31,170 @@ class Pipeline:
         @return: void
         """
         
+        f.trace = self.trace
+        f.log = self.log
         self.filters.append(f)
 
                 
     def run(self,data):
         """ RUN
-        @brief: Run all the filters in the pipeline.
+        @brief: Run the filters in the pipeline. The filters that have
+                nothing to do in the text are skipped.
         
         @param: data Text to process in the pipeline.
                 
         @return: data Text processed.
         """
 
-        # Run each filter.
+        planned = self.plan(data,self.filters)
+        self.report(planned)
+
+        # Let the filters start their slow work before the first one runs.
         for f in self.filters:
+            if f in planned:
+                f.prepare(data)
+
+        document = None
+
+        # Run each filter.
+        for i, f in enumerate(self.filters):
             # Use the output of a filter as the input for the following one.
             f.debugInfo()
-            data = f.run(data)
-            print("Done")
+
+            if not f in planned:
+                print("Skipped", file=self.log)
+                f.skip()
+                continue
+
+            if self.trace is not None:
+                stats = self.trace.begin()
+                size = document.size() if document is not None else len(data)
+
+            if f.KINDS is not None:
+                # A filter planned after the document was parsed can need
+                # tokens that were not parsed.
+                if document is not None and not f.KINDS <= document.kinds:
+                    data = document.serialize()
+                    document = None
+
+                # Tokens needed by the filters that work on a document, so
+                # the text is parsed only once.
+                if document is None:
+                    kinds = set()
+                    for g in self.filters[i:]:
+                        if g in planned and g.KINDS is not None:
+                            kinds |= g.KINDS
+                    document = Document.parse(data,kinds)
+
+                f.runDocument(document)
+            else:
+                if document is not None:
+                    data = document.serialize()
+                    document = None
+                data = f.run(data)
+
+            if self.trace is not None:
+                self.trace.end(
+                    stats,
+                    f.__class__.__name__,
+                    size,
+                    document.size() if document is not None else len(data)
+                    )
+
+            # The text added by the filter can have work for the filters
+            # skipped after it.
+            skipped = [g for g in self.filters[i+1:] if not g in planned]
+            if skipped:
+                added = set()
+                for text in f.inserted():
+                    added |= self.plan(text,skipped)
+                if added:
+                    planned |= added
+                    print("Plan: %s added by the text of %s" % (
+                        ', '.join(g.__class__.__name__ for g in skipped if g in added),
+                        f.__class__.__name__
+                        ), file=self.log)
+
+            print("Done", file=self.log)
+
+        if document is not None:
+            data = document.serialize()
 
         return data
+
+    def plan(self,data,filters):
+        """ PLAN
+        @brief: Find the filters that have work to do in a text. Each trigger
+                is a compiled search that stops at its first match, which is
+                much faster than a single search of all the triggers: the
+                regular expressions only skip quickly to the candidates of a
+                pattern that starts with a literal.
+        
+        @param: data Text to search.
+              : filters List of filters to check.
+                
+        @return: planned Set of the filters with work to do. The filters
+                 without TRIGGERS always have work to do.
+        """
+
+        planned = set()
+
+        for f in filters:
+            if f.TRIGGERS is None or any(
+                    re.search(trigger,data,re.M|re.I) for trigger in f.TRIGGERS
+                    ):
+                planned.add(f)
+
+        return planned
+
+    def report(self,planned):
+        """ REPORT
+        @brief: Print the plan of the pipeline in the debug output.
+        
+        @param: planned Set of the filters that will run.
+                
+        @return: void
+        """
+
+        names = [f.__class__.__name__ for f in self.filters if f in planned]
+        skipped = [f.__class__.__name__ for f in self.filters if not f in planned]
+        cost = sum(f.COST for f in self.filters if f in planned)
+
+        print("Plan: %s (cost %d of %d)%s" % (
+            ', '.join(names) or 'nothing to do',
+            cost,
+            sum(f.COST for f in self.filters),
+            '; skipped: ' + ', '.join(skipped) if skipped else ''
+            ), file=self.log)
+
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run all the filters in the pipeline on a stream of text. Each
+                filter reads the output of the previous one as it is produced,
+                so the text is never kept whole in memory unless a filter
+                needs it.
+        
+        @param: chunks Iterator of pieces of the text to process, for example
+                an open file.
+                
+        @return: chunks Iterator of pieces of the text processed.
+        """
+
+        for f in self.filters:
+            f.debugInfo()
+            chunks = f.stream(chunks)
+
+        return chunks
+
+    def dependencies(self):
+        """ DEPENDENCIES
+        @brief: Files read by the filters in the last run of the pipeline.
+        
+        @return: files List of paths to the files.
+        """
+
+        files = []
+        for f in self.filters:
+            files += f.dependencies()
+
+        return files
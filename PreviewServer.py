@@ -0,0 +1,366 @@
+import os
+import html
+import time
+import hashlib
+import threading
+import traceback
+import collections
+import urllib.parse
+import http.server
+
+from Render import render
+from Manifest import Manifest
+
+class PreviewServer(http.server.ThreadingHTTPServer):
+    """ PREVIEWSERVER
+
+    HTTP server that shows the output of the .mdoc files of a directory.
+
+    The rendered documents are kept in a LRU cache together with the hashes
+    of their source and of the files they include. A document is only
+    rendered again when one of them changed, and its ETag is the hash of all
+    of them, so the clients that already have it get a 304. The documents
+    are rendered one at a time, so several clients asking for the same
+    document render it once.
+
+    The hash of the source is taken before it is read, so a source changed
+    during a render is rendered again on the next request. The included
+    files are only known after the render, so a document whose included
+    files were changed while it was rendered is not cached and has no ETag.
+    """
+
+    daemon_threads = True
+    MARGIN = 1.0 # Seconds of error of the modification time of the files.
+
+    def __init__(self,address,root,options,matlabPool=None,cacheSize=64):
+        """ __INIT__
+        @brief: Init of the PreviewServer.
+
+        @param: address Tuple (host, port) where the server listens.
+              : root Directory with the .mdoc files.
+              : options Dictionary with the options of createPipeline.
+              : matlabPool MatlabPool used by all the documents. If None,
+                MATLAB is started for each document that needs it.
+              : cacheSize Maximum number of rendered documents kept.
+        """
+
+        self.root = os.path.abspath(root)
+        self.options = options
+        self.matlabPool = matlabPool
+        self.cacheSize = cacheSize
+        self.documents = collections.OrderedDict() # LRU of rendered documents.
+        self.manifest = Manifest(root) # Hashes of the files, it is not saved.
+        self.lock = threading.Lock() # Protects the LRU.
+        self.renderLock = threading.Lock()
+
+        super().__init__(address, PreviewHandler)
+
+    def fileHashes(self,files):
+        """ FILEHASHES
+        @brief: Hashes of the contents of files, from the Manifest. A file is
+                only read if its modification time or size changed.
+
+        @param: files List of paths to the files.
+
+        @return: hashes Dictionary with the hex digest of each file, None if
+                 it does not exist.
+        """
+
+        return {
+            filepath: self.manifest.fileHash(self.manifest.key(filepath))
+            for filepath in files
+            }
+
+    def inputsKey(self,hashes):
+        """ INPUTSKEY
+        @brief: Hash of everything a rendered document depends on.
+
+        @param: hashes Dictionary with the hashes of the .mdoc file and of
+                the files it includes, from fileHashes.
+
+        @return: key Hex digest, used as the ETag of the document.
+        """
+
+        h = hashlib.sha256(repr(sorted(
+            (k, v) for k, v in self.options.items() if k != 'cache'
+            )).encode('utf8'))
+
+        for filepath in sorted(hashes):
+            h.update(('%s\0%s\0' % (filepath, hashes[filepath])).encode('utf8'))
+
+        return h.hexdigest()[:32]
+
+    def changedSince(self,files,start):
+        """ CHANGEDSINCE
+        @brief: Check if some file was modified after a time. The files
+                modified up to MARGIN seconds before are also taken as
+                modified.
+
+        @param: files List of paths to the files.
+              : start Time from time.time().
+
+        @return: changed True if some file was modified or removed.
+        """
+
+        for filepath in files:
+            try:
+                if os.stat(filepath).st_mtime >= start - self.MARGIN:
+                    return True
+            except OSError:
+                return True
+
+        return False
+
+    def cached(self,file):
+        """ CACHED
+        @brief: Get a rendered document from the cache if it is up to date.
+
+        @param: file Path to the .mdoc file.
+
+        @return: entry Tuple (key, ok, body, deps), None if the document has
+                 to be rendered.
+        """
+
+        with self.lock:
+            entry = self.documents.get(file)
+            if entry is None:
+                return None
+            self.documents.move_to_end(file)
+
+        if self.inputsKey(self.fileHashes([file] + entry[3])) != entry[0]:
+            return None
+
+        return entry
+
+    def document(self,file):
+        """ DOCUMENT
+        @brief: Get a rendered document, from the cache or rendering it.
+
+        @param: file Path to the .mdoc file.
+
+        @return: entry Tuple (key, ok, body, deps) where body is the output
+                 of the document, or its log if it failed. The key is None
+                 if the document can not be cached.
+        """
+
+        entry = self.cached(file)
+        if entry:
+            return entry
+
+        with self.renderLock:
+            # Another request may have rendered it while we waited.
+            entry = self.cached(file)
+            if entry:
+                return entry
+
+            start = time.time()
+            entry = self.render(file)
+
+        # A document that failed does not know what it includes, so it is
+        # rendered again on the next request.
+        if not entry[1]:
+            return entry
+
+        # The output may not match the hashes of the files it includes.
+        if self.changedSince(entry[3], start):
+            return (None,) + entry[1:]
+
+        with self.lock:
+            self.documents[file] = entry
+            self.documents.move_to_end(file)
+            while len(self.documents) > self.cacheSize:
+                self.documents.popitem(last = False)
+
+        return entry
+
+    def render(self,file):
+        """ RENDER
+        @brief: Render a document with the pipeline of parse.
+
+        @param: file Path to the .mdoc file.
+
+        @return: entry Tuple (key, ok, body, deps).
+        """
+
+        ok = True
+        deps = []
+        log = []
+
+        # Taken before the source is read, so a change while it is rendered
+        # does not match the key.
+        hashes = self.fileHashes([file])
+
+        try:
+            with open(file,'r') as fd:
+                source = fd.read()
+
+            result = render(source, os.path.dirname(file), dict(
+                self.options, matlabPool = self.matlabPool
+                ), log.append)
+            data = result.text
+            deps = result.dependencies
+        except Exception:
+            data = ''.join(line + '\n' for line in log) + traceback.format_exc()
+            ok = False
+
+        print('Rendered %s%s' % (
+            os.path.relpath(file, self.root), '' if ok else ' (failed)'
+            ), flush = True)
+
+        hashes.update(self.fileHashes(deps))
+
+        return (self.inputsKey(hashes), ok, data, deps)
+
+    def resolve(self,urlpath):
+        """ RESOLVE
+        @brief: Find the .mdoc file of a URL. /dir/doc.md and /dir/doc.mdoc
+                are the output of PATH/dir/doc.mdoc.
+
+        @param: urlpath Path of the URL.
+
+        @return: file Path to the .mdoc file, or to a directory, None if it
+                 does not exist or it is out of PATH.
+        """
+
+        relative = urllib.parse.unquote(urlpath).lstrip('/')
+        filepath = os.path.realpath(os.path.join(self.root, relative))
+
+        if filepath != self.root and not filepath.startswith(self.root + os.sep):
+            return None
+
+        if os.path.isdir(filepath):
+            return filepath
+
+        if filepath.endswith('.md'):
+            filepath += 'oc'
+
+        if filepath.endswith('.mdoc') and os.path.isfile(filepath):
+            return filepath
+
+        return None
+
+class PreviewHandler(http.server.BaseHTTPRequestHandler):
+    """ PREVIEWHANDLER
+
+    Request to the PreviewServer.
+    """
+
+    head = False # True if only the headers are sent.
+
+    def do_GET(self):
+        """ DO_GET
+        @brief: Send a rendered document or the list of documents of a
+                directory.
+
+        @return: void
+        """
+
+        urlpath = urllib.parse.urlsplit(self.path).path
+        file = self.server.resolve(urlpath)
+
+        if file is None:
+            self.reply(404, 'text/plain', 'Not found: %s\n' % urlpath)
+            return
+
+        if os.path.isdir(file):
+            self.reply(200, 'text/html', self.index(file, urlpath))
+            return
+
+        key, ok, body, deps = self.server.document(file)
+
+        if not ok:
+            self.reply(500, 'text/plain', body)
+            return
+
+        if key is None:
+            self.reply(200, 'text/markdown', body)
+            return
+
+        etag = '"%s"' % key
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.reply(200, 'text/markdown', body, etag)
+
+    def do_HEAD(self):
+        """ DO_HEAD
+        @brief: Send the headers of do_GET, without the body.
+
+        @return: void
+        """
+
+        self.head = True
+        self.do_GET()
+
+    def index(self,directory,urlpath):
+        """ INDEX
+        @brief: Page with links to the documents and subdirectories of a
+                directory.
+
+        @param: directory Path to the directory.
+              : urlpath Path of the URL of the directory.
+
+        @return: page HTML of the page.
+        """
+
+        base = urlpath.rstrip('/') + '/'
+        links = []
+
+        for name in sorted(os.listdir(directory)):
+            filepath = os.path.join(directory, name)
+            if os.path.isdir(filepath) and not name.startswith('.'):
+                links.append(name + '/')
+            elif name.endswith('.mdoc'):
+                links.append(name[:-len('.mdoc')] + '.md')
+
+        items = ''.join(
+            '<li><a href="%s">%s</a></li>\n' % (
+                html.escape(urllib.parse.quote(base + link)), html.escape(link)
+                )
+            for link in links
+            )
+
+        return '<!DOCTYPE html>\n<title>%s</title>\n<ul>\n%s</ul>\n' % (
+            html.escape(base), items
+            )
+
+    def reply(self,status,contentType,body,etag=None):
+        """ REPLY
+        @brief: Send a response.
+
+        @param: status HTTP status code.
+              : contentType Type of the body, without charset.
+              : body Text of the body.
+              : etag ETag of the body, None if it has none.
+
+        @return: void
+        """
+
+        data = body.encode('utf8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', contentType + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if not self.head:
+            self.wfile.write(data)
+
+    def log_request(self,code='-',size='-'):
+        """ LOG_REQUEST
+        @brief: Log the requests in the stderr, as http.server does, but
+                only the failed ones. The errors are always logged.
+
+        @param: code Status code of the response.
+              : size Size of the response.
+
+        @return: void
+        """
+
+        if not code in (200, 304):
+            super().log_request(code, size)
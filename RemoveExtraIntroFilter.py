@@ -1,4 +1,5 @@
 from Filter import Filter
+import re
 
 class RemoveExtraIntroFilter(Filter):
     """ REMOVEEXTRAINTROFILTER(FILTER)
@@ -18,3 +19,30 @@ class RemoveExtraIntroFilter(Filter):
         data = re.sub(r'\n\n','\n',data,0)
 
         return data
+
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter chunk by chunk. An intro at the end of a chunk
+                is kept until the next chunk, as it can be doubled there.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
+
+        rest = ''
+
+        for chunk in chunks:
+            data = rest + chunk
+
+            # The intros are removed in pairs from left to right, so an odd
+            # number of intros at the end leaves the last one alone.
+            intros = len(data) - len(data.rstrip('\n'))
+            if intros % 2:
+                data, rest = data[:-1], '\n'
+            else:
+                rest = ''
+
+            yield self.run(data)
+
+        yield rest
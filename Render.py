@@ -0,0 +1,132 @@
+import io
+import os
+import threading
+
+from Builder import createPipeline
+
+class RenderLog(io.TextIOBase):
+    """ RENDERLOG
+
+    Stream where a render writes its progress. The text is kept for the
+    RenderResult and each complete line is given to a callback, for example
+    the info method of a logging.Logger.
+
+    The blocks of code executed in parallel and the start of MATLAB write
+    from other threads, so the writes are serialized.
+    """
+
+    def __init__(self,callback=None):
+        """ __INIT__
+        @brief: Init of the RenderLog.
+
+        @param: callback Function called with each line of progress, without
+                the newline. If None, the progress is only kept.
+        """
+
+        self.callback = callback
+        self.text = io.StringIO()
+        self.line = '' # Start of a line not finished yet.
+        self.lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self,text):
+        """ WRITE
+        @brief: Write progress.
+
+        @param: text Text to write.
+
+        @return: n Number of characters written.
+        """
+
+        with self.lock:
+            self.text.write(text)
+
+            if self.callback is not None:
+                lines = (self.line + text).split('\n')
+                self.line = lines.pop()
+                for line in lines:
+                    self.callback(line)
+
+        return len(text)
+
+    def finish(self):
+        """ FINISH
+        @brief: Give the last line to the callback even if it was not
+                finished.
+
+        @return: void
+        """
+
+        with self.lock:
+            if self.callback is not None and self.line:
+                self.callback(self.line)
+            self.line = ''
+
+    def getvalue(self):
+        """ GETVALUE
+        @brief: All the progress written.
+
+        @return: text Text of the progress.
+        """
+
+        with self.lock:
+            return self.text.getvalue()
+
+class RenderResult:
+    """ RENDERRESULT
+
+    Output of render.
+    """
+
+    def __init__(self,text,dependencies,log):
+        """ __INIT__
+        @brief: Init of the RenderResult.
+
+        @param: text Rendered document.
+              : dependencies List of paths to the files read by the filters.
+              : log Progress written while rendering.
+        """
+
+        self.text = text
+        self.dependencies = dependencies
+        self.log = log
+
+def render(text,baseDir,options=None,log=None):
+    """ RENDER
+    @brief: Render a document in this process with the pipeline of parse.
+            It does not change the working directory and does not write to
+            the stdout, so it can be called from several threads at the same
+            time.
+
+    @param: text Source of the document.
+          : baseDir Directory used to resolve the includes and where the code
+            is executed.
+          : options Dictionary with the options of createPipeline, for
+            example {'no_exec': True} or {'cache': ExecCache(...),
+            'matlabPool': MatlabPool(...)}. The cache and the pool can be
+            shared by all the threads. If None, the defaults are used.
+          : log Function called with each line of progress. If None, the
+            progress is only kept in the result.
+
+    @return: result RenderResult with the document and its dependencies.
+    """
+
+    options = dict(options or {})
+    options.setdefault('no_exec', False)
+    options.setdefault('intro', False)
+
+    stream = RenderLog(log)
+
+    try:
+        pipeline = createPipeline(
+            path = os.path.abspath(baseDir),
+            log = stream,
+            **options
+            )
+        data = pipeline.run(text)
+    finally:
+        stream.finish()
+
+    return RenderResult(data, pipeline.dependencies(), stream.getvalue())
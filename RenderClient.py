@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import stat
+import socket
+import tempfile
+
+class RenderClient:
+    """ RENDERCLIENT
+
+    Client of the render server started with mdoc serve.
+
+    It only needs the standard library, so the commands sent to the server
+    do not pay the import of click and the filters. If there is no server,
+    the command runs as usual in this process.
+    """
+
+    COMMANDS = ('parse', 'make') # Commands that can be sent to the server.
+
+    @staticmethod
+    def socketDir():
+        """ SOCKETDIR
+        @brief: Private directory of the user for the socket, in
+                XDG_RUNTIME_DIR if it is set or in the temporary directory.
+
+        @return: path Absolute path to the directory.
+        """
+
+        runtime = os.environ.get('XDG_RUNTIME_DIR')
+        if runtime:
+            return os.path.abspath(os.path.join(runtime, 'mdoc'))
+
+        return os.path.abspath(os.path.join(
+            tempfile.gettempdir(), 'mdoc-%d' % os.getuid()
+            ))
+
+    @classmethod
+    def socketPath(cls):
+        """ SOCKETPATH
+        @brief: Path of the Unix socket of the server, from the MDOC_SOCKET
+                variable or in the directory of socketDir.
+
+        @return: path Path to the socket.
+        """
+
+        path = os.environ.get('MDOC_SOCKET')
+        if path:
+            return path
+
+        return os.path.join(cls.socketDir(), 'server.sock')
+
+    @classmethod
+    def isPrivate(cls,path):
+        """ ISPRIVATE
+        @brief: Check the directory of a socket. The temporary directory is
+                shared by all the users, so the directory of socketDir is
+                only used if it is a directory of this user that nobody else
+                can open. Otherwise another user could serve the commands.
+
+        @param: path Path to the socket.
+
+        @return: private True if the socket can be used.
+        """
+
+        directory = os.path.dirname(os.path.abspath(path))
+
+        # The user chose the socket with MDOC_SOCKET.
+        if directory != cls.socketDir():
+            return True
+
+        try:
+            st = os.lstat(directory)
+        except OSError:
+            return False
+
+        return (
+            stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid()
+            and st.st_mode & 0o077 == 0
+            )
+
+    def __init__(self,path=None):
+        """ __INIT__
+        @brief: Init of the RenderClient.
+
+        @param: path Path to the socket. If None, socketPath is used.
+        """
+
+        self.path = path or self.socketPath()
+
+    def connect(self):
+        """ CONNECT
+        @brief: Connect to the server.
+
+        @return: sock Connected socket, None if there is no server or its
+                 directory is not private.
+        """
+
+        if not self.isPrivate(self.path):
+            return None
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            return None
+
+        return sock
+
+    def forward(self,args):
+        """ FORWARD
+        @brief: Run a command in the server. Its output is written to the
+                stdout and stderr of this process as it arrives.
+
+        @param: args Arguments of the command line, without the program.
+
+        @return: status Exit status of the command, None if the command
+                 can not be sent to the server.
+        """
+
+        if not args or not args[0] in self.COMMANDS:
+            return None
+
+        # The server can not read the stdin of this process.
+        if '-' in args[1:]:
+            return None
+
+        sock = self.connect()
+        if sock is None:
+            return None
+
+        request = {
+            'args': list(args),
+            'cwd': os.getcwd(),
+            'env': {k: v for k, v in os.environ.items() if k.startswith('MDOC_')}
+            }
+
+        streams = {'out': sys.stdout, 'err': sys.stderr}
+
+        with sock, sock.makefile('rw', encoding='utf8') as f:
+            f.write(json.dumps(request) + '\n')
+            f.flush()
+
+            for line in f:
+                message = json.loads(line)
+
+                if 'exit' in message:
+                    return message['exit']
+
+                for name, stream in streams.items():
+                    if name in message:
+                        stream.write(message[name])
+                        stream.flush()
+
+        # The server stopped before the end of the command.
+        print('Error: the render server closed the connection', file=sys.stderr)
+        return 1
+
+def main(cli=None):
+    """ MAIN
+    @brief: Entry point of mdoc. Send the command to the render server if it
+            is running, or run it here.
+
+    @param: cli Command line interface of mdoc. If None, it is imported from
+                mdoc when the command runs here.
+
+    @return: void
+    """
+
+    if not os.environ.get('MDOC_NO_SERVER'):
+        status = RenderClient().forward(sys.argv[1:])
+        if status is not None:
+            sys.exit(status)
+
+    if cli is None:
+        from mdoc import cli
+    cli(obj={})
+
+if __name__ == '__main__':
+    main()
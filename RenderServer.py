@@ -0,0 +1,202 @@
+import io
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+import contextlib
+import socketserver
+
+from RenderClient import RenderClient
+
+class SocketStream(io.TextIOBase):
+    """ SOCKETSTREAM
+
+    Text stream that sends what is written to it to a client of the render
+    server, as messages of one JSON object per line.
+    """
+
+    def __init__(self,wfile,name,lock):
+        """ __INIT__
+        @brief: Init of the SocketStream.
+
+        @param: wfile Binary file of the connection.
+              : name Name of the stream in the messages ('out' or 'err').
+              : lock Lock shared by the streams of the connection.
+        """
+
+        self.wfile = wfile
+        self.name = name
+        self.lock = lock
+
+    def writable(self):
+        return True
+
+    def write(self,text):
+        """ WRITE
+        @brief: Send text to the client.
+
+        @param: text Text to send. click may send bytes.
+
+        @return: n Number of characters written.
+        """
+
+        if isinstance(text, bytes):
+            text = text.decode('utf8', 'replace')
+
+        if text:
+            message = json.dumps({self.name: text}) + '\n'
+            with self.lock:
+                self.wfile.write(message.encode('utf8'))
+
+        return len(text)
+
+class RenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ RENDERSERVER
+
+    Resident server that runs the commands of mdoc sent by a RenderClient
+    through a Unix socket. The modules, the compiled patterns, the included
+    files, the cache of executed code and the MATLAB sessions stay loaded
+    between commands.
+
+    The commands use the working directory, the environment and the stdout
+    of the process, so they are run one at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self,command,path=None):
+        """ __INIT__
+        @brief: Init of the RenderServer. It fails if another server is
+                listening on the socket.
+
+        @param: command Click command that runs the commands of mdoc.
+              : path Path to the socket. If None, RenderClient.socketPath is
+                used.
+        """
+
+        path = path or RenderClient.socketPath()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        if not RenderClient.isPrivate(path):
+            raise RuntimeError(
+                '%s must be a directory of this user that only this user can '
+                'open (mode 700)' % directory
+                )
+
+        if RenderClient(path).connect() is not None:
+            raise RuntimeError('A render server is already running at %s' % path)
+
+        # Remove the socket left by a server that did not stop cleanly.
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.command = command
+        self.path = path
+        self.lock = threading.Lock()
+        self.stdout = sys.stdout # Log of the server, the stdout is redirected.
+
+        super().__init__(path, RenderHandler)
+
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        """ SERVER_CLOSE
+        @brief: Stop listening and remove the socket.
+
+        @return: void
+        """
+
+        super().server_close()
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def run(self,request,out,err):
+        """ RUN
+        @brief: Run a command as if it was run by the client.
+
+        @param: request Dictionary with the arguments, the working directory
+                and the MDOC_ variables of the client.
+              : out Stream where the stdout of the command is written.
+              : err Stream where the stderr of the command is written.
+
+        @return: status Exit status of the command.
+        """
+
+        with self.lock:
+            cwd = os.getcwd()
+            env = self.environment(request.get('env', {}))
+            start = time.time()
+            status = 1
+
+            try:
+                os.chdir(request['cwd'])
+
+                with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                    try:
+                        self.command.main(request['args'], prog_name='mdoc')
+                    except SystemExit as e:
+                        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+                    except Exception:
+                        traceback.print_exc()
+            finally:
+                os.chdir(cwd)
+                self.environment(env)
+
+            print('%s (%d, %.0f ms)' % (
+                ' '.join(request['args']), status, (time.time() - start)*1e3
+                ), file=self.stdout, flush=True)
+
+        return status
+
+    @staticmethod
+    def environment(env):
+        """ ENVIRONMENT
+        @brief: Replace the MDOC_ variables of the process.
+
+        @param: env Dictionary with the new MDOC_ variables.
+
+        @return: env Dictionary with the old MDOC_ variables.
+        """
+
+        old = {k: v for k, v in os.environ.items() if k.startswith('MDOC_')}
+
+        for k in old:
+            del os.environ[k]
+        os.environ.update(env)
+
+        return old
+
+class RenderHandler(socketserver.StreamRequestHandler):
+    """ RENDERHANDLER
+
+    Connection of a client to the RenderServer. The client sends one request
+    and receives the output of the command and its exit status.
+    """
+
+    def handle(self):
+        """ HANDLE
+        @brief: Read the request, run it and send the result.
+
+        @return: void
+        """
+
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        lock = threading.Lock()
+        out = SocketStream(self.wfile, 'out', lock)
+        err = SocketStream(self.wfile, 'err', lock)
+
+        try:
+            status = self.server.run(request, out, err)
+            self.wfile.write((json.dumps({'exit': status}) + '\n').encode('utf8'))
+        except OSError:
+            # The client went away.
+            pass
@@ -0,0 +1,208 @@
+import os
+import time
+import codecs
+import select
+import signal
+import subprocess
+import tempfile
+import uuid
+
+class ShellSession:
+    """ SHELLSESSION
+
+    Long-lived shell used to execute code blocks.
+
+    The shell is started once and every block is written to its stdin,
+    followed by a command that prints a marker with the exit status of the
+    block. The output is read until the marker is found, the same way MATLAB
+    code is executed. The state of the shell (working directory, variables)
+    is kept between blocks.
+
+    If a block does not finish in time, the shell and everything it started
+    are killed, TimeoutError is raised and a new shell is started for the
+    next block.
+    """
+
+    CHUNKSIZE = 65536 # Bytes read from the shell at once.
+
+    def __init__(self,cwd,shell='/bin/sh'):
+        """ __INIT__
+        @brief: Init of the ShellSession. The shell is started on the first
+                execution.
+
+        @param: cwd Initial working directory of the shell.
+              : shell Path to the shell.
+        """
+
+        self.cwd = cwd
+        self.shell = shell
+        self.process = None
+        self.marker = '#MDOC-' + uuid.uuid4().hex + '#'
+        self.errFile = None
+
+    def start(self):
+        """ START
+        @brief: Start the shell process.
+
+        @return: void
+        """
+
+        # The stderr of each block is redirected to this file, so it can be
+        # read without blocking the stdout of the shell.
+        fd, self.errFile = tempfile.mkstemp(prefix='mdoc-', suffix='.err')
+        os.close(fd)
+
+        # In its own process group, so the commands of a block that does not
+        # finish can be killed with the shell.
+        self.process = subprocess.Popen(
+                args = [self.shell],
+                stdin = subprocess.PIPE,
+                stdout = subprocess.PIPE,
+                cwd = self.cwd,
+                encoding = 'utf8',
+                start_new_session = True
+                )
+
+    def stop(self):
+        """ STOP
+        @brief: Stop the shell process.
+
+        @return: void
+        """
+
+        if self.process is None:
+            return
+
+        try:
+            self.process.communicate('exit\n', timeout=5)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+        self.process = None
+
+        os.remove(self.errFile)
+        self.errFile = None
+
+    def kill(self):
+        """ KILL
+        @brief: Kill the shell and the commands it started. It is started
+                again by the next execution.
+
+        @return: void
+        """
+
+        if self.process is None:
+            return
+
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+        self.stop()
+
+    def isAlive(self):
+        """ ISALIVE
+        @brief: Check if the shell process is running.
+
+        @return: alive True if the shell is running.
+        """
+
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self,code,cwd=None,timeout=None):
+        """ EXECUTE
+        @brief: Execute code in the shell, as it is written.
+
+        @param: code Code to execute.
+              : cwd Directory where the code is executed. The shell goes back
+                to its directory after the code. If None, the code is
+                executed in the current directory of the shell.
+              : timeout Maximum time in seconds. If None, there is no limit.
+
+        @return: result Tuple (stdout, stderr, status) with the output of the
+                 code and its exit status.
+        """
+
+        if not self.isAlive():
+            self.stop()
+            self.start()
+
+        script = ''
+        if cwd:
+            script += '_mdoc_dir=$PWD\n'
+            script += "cd '%s' && " % cwd.replace("'","'\\''")
+
+        # Run the block in the current shell so its state is kept, with its
+        # own stdin so it cannot read the following commands.
+        # The ":" keeps the group valid when the code is only comments.
+        script += '{ :\n' + code + '\n} 2>"%s" </dev/null\n' % self.errFile
+        script += '_mdoc_status=$?\n'
+
+        # The directory only changes for the block that asks for it.
+        if cwd:
+            script += 'cd "$_mdoc_dir"\n'
+
+        script += "printf '%%s %%d\\n' '%s' $_mdoc_status\n" % self.marker
+
+        try:
+            self.process.stdin.write(script)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+
+        try:
+            stdout, status = self.read(timeout)
+        except TimeoutError:
+            self.kill()
+            raise TimeoutError(
+                'The shell did not finish the code in %g seconds' % timeout
+                ) from None
+
+        with open(self.errFile,'r') as f:
+            stderr = f.read()
+
+        # The shell exited while executing the code.
+        if status is None:
+            status = self.process.wait()
+            self.stop()
+
+        return (stdout, stderr, status)
+
+    def read(self,timeout=None):
+        """ READ
+        @brief: Read the output of the shell until the marker is found.
+
+        @param: timeout Maximum time in seconds. If None, there is no limit.
+
+        @return: result Tuple (stdout, status) with the output of the code
+                 and its exit status, None if the shell exited.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        decoder = codecs.getincrementaldecoder('utf8')('replace')
+        fd = self.process.stdout.fileno()
+        text = ''
+        start = 0 # The marker is only searched in the new text.
+
+        while True:
+            # The status follows the marker in the same line.
+            index = text.find(self.marker, start)
+            if index != -1 and text.endswith('\n'):
+                return (text[:index], int(text[index+len(self.marker):]))
+            if index == -1:
+                start = max(0, len(text) - len(self.marker))
+
+            wait = None
+            if deadline is not None:
+                wait = max(0, deadline - time.monotonic())
+
+            if not select.select([fd], [], [], wait)[0]:
+                raise TimeoutError()
+
+            data = os.read(fd, self.CHUNKSIZE)
+            if not data:
+                return (text + decoder.decode(b'', True), None)
+
+            text += decoder.decode(data)
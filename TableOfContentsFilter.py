@@ -1,5 +1,7 @@
 from Filter import Filter
-import io
+from Document import Document, Token
+import re
+import tempfile
 
 class TableOfContentsFilter(Filter):
     """ TABLEOFCONTENTSFILTER(FILTER)
@@ -8,82 +10,204 @@ class TableOfContentsFilter(Filter):
     subtitles.
     """
     
+    KINDS = frozenset([Token.TOC, Token.HEADING])
+    TRIGGERS = (r'\[TOC\]',)
+
+    DEPTH = 5 # Deepest level of the titles found by the parser.
+
+    # Titles and fences of code, found in a single search of the text.
+    OUTLINEREG = re.compile(r'^(?:(#{1,5}) (?!#)(.*)|[ \t]{0,3}(```|~~~))', re.M)
+
+    # Text after the [TOC] marker kept in memory by the streaming mode. The
+    # rest is written to a temporary file.
+    SPOOLSIZE = 1024*1024
+
+    def __init__(self,depth=DEPTH):
+        """ __INIT__
+        @brief: Init of the TableOfContentsFilter.
+        
+        @param: depth Deepest level of the titles in the table of contents.
+        """
+
+        super().__init__()
+
+        self.depth = depth
+
     def run(self,data):
         """ RUN
+        @brief: Run the filter. The text is not split into tokens: the titles
+                and the fences of code are found with a single compiled
+                search, so the time grows with the number of titles and not
+                with the number of lines.
+        
+        @param: data Input text to process.
+                
+        @return: data Output text processed.
+        """
+
+        searchObj = Document.TOCREG.search(data)
+
+        if not searchObj:
+            return data
+
+        print("TOC found", file=self.log)
+        toc = self.tocGithub(self.findTitles(data))
+
+        return data[:searchObj.start()] + toc + data[searchObj.end():]
+
+    def stream(self,chunks):
+        """ STREAM
+        @brief: Run the filter line by line. The text before the [TOC] marker
+                is written as it comes. The table of contents needs all the
+                titles, so the text from the marker on is kept in a temporary
+                file until the end of the stream and then written.
+        
+        @param: chunks Iterator of pieces of the input text.
+                
+        @return: chunks Iterator of pieces of the output text.
+        """
+
+        matches = []
+        spool = None
+        execFence = False
+
+        for line in self.lines(chunks):
+            # The code to execute is skipped until its fence is closed, the
+            # same way the parser does.
+            if execFence:
+                execFence = not Document.FENCEENDREG.search(line)
+            elif '```' in line and Document.FENCESTARTREG.search(line):
+                execFence = True
+            else:
+                searchObj = self.OUTLINEREG.match(line)
+                if searchObj:
+                    matches.append(searchObj)
+
+                if spool is None and '[' in line and Document.TOCREG.search(line):
+                    spool = tempfile.SpooledTemporaryFile(
+                        max_size = self.SPOOLSIZE,
+                        mode = 'w+',
+                        newline = ''
+                        )
+
+            if spool is None:
+                yield line
+            else:
+                spool.write(line)
+
+        if spool is None:
+            return
+
+        print("TOC found", file=self.log)
+        toc = self.tocGithub(self.outlineTitles(matches))
+
+        with spool:
+            spool.seek(0)
+
+            # Only the first marker is replaced.
+            line = spool.readline()
+            yield Document.TOCREG.sub(lambda searchObj: toc, line, 1)
+
+            while True:
+                chunk = spool.read(self.SPOOLSIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def runDocument(self,document):
+        """ RUNDOCUMENT
         @brief: Run the filter
         
-        @param: data Input data to process.
+        @param: document Document to process.
                 
-        @return: data Output data processed.
+        @return: void
         """
 
-        searchObj = self.searchReg(data,r'\[TOC\]')
+        tocs = document.find(Token.TOC)
 
-        if searchObj:
-            print("TOC found")
-            titles = self.findTitles(data)
+        if tocs:
+            print("TOC found", file=self.log)
+            titles = self.documentTitles(document)
             toc = self.tocGithub(titles)
-            data = self.replaceReg(data,r'\[TOC\]',toc)
 
-        return data
+            # Only the first marker is replaced.
+            index, token = tocs[0]
+            text = Document.TOCREG.sub(lambda searchObj: toc, token.text, 1)
+            document.tokens[index] = Token(Token.TEXT, text)
+
+    def documentTitles(self,document):
+        """ DOCUMENTTITLES
+        @brief: Finds all the titles in the document and the depth of each one.
+                The titles in fenced code are skipped by the parser.
+        
+        @param: document Document to process.
+                
+        @return: titles List of (level, title) tuples.
+        """
+
+        return [
+            (token.attrs['level'], token.attrs['title'])
+            for token in document.tokens
+            if token.kind in (Token.HEADING, Token.TOC)
+            and token.attrs.get('level', self.depth + 1) <= self.depth
+            ]
 
     def findTitles(self,data):
         """ FINDTITLES
-        @brief: Finds all the titles in the document and the depth of each one.
+        @brief: Finds all the titles in a text and the depth of each one,
+                skipping the fenced code.
         
         @param: data Input data to process.
                 
-        @return: titles List with the titles and subtitles.
+        @return: titles List of (level, title) tuples.
         """
 
-        buff = io.StringIO(data)
-
-        titles = ()
-
-        # Read data line by line.
-        while True:
-            line = buff.readline()
-
-            if not line:
-                break
-
-            h1 = self.searchReg(line, r'(?m)^#{1} (?!#)(.*)')
-            h2 = self.searchReg(line, r'(?m)^#{2} (?!#)(.*)')
-            h3 = self.searchReg(line, r'(?m)^#{3} (?!#)(.*)')
-            h4 = self.searchReg(line, r'(?m)^#{4} (?!#)(.*)')
-            h5 = self.searchReg(line, r'(?m)^#{5} (?!#)(.*)')
-
-            if h1:
-                titles = titles + ('1',h1.group(1))
-            if h2:
-                titles = titles + ('2',h2.group(1))
-            if h3:
-                titles = titles + ('3',h3.group(1))
-            if h4:
-                titles = titles + ('4',h4.group(1))
-            if h5:
-                titles = titles + ('5',h5.group(1))
+        return self.outlineTitles(self.OUTLINEREG.finditer(data))
+
+    def outlineTitles(self,matches):
+        """ OUTLINETITLES
+        @brief: Get the titles from the titles and fences of code found in a
+                text, skipping the titles in fenced code.
         
+        @param: matches Iterable of OUTLINEREG results, in order.
+                
+        @return: titles List of (level, title) tuples.
+        """
+
+        titles = []
+        codeFence = None
+
+        for searchObj in matches:
+            fence = searchObj.group(3)
+
+            if fence:
+                if codeFence is None:
+                    codeFence = fence
+                elif fence == codeFence:
+                    codeFence = None
+
+            elif codeFence is None:
+                level = len(searchObj.group(1))
+                if level <= self.depth:
+                    titles.append((level, searchObj.group(2)))
+
         return titles
 
     def tocGithub(self,titles):
         """ TOCGITHUB
         @brief: Creates a the table of contents with GitHub format.
         
-        @param: titles List of titles.
+        @param: titles List of (level, title) tuples.
                 
         @return: toc String with the table of contents.
         """
 
-        toc = ''
+        toc = []
 
-        nTitles = int(len(titles)/2)
-        for i in range(nTitles):
-            for j in range(int(titles[2*i])-1):
-                toc += '\t'
-            toc += '* [' + titles[2*i+1] + ']'
-            toc += '(#' + titles[2*i+1].replace(' ','-').replace('.','').lower() + ')'
-            toc += '\n'
+        for level, title in titles:
+            toc.append('\t'*(level-1))
+            toc.append('* [' + title + ']')
+            toc.append('(#' + title.replace(' ','-').replace('.','').lower() + ')')
+            toc.append('\n')
 
-        return toc
- 
+        return ''.join(toc)
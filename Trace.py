@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+
+class Trace:
+    """ TRACE
+
+    Record of where the time of a build goes: the filters run on each
+    document and the blocks of code executed.
+
+    Each record is an event in the Chrome trace format, so the file written
+    by save can be opened with chrome://tracing or Perfetto. The events of
+    several documents, even from other processes, can be joined with extend.
+    """
+
+    def __init__(self,document=None,memory=False):
+        """ __INIT__
+        @brief: Init of the Trace.
+
+        @param: document Name of the document the events belong to.
+              : memory True if we want to measure the peak memory allocated
+                by each filter with tracemalloc. It makes the filters slower.
+        """
+
+        self.document = document
+        self.memory = memory
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self,name,cat,start,end,**args):
+        """ ADD
+        @brief: Record an event.
+
+        @param: name Name of the event.
+              : cat Category of the event ('document', 'filter' or 'exec').
+              : start Time when the event started, from time.time().
+              : end Time when the event finished, from time.time().
+              : args Data of the event.
+
+        @return: void
+        """
+
+        if self.document is not None:
+            args.setdefault('document', self.document)
+
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int(start*1e6),
+            'dur': int((end - start)*1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args
+            }
+
+        with self.lock:
+            self.events.append(event)
+
+    def extend(self,events):
+        """ EXTEND
+        @brief: Add the events recorded by another trace.
+
+        @param: events List of events.
+
+        @return: void
+        """
+
+        with self.lock:
+            self.events += events
+
+    def begin(self):
+        """ BEGIN
+        @brief: Start measuring a filter.
+
+        @return: stats Measures taken at the start, to be given to end.
+        """
+
+        memory = 0
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+
+        return (time.time(), time.process_time(), memory)
+
+    def end(self,stats,name,bytesIn,bytesOut):
+        """ END
+        @brief: Finish measuring a filter and record it.
+
+        @param: stats Measures returned by begin.
+              : name Name of the filter.
+              : bytesIn Size of the text given to the filter.
+              : bytesOut Size of the text produced by the filter.
+
+        @return: void
+        """
+
+        start, cpu, memory = stats
+
+        args = {
+            'cpu': time.process_time() - cpu,
+            'bytesIn': bytesIn,
+            'bytesOut': bytesOut
+            }
+
+        if self.memory:
+            args['peakMemory'] = tracemalloc.get_traced_memory()[1] - memory
+
+        self.add(name, 'filter', start, time.time(), **args)
+
+    def save(self,filename):
+        """ SAVE
+        @brief: Write the events to a file in the Chrome trace format.
+
+        @param: filename Path to the file.
+
+        @return: void
+        """
+
+        with open(filename,'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def summary(self,top=10):
+        """ SUMMARY
+        @brief: Table with the documents, filters and blocks of code that
+                took more time.
+
+        @param: top Number of rows of each part of the table.
+
+        @return: text Text of the table.
+        """
+
+        def slowest(cat):
+            events = [e for e in self.events if e['cat'] == cat]
+            events.sort(key=lambda e: e['dur'], reverse=True)
+            return events[:top]
+
+        def ms(us):
+            return '%10.1f' % (us/1e3)
+
+        lines = []
+
+        lines.append('Slowest documents:')
+        lines.append('%10s  %s' % ('time (ms)', 'document'))
+        for e in slowest('document'):
+            lines.append('%s  %s' % (ms(e['dur']), e['args'].get('document')))
+
+        lines.append('Slowest filters:')
+        lines.append('%10s %10s %10s %10s %10s  %s' % (
+            'time (ms)', 'cpu (ms)', 'in (kB)', 'out (kB)', 'peak (kB)',
+            'filter'))
+        for e in slowest('filter'):
+            args = e['args']
+            peak = args.get('peakMemory')
+            lines.append('%s %s %10.1f %10.1f %10s  %s %s' % (
+                ms(e['dur']),
+                ms(args['cpu']*1e6),
+                args['bytesIn']/1024,
+                args['bytesOut']/1024,
+                '-' if peak is None else '%.1f' % (peak/1024),
+                e['name'],
+                args.get('document', '')
+                ))
+
+        lines.append('Slowest blocks of code:')
+        lines.append('%10s  %s' % ('time (ms)', 'block'))
+        for e in slowest('exec'):
+            args = e['args']
+            lines.append('%s  %s %s: %s' % (
+                ms(e['dur']),
+                e['name'],
+                args.get('document', ''),
+                args.get('code', '')
+                ))
+
+        return '\n'.join(lines)
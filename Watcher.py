@@ -0,0 +1,292 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+class Watcher:
+    """ WATCHER
+
+    Watch directories and report the files that change in them.
+
+    In Linux the kernel reports the changes through inotify, which is used
+    with ctypes. In other systems, or if inotify can not be used, the
+    directories are scanned every INTERVAL seconds and the modification time
+    and size of their files are compared.
+
+    The directories are watched, not the files, so the files that editors
+    save by writing a new file and renaming it are also reported.
+    """
+
+    INTERVAL = 0.5 # Seconds between scans when inotify is not used.
+
+    # Events of inotify, from <sys/inotify.h>.
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT = struct.Struct('iIII') # wd, mask, cookie, len
+
+    def __init__(self,polling=False):
+        """ __INIT__
+        @brief: Init of the Watcher.
+
+        @param: polling True if we want to scan the directories instead of
+                using inotify.
+        """
+
+        self.directories = {} # Watch descriptor, or snapshot, of each directory.
+        self.paths = {} # Directory of each inotify watch descriptor.
+        self.libc = None
+        self.fd = None
+
+        if not polling:
+            self.startInotify()
+
+    def startInotify(self):
+        """ STARTINOTIFY
+        @brief: Open an inotify instance. If it fails, the directories are
+                scanned.
+
+        @return: void
+        """
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+
+        if fd < 0:
+            return
+
+        self.libc = libc
+        self.fd = fd
+
+    def isPolling(self):
+        """ ISPOLLING
+        @brief: Check if the directories are scanned instead of using inotify.
+
+        @return: polling True if the directories are scanned.
+        """
+
+        return self.fd is None
+
+    def close(self):
+        """ CLOSE
+        @brief: Stop watching all the directories.
+
+        @return: void
+        """
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+        self.directories = {}
+        self.paths = {}
+
+    def watch(self,directories):
+        """ WATCH
+        @brief: Start watching directories. The directories already watched
+                are not added again.
+
+        @param: directories List of paths to directories.
+
+        @return: void
+        """
+
+        for directory in directories:
+            directory = os.path.abspath(directory)
+
+            if directory in self.directories or not os.path.isdir(directory):
+                continue
+
+            if self.fd is None:
+                self.directories[directory] = self.snapshot(directory)
+                continue
+
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), self.MASK
+                )
+
+            if wd < 0:
+                error = ctypes.get_errno()
+                # Out of watches, scan this directory instead.
+                if error == errno.ENOSPC:
+                    print('Too many directories for inotify, scanning %s' % directory)
+                    self.directories[directory] = self.snapshot(directory)
+                continue
+
+            self.directories[directory] = wd
+            self.paths[wd] = directory
+
+    def snapshot(self,directory):
+        """ SNAPSHOT
+        @brief: Modification time and size of the files of a directory.
+
+        @param: directory Path to the directory.
+
+        @return: snapshot Dictionary with the (mtime, size) of each file.
+        """
+
+        snapshot = {}
+
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+
+        return snapshot
+
+    def scan(self):
+        """ SCAN
+        @brief: Compare the directories that are scanned with their last
+                snapshot.
+
+        @return: changed Set of paths to the files that changed, were created
+                 or were removed.
+        """
+
+        changed = set()
+
+        for directory, old in self.directories.items():
+            if not isinstance(old, dict):
+                continue
+
+            new = self.snapshot(directory)
+            self.directories[directory] = new
+
+            changed.update(path for path in new if old.get(path) != new[path])
+            changed.update(path for path in old if not path in new)
+
+        return changed
+
+    def readEvents(self,timeout):
+        """ READEVENTS
+        @brief: Wait for inotify events and read them.
+
+        @param: timeout Maximum time to wait in seconds. If None, wait until
+                there are events.
+
+        @return: changed Set of paths to the files that changed.
+        """
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+
+            directory = self.paths.get(wd)
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Some events were lost, report all the watched directories.
+                for path in self.paths.values():
+                    changed.update(self.snapshot(path))
+                continue
+
+            if directory is None:
+                continue
+
+            if mask & (self.IN_IGNORED | self.IN_DELETE_SELF):
+                # The directory was removed, it can be watched again if it
+                # is created.
+                self.directories.pop(directory, None)
+                self.paths.pop(wd, None)
+                continue
+
+            changed.add(os.path.join(directory, os.fsdecode(name)))
+
+        return changed
+
+    def poll(self,timeout):
+        """ POLL
+        @brief: Wait until some files change.
+
+        @param: timeout Maximum time to wait in seconds. If None, wait until
+                some files change.
+
+        @return: changed Set of paths to the files that changed.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            # The directories that inotify could not watch are scanned.
+            scanned = self.fd is None or any(
+                isinstance(v, dict) for v in self.directories.values()
+                )
+
+            wait = timeout
+            if scanned:
+                wait = self.INTERVAL
+                if deadline is not None:
+                    wait = max(0, min(wait, deadline - time.monotonic()))
+
+            if self.fd is not None:
+                changed = self.readEvents(wait)
+            else:
+                time.sleep(wait)
+                changed = set()
+
+            if scanned:
+                changed |= self.scan()
+
+            if changed or not scanned:
+                return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+
+    def changes(self,debounce=0.1,timeout=None):
+        """ CHANGES
+        @brief: Wait until some files change. The changes that come together,
+                like an editor saving several files, are reported at once:
+                after the first change, we wait until there is no change for
+                DEBOUNCE seconds.
+
+        @param: debounce Quiet time in seconds that ends a burst of changes.
+              : timeout Maximum time to wait for the first change in seconds.
+                If None, wait until some files change.
+
+        @return: changed Set of paths to the files that changed.
+        """
+
+        changed = self.poll(timeout)
+
+        while changed:
+            more = self.poll(debounce)
+            if not more:
+                break
+            changed |= more
+
+        return changed
@@ -0,0 +1,16 @@
+""" BENCHMARKS
+
+Performance benchmarks of the filters and the pipeline. Each module can be
+run from the root of the repository, for example:
+
+    python3 -m benchmarks.commentfilter
+
+The whole suite (filters, pipeline and make) is run with:
+
+    python3 -m benchmarks [--quick] [--save]
+
+It compares the scaling curves with the baselines of benchmarks/baselines.json
+and fails if a benchmark regresses. The documents are generated by
+benchmarks.corpus, and the blocks of code of the filter and pipeline
+benchmarks are run by benchmarks.fakeexec.
+"""
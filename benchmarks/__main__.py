@@ -0,0 +1,82 @@
+""" BENCHMARK SUITE
+
+Run the benchmarks of the filters, the pipeline, make and the MATLAB
+sessions, print their scaling curves and compare them with the baselines
+stored in benchmarks/baselines.json:
+
+    python3 -m benchmarks [--quick] [--save]
+
+With --quick only the small sizes are measured. With --save the results
+are stored as the new baselines. The command fails if any benchmark is
+slower than its baseline, relative to the speed of the machine measured by
+a calibration loop, or if its curve grows faster.
+"""
+import sys
+
+from benchmarks import filters, pipeline, make, matlab
+from benchmarks.scaling import (
+    CALIBRATION, calibrate, printCurves, loadBaselines, saveBaselines, compare
+    )
+
+def main():
+    """ MAIN
+    @brief: Run all the benchmarks.
+
+    @return: status 0 if there are no regressions.
+    """
+
+    quick = '--quick' in sys.argv
+
+    curves, calibration, suites = run((filters, pipeline, make, matlab), quick)
+
+    printCurves(curves)
+
+    if '--save' in sys.argv:
+        saveBaselines(dict(curves, **{CALIBRATION: [(1, calibration)]}))
+        print('Baselines saved')
+        return 0
+
+    baselines = loadBaselines()
+    regressions = compare(curves, baselines, calibration)
+
+    # A moment of load on the machine is not a regression, so the suites
+    # with regressions are measured again and only what fails twice counts.
+    if regressions:
+        print('Measuring the regressions again')
+        again = []
+        for name in regressions:
+            if not suites[name] in again:
+                again.append(suites[name])
+        curves, calibration, suites = run(again, quick)
+        regressions = compare(
+            {name: curves[name] for name in regressions}, baselines, calibration
+            )
+
+    return 1 if regressions else 0
+
+def run(suites, quick):
+    """ RUN
+    @brief: Run some suites of benchmarks and the calibration loop.
+
+    @param: suites List of modules of benchmarks.
+          : quick True if we want to use only the small sizes.
+
+    @return: result Tuple (curves, calibration, owners) with the curves
+             of the benchmarks, the time of calibrate and the suite of each
+             benchmark.
+    """
+
+    # Measured before and after the benchmarks, the best time is used.
+    calibration = calibrate()
+
+    curves = {}
+    owners = {}
+    for suite in suites:
+        for name, results in suite.curves(quick).items():
+            curves[name] = results
+            owners[name] = suite
+
+    return (curves, min(calibration, calibrate()), owners)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+""" COMMENTFILTER BENCHMARK
+
+Measure how the time of the CommentFilter grows with the number of comments
+in the document. The filter must scale linearly: the time per comment has to
+stay flat as the document grows.
+"""
+import sys
+import timeit
+
+from CommentFilter import CommentFilter
+from benchmarks.scaling import slope
+
+SIZES = [100, 1000, 5000, 10000, 20000]
+
+def makeDocument(nComments):
+    """ MAKEDOCUMENT
+    @brief: Create a document with inline and multiline comments.
+
+    @param: nComments Number of comments in the document.
+
+    @return: data Text of the document.
+    """
+
+    blocks = []
+    for i in range(nComments):
+        if i % 2:
+            blocks.append('Line %d <!-- inline comment %d --> kept\n' % (i, i))
+        else:
+            blocks.append('Line %d\n<!--\nCommented section %d.\n\n-->\n' % (i, i))
+
+    return ''.join(blocks)
+
+def measure(nComments, repeat=3):
+    """ MEASURE
+    @brief: Time the filter on a document.
+
+    @param: nComments Number of comments in the document.
+          : repeat Number of measures, the best one is used.
+
+    @return: seconds Best time of the filter.
+    """
+
+    data = makeDocument(nComments)
+    f = CommentFilter()
+
+    return min(timeit.repeat(lambda: f.run(data), number=1, repeat=repeat))
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling table.
+
+    @return: status 0 if the filter scales linearly.
+    """
+
+    results = []
+
+    print('%10s %12s %16s' % ('comments', 'time (ms)', 'us per comment'))
+    for n in SIZES:
+        t = measure(n)
+        results.append((n, t))
+        print('%10d %12.2f %16.3f' % (n, t*1e3, t/n*1e6))
+
+    s = slope(results)
+    print('log-log slope: %.2f (1 is linear, 2 is quadratic)' % s)
+
+    return 0 if s < 1.3 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+""" CORPUS
+
+Generator of synthetic .mdoc documents and trees of documents for the
+benchmarks.
+
+The shape of the documents is set by a Corpus: number of headings, how many
+of the paragraphs have comments, how many files each include directive
+brings in and how deep the includes go, and the number of blocks of code to
+execute. The output is deterministic, so two runs measure the same work.
+"""
+import os
+
+class Corpus:
+    """ CORPUS
+
+    Parameters of the synthetic documents.
+    """
+
+    def __init__(self,headings=100,commentDensity=0.2,includeFanout=2,
+            includeDepth=2,execBlocks=10,paragraphLines=5):
+        """ __INIT__
+        @brief: Init of the Corpus.
+
+        @param: headings Number of headings of each document.
+              : commentDensity Fraction of the paragraphs with a comment.
+              : includeFanout Number of include directives of each document
+                and of each included file.
+              : includeDepth Levels of files included from the document.
+              : execBlocks Number of blocks of code to execute.
+              : paragraphLines Number of lines of each paragraph.
+        """
+
+        self.headings = headings
+        self.commentDensity = commentDensity
+        self.includeFanout = includeFanout
+        self.includeDepth = includeDepth
+        self.execBlocks = execBlocks
+        self.paragraphLines = paragraphLines
+
+    def paragraph(self,i):
+        """ PARAGRAPH
+        @brief: Text of a paragraph, with a comment depending on the comment
+                density.
+
+        @param: i Number of the paragraph.
+
+        @return: text Text of the paragraph.
+        """
+
+        lines = [
+            'Line %d of paragraph %d, generated to fill the document.\n' % (j, i)
+            for j in range(self.paragraphLines)
+            ]
+
+        # Spread the comments evenly over the paragraphs.
+        density = self.commentDensity
+        if int((i + 1)*density) > int(i*density):
+            if i % 2:
+                lines.insert(1, '<!--\nCommented note %d.\n\n-->\n' % i)
+            else:
+                lines[0] = lines[0][:-1] + ' <!-- inline %d -->\n' % i
+
+        return ''.join(lines) + '\n'
+
+    def document(self,includes=()):
+        """ DOCUMENT
+        @brief: Text of a document.
+
+        @param: includes Paths of the files included by the document.
+
+        @return: data Text of the document.
+        """
+
+        blocks = ['[TOC]\n\n# Synthetic document\n\n']
+
+        for i in range(self.headings):
+            blocks.append('%s Section %d\n\n' % ('#'*(2 + i % 3), i))
+            blocks.append(self.paragraph(i))
+
+            # Spread the includes and the blocks of code over the sections.
+            for j in range(len(includes)):
+                if j*self.headings // len(includes) == i:
+                    blocks.append('@[](%s)\n\n' % includes[j])
+
+            for j in range(self.execBlocks):
+                if j*self.headings // self.execBlocks == i:
+                    blocks.append('```sh exec\necho "block %d"\n```\n\n' % j)
+
+            # Code that looks like a title must not go to the table of
+            # contents.
+            if i % 10 == 9:
+                blocks.append('```python\n# Not a title %d\n```\n\n' % i)
+
+        return ''.join(blocks)
+
+    def includeTree(self,path,prefix='inc'):
+        """ INCLUDETREE
+        @brief: Write the files included by a document, each one including
+                the files of the next level.
+
+        @param: path Directory where the files are written.
+              : prefix Prefix of the names of the files.
+
+        @return: includes Names of the files included by the document.
+        """
+
+        def write(name, level):
+            children = []
+            if level < self.includeDepth:
+                children = [
+                    write('%s-%d' % (name, k), level + 1)
+                    for k in range(self.includeFanout)
+                    ]
+
+            text = ['Included text of %s.\n\n' % name]
+            text += ['@[](%s)\n' % child for child in children]
+            text.append('%% 1\nSection of %s.\n%%\n' % name)
+
+            filename = name + '.md'
+            with open(os.path.join(path, filename),'w') as f:
+                f.write(''.join(text))
+
+            return filename
+
+        if self.includeDepth < 1:
+            return []
+
+        return [
+            write('%s-%d' % (prefix, k), 1)
+            for k in range(self.includeFanout)
+            ]
+
+    def writeDocument(self,path,name='doc'):
+        """ WRITEDOCUMENT
+        @brief: Write a document and the files it includes.
+
+        @param: path Directory where the files are written.
+              : name Name of the document, without extension.
+
+        @return: filename Path to the .mdoc file.
+        """
+
+        os.makedirs(path, exist_ok=True)
+
+        includes = self.includeTree(path, name)
+        filename = os.path.join(path, name + '.mdoc')
+
+        with open(filename,'w') as f:
+            f.write(self.document(includes))
+
+        return filename
+
+    def writeTree(self,path,documents,perDirectory=10):
+        """ WRITETREE
+        @brief: Write a tree of documents, as used by make.
+
+        @param: path Root directory of the tree.
+              : documents Number of documents.
+              : perDirectory Number of documents in each directory.
+
+        @return: files List of paths to the .mdoc files.
+        """
+
+        return [
+            self.writeDocument(
+                os.path.join(path, 'part%d' % (i // perDirectory)),
+                'doc%d' % i
+                )
+            for i in range(documents)
+            ]
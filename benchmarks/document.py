@@ -0,0 +1,81 @@
+""" DOCUMENT BENCHMARK
+
+Measure the time and the peak memory used to parse a generated document
+into tokens and join it again, as the pipeline does. The tokens are spans of
+the text, so the peak memory has to stay close to the size of the input plus
+the size of the output.
+"""
+import sys
+import time
+import tracemalloc
+
+from Document import Document
+
+SIZES = [1, 10, 50] # Size of the documents in MB.
+
+def makeDocument(size):
+    """ MAKEDOCUMENT
+    @brief: Create a generated document, mostly text with a few titles,
+            include directives, comments and exec fences.
+
+    @param: size Approximate size of the document in bytes.
+
+    @return: data Text of the document.
+    """
+
+    block = (
+        '## Section\n\n'
+        + 'Generated line of the log with some values 0123456789.\n' * 40
+        + '<!-- comment -->\n'
+        + '```sh exec\necho "hello"\n```\n\n'
+        )
+
+    return block * (size // len(block) + 1)
+
+def measure(data):
+    """ MEASURE
+    @brief: Parse and join a document.
+
+    @param: data Text of the document.
+
+    @return: result Tuple (seconds, peak) with the time and the peak memory
+             allocated in bytes.
+    """
+
+    tracemalloc.start()
+    t = time.perf_counter()
+
+    document = Document.parse(data)
+    out = document.serialize()
+
+    t = time.perf_counter() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del out, document
+
+    return (t, peak)
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the table.
+
+    @return: status 0 if the peak memory stays under three times the size of
+             the input.
+    """
+
+    status = 0
+
+    print('%10s %12s %14s %12s' % ('size (MB)', 'time (ms)', 'peak (MB)', 'peak/size'))
+    for size in SIZES:
+        data = makeDocument(size*1024*1024)
+        t, peak = measure(data)
+        ratio = peak/len(data)
+        print('%10d %12.2f %14.2f %12.2f' % (size, t*1e3, peak/1024/1024, ratio))
+        if ratio > 3:
+            status = 1
+
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
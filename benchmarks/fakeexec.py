@@ -0,0 +1,62 @@
+""" FAKEEXEC
+
+Executor used by the benchmarks instead of MATLAB or the shell, so the cost
+of the ExecuteCodeFilter itself can be measured without starting processes.
+"""
+import time
+
+from ExecuteCodeFilter import ExecuteCodeFilter
+
+class FakeExecuteCodeFilter(ExecuteCodeFilter):
+    """ FAKEEXECUTECODEFILTER(EXECUTECODEFILTER)
+
+    ExecuteCodeFilter that answers every block of code with generated output
+    after a fixed latency.
+    """
+
+    def __init__(self,latency=0.0,outputLines=3,**kwargs):
+        """ __INIT__
+        @brief: Init of the FakeExecuteCodeFilter.
+
+        @param: latency Time in seconds taken by each block.
+              : outputLines Number of lines of output of each block.
+              : kwargs Arguments of the ExecuteCodeFilter.
+        """
+
+        kwargs.setdefault('no_exec', False)
+
+        super().__init__(**kwargs)
+
+        self.latency = latency
+        self.outputLines = outputLines
+
+    def languageFunction(self,language,opts):
+        """ LANGUAGEFUNCTION
+        @brief: Every language is executed by the fake executor.
+
+        @param: language Code language.
+              : opts Options for executing the code.
+
+        @return: fnc Function that executes the code.
+        """
+
+        return self.executeFakeCode
+
+    def executeFakeCode(self,code,opts,cwd):
+        """ EXECUTEFAKECODE
+        @brief: Generate the output of a block of code.
+
+        @param: code Code to execute.
+              : opts Options for executing the code.
+              : cwd Workspace path of the code.
+
+        @return: codeOut Output of the code.
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        return ''.join(
+            'output line %d of %s\n' % (i, code.strip())
+            for i in range(self.outputLines)
+            )
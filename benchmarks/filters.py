@@ -0,0 +1,76 @@
+""" FILTERS BENCHMARK
+
+Scaling curves of each filter on synthetic documents of a growing number of
+headings. The blocks of code are run by the fake executor, so only the cost
+of the filters is measured.
+"""
+import sys
+import tempfile
+
+from CommentFilter import CommentFilter
+from IncludeFileFilter import IncludeFileFilter
+from TableOfContentsFilter import TableOfContentsFilter
+from RemoveExtraIntroFilter import RemoveExtraIntroFilter
+from benchmarks.corpus import Corpus
+from benchmarks.fakeexec import FakeExecuteCodeFilter
+from benchmarks.scaling import measure, printCurves
+
+SIZES = [100, 1000, 5000]
+QUICKSIZES = [100, 1000]
+
+def makeFilters(path):
+    """ MAKEFILTERS
+    @brief: Create the filters to measure.
+
+    @param: path Directory of the document, used to resolve includes.
+
+    @return: filters Dictionary with a function that creates each filter.
+    """
+
+    return {
+        'CommentFilter': lambda: CommentFilter(),
+        'IncludeFileFilter': lambda: IncludeFileFilter(path),
+        'TableOfContentsFilter': lambda: TableOfContentsFilter(),
+        'ExecuteCodeFilter': lambda: FakeExecuteCodeFilter(path = path),
+        'RemoveExtraIntroFilter': lambda: RemoveExtraIntroFilter()
+        }
+
+def curves(quick=False):
+    """ CURVES
+    @brief: Measure the time of each filter for each size of document.
+
+    @param: quick True if we want to use only the small sizes.
+
+    @return: curves Dictionary with the list of (headings, seconds) tuples
+             of each filter.
+    """
+
+    results = {}
+
+    for n in (QUICKSIZES if quick else SIZES):
+        with tempfile.TemporaryDirectory() as path:
+            corpus = Corpus(headings = n, execBlocks = n // 10)
+            filename = corpus.writeDocument(path)
+
+            with open(filename,'r') as f:
+                data = f.read()
+
+            for name, make in makeFilters(path).items():
+                t = measure(lambda: make().run(data))
+                results.setdefault('filter.' + name, []).append((n, t))
+
+    return results
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling curves.
+
+    @return: status Always 0.
+    """
+
+    printCurves(curves('--quick' in sys.argv), 'headings')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
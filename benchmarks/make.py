@@ -0,0 +1,64 @@
+""" MAKE BENCHMARK
+
+Scaling curves of make over trees of a growing number of synthetic
+documents: a full build, and a build where every document is up to date.
+The blocks of code are executed by the shell, as in a real build.
+"""
+import sys
+import tempfile
+
+from Builder import Builder
+from Manifest import Manifest
+from benchmarks.corpus import Corpus
+from benchmarks.scaling import measure, printCurves
+
+SIZES = [5, 20, 50]
+QUICKSIZES = [5, 20]
+
+OPTIONS = {
+    'no_exec': False,
+    'intro': False
+    }
+
+def curves(quick=False, jobs=1):
+    """ CURVES
+    @brief: Measure the time of make for each size of tree.
+
+    @param: quick True if we want to use only the small sizes.
+          : jobs Number of worker processes of make.
+
+    @return: curves Dictionary with the list of (documents, seconds) tuples.
+    """
+
+    results = {}
+
+    for n in (QUICKSIZES if quick else SIZES):
+        with tempfile.TemporaryDirectory() as path:
+            corpus = Corpus(headings = 50, execBlocks = 2)
+            files = corpus.writeTree(path, n)
+
+            t = measure(lambda: Builder(jobs, OPTIONS, force = True).build(files), 1)
+            results.setdefault('make.full', []).append((n, t))
+
+            # Record the build, then measure the check of the manifest.
+            manifest = Manifest(path)
+            measure(lambda: Builder(jobs, OPTIONS, manifest).build(files), 1)
+
+            t = measure(lambda: Builder(jobs, OPTIONS, Manifest(path)).build(files))
+            results.setdefault('make.uptodate', []).append((n, t))
+
+    return results
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling curves.
+
+    @return: status Always 0.
+    """
+
+    printCurves(curves('--quick' in sys.argv), 'documents')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
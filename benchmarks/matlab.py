@@ -0,0 +1,96 @@
+""" MATLAB BENCHMARK
+
+Scaling curves of the code that talks to MATLAB, measured against the
+stand-in of MatlabStandIn.py, so they can run in machines without MATLAB:
+
+- matlab.execute: blocks sent one by one, as executeMatlabCode does.
+- matlab.batch: the same blocks sent in a single round trip.
+- matlab.output: a block that prints a growing number of lines.
+
+The time to start the stand-in is not measured.
+"""
+import os
+import sys
+import tempfile
+
+from MatlabSession import MatlabSession
+from benchmarks.scaling import measure, printCurves
+
+STANDIN = [
+    sys.executable,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MatlabStandIn.py')
+    ]
+
+SIZES = [10, 100, 500]
+QUICKSIZES = [10, 100]
+OUTPUTSIZES = [1000, 10000, 100000]
+QUICKOUTPUTSIZES = [1000, 10000]
+
+def session(path,*args):
+    """ SESSION
+    @brief: Start a session of the stand-in.
+
+    @param: path Working directory of the session.
+          : args Options of the stand-in.
+
+    @return: session MatlabSession ready to execute code.
+    """
+
+    matlab = MatlabSession(path, STANDIN + list(args))
+    measure(matlab.start, repeat = 1)
+
+    return matlab
+
+def curves(quick=False):
+    """ CURVES
+    @brief: Measure the time of executing blocks of code one by one and in a
+            batch, and of reading their output.
+
+    @param: quick True if we want to use only the small sizes.
+
+    @return: curves Dictionary with the list of (size, seconds) tuples.
+    """
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as path:
+        matlab = session(path)
+        try:
+            for n in (QUICKSIZES if quick else SIZES):
+                codes = ['x%d = %d*2' % (i, i) for i in range(n)]
+
+                def execute():
+                    for code in codes:
+                        matlab.execute(code)
+
+                t = measure(execute)
+                results.setdefault('matlab.execute', []).append((n, t))
+
+                t = measure(lambda: matlab.executeBatch(codes))
+                results.setdefault('matlab.batch', []).append((n, t))
+        finally:
+            measure(matlab.stop, repeat = 1)
+
+        for n in (QUICKOUTPUTSIZES if quick else OUTPUTSIZES):
+            matlab = session(path, '--output-lines', str(n))
+            try:
+                t = measure(lambda: matlab.execute('1+1'))
+                results.setdefault('matlab.output', []).append((n, t))
+            finally:
+                measure(matlab.stop, repeat = 1)
+
+    return results
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling curves.
+
+    @return: status Always 0.
+    """
+
+    printCurves(curves('--quick' in sys.argv))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+""" PIPELINE BENCHMARK
+
+Scaling curve of the full pipeline, the same one used by parse and make,
+on synthetic documents of a growing number of headings. The blocks of code
+are run by the fake executor. The plain curve uses documents with only
+text and titles.
+"""
+import sys
+import tempfile
+
+from Pipeline import Pipeline
+from CommentFilter import CommentFilter
+from IncludeFileFilter import IncludeFileFilter
+from TableOfContentsFilter import TableOfContentsFilter
+from RemoveExtraIntroFilter import RemoveExtraIntroFilter
+from benchmarks.corpus import Corpus
+from benchmarks.fakeexec import FakeExecuteCodeFilter
+from benchmarks.scaling import measure, printCurves
+
+SIZES = [100, 1000, 5000]
+QUICKSIZES = [100, 1000]
+
+def makePipeline(path):
+    """ MAKEPIPELINE
+    @brief: Set up the pipeline of parse with the fake executor.
+
+    @param: path Directory of the document.
+
+    @return: pipeline Pipeline ready to run.
+    """
+
+    pipeline = Pipeline()
+
+    pipeline.addFilter( CommentFilter() )
+    pipeline.addFilter( IncludeFileFilter(path) )
+    pipeline.addFilter( TableOfContentsFilter() )
+    pipeline.addFilter( FakeExecuteCodeFilter(path = path) )
+    pipeline.addFilter( RemoveExtraIntroFilter() )
+
+    return pipeline
+
+def curves(quick=False):
+    """ CURVES
+    @brief: Measure the time of the pipeline, and of its streaming mode,
+            for each size of document.
+
+    @param: quick True if we want to use only the small sizes.
+
+    @return: curves Dictionary with the list of (headings, seconds) tuples.
+    """
+
+    results = {}
+
+    for n in (QUICKSIZES if quick else SIZES):
+        with tempfile.TemporaryDirectory() as path:
+            corpus = Corpus(headings = n, execBlocks = n // 10)
+            filename = corpus.writeDocument(path)
+
+            with open(filename,'r') as f:
+                data = f.read()
+
+            t = measure(lambda: makePipeline(path).run(data))
+            results.setdefault('pipeline.run', []).append((n, t))
+
+            def stream():
+                with open(filename,'r') as f:
+                    for chunk in makePipeline(path).stream(f):
+                        pass
+
+            t = measure(stream)
+            results.setdefault('pipeline.stream', []).append((n, t))
+
+        # A document with only text and titles, so the planner skips all the
+        # filters but the one of the intros.
+        with tempfile.TemporaryDirectory() as path:
+            corpus = Corpus(
+                headings = n, commentDensity = 0, includeFanout = 0,
+                execBlocks = 0
+                )
+            filename = corpus.writeDocument(path)
+
+            with open(filename,'r') as f:
+                data = f.read().replace('[TOC]\n', '')
+
+            t = measure(lambda: makePipeline(path).run(data))
+            results.setdefault('pipeline.plain', []).append((n, t))
+
+    return results
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling curves.
+
+    @return: status Always 0.
+    """
+
+    printCurves(curves('--quick' in sys.argv), 'headings')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+""" SCALING
+
+Helpers shared by the benchmarks: timing, scaling curves and the baselines
+stored in benchmarks/baselines.json.
+"""
+import contextlib
+import io
+import json
+import math
+import os
+import timeit
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+CALIBRATION = 'calibration' # Name of the calibration loop in the baselines.
+
+def measure(fnc, repeat=5):
+    """ MEASURE
+    @brief: Time a function. Everything it prints is discarded.
+
+    @param: fnc Function without arguments.
+          : repeat Number of measures, the best one is used.
+
+    @return: seconds Best time of the function.
+    """
+
+    def quiet():
+        with contextlib.redirect_stdout(io.StringIO()):
+            fnc()
+
+    return min(timeit.repeat(quiet, number=1, repeat=repeat))
+
+def calibrate(repeat=5):
+    """ CALIBRATE
+    @brief: Time a fixed loop of Python code that parses and joins text, as
+            the filters do. The times of the benchmarks are divided by it,
+            so they can be compared with baselines measured on another
+            machine.
+
+    @param: repeat Number of measures, the best one is used.
+
+    @return: seconds Best time of the loop.
+    """
+
+    lines = ['line %d of the text\n' % i for i in range(20000)]
+
+    def loop():
+        words = {}
+        for line in lines:
+            for word in line.split():
+                words[word] = words.get(word, 0) + 1
+        return ''.join(sorted(lines)).upper()
+
+    return measure(loop, repeat)
+
+def slope(results):
+    """ SLOPE
+    @brief: Slope of the time against the size in log-log scale. 1 means
+            linear scaling, 2 quadratic.
+
+    @param: results List of (size, seconds) tuples.
+
+    @return: slope Least squares slope.
+    """
+
+    xs = [math.log(n) for n, t in results]
+    ys = [math.log(t) for n, t in results]
+    mx = sum(xs)/len(xs)
+    my = sum(ys)/len(ys)
+
+    num = sum((x-mx)*(y-my) for x, y in zip(xs, ys))
+    den = sum((x-mx)**2 for x in xs)
+
+    return num/den
+
+def printCurves(curves, unit='size'):
+    """ PRINTCURVES
+    @brief: Print the scaling curve of each benchmark.
+
+    @param: curves Dictionary with the list of (size, seconds) tuples of
+            each benchmark.
+          : unit Name of the size of the benchmarks.
+
+    @return: void
+    """
+
+    for name, results in curves.items():
+        print(name)
+        print('%12s %12s %14s' % (unit, 'time (ms)', 'us per unit'))
+        for n, t in results:
+            print('%12d %12.2f %14.3f' % (n, t*1e3, t/n*1e6))
+        if len(results) > 1:
+            print('log-log slope: %.2f' % slope(results))
+
+def loadBaselines(filename=BASELINES):
+    """ LOADBASELINES
+    @brief: Load the stored baselines.
+
+    @param: filename Path to the baselines file.
+
+    @return: baselines Dictionary with the list of (size, seconds) tuples of
+             each benchmark. Empty if there is no file.
+    """
+
+    try:
+        with open(filename,'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    return {name: [tuple(r) for r in results] for name, results in data.items()}
+
+def saveBaselines(curves, filename=BASELINES):
+    """ SAVEBASELINES
+    @brief: Store the curves as the new baselines. The benchmarks that were
+            not run keep their baseline.
+
+    @param: curves Dictionary with the list of (size, seconds) tuples of
+            each benchmark.
+          : filename Path to the baselines file.
+
+    @return: void
+    """
+
+    baselines = loadBaselines(filename)
+    baselines.update(curves)
+
+    # One line per benchmark, so the changes are easy to review.
+    lines = [
+        '  %s: %s' % (json.dumps(name), json.dumps([[n, round(t, 6)] for n, t in results]))
+        for name, results in sorted(baselines.items())
+        ]
+
+    with open(filename,'w') as f:
+        f.write('{\n' + ',\n'.join(lines) + '\n}\n')
+
+def compare(curves, baselines, calibration=None, tolerance=1.5,
+        slopeTolerance=0.25, minTime=0.01, minSizes=3):
+    """ COMPARE
+    @brief: Compare the curves with the baselines and print the result.
+
+    A benchmark regresses if it is slower than its baseline by more than the
+    tolerance at the biggest size, where the measure is less noisy, or if its
+    curve grows faster than the baseline. The times depend on the machine,
+    so the ratio is divided by the ratio of the calibration loop. Without a
+    calibration, the ratio is only shown and the slope is checked.
+
+    The times of a few milliseconds are mostly noise, so a benchmark is only
+    checked if its biggest size takes minTime, and its slope only if it has
+    minSizes sizes. The --quick runs only show the slopes.
+
+    @param: curves Dictionary with the list of (size, seconds) tuples of
+            each benchmark.
+          : baselines Dictionary with the baselines, as curves.
+          : calibration Time of calibrate in this run. If None, or there is
+            no calibration in the baselines, the ratio is not checked.
+          : tolerance Maximum ratio between the time and the baseline.
+          : slopeTolerance Maximum increase of the log-log slope.
+          : minTime Minimum time in seconds of the biggest size to check the
+            benchmark.
+          : minSizes Minimum number of sizes to check the slope.
+
+    @return: regressions List with the names of the benchmarks that regress.
+    """
+
+    regressions = []
+
+    speed = None
+    if calibration and CALIBRATION in baselines:
+        speed = calibration/baselines[CALIBRATION][0][1]
+        print('Calibration: %.2f ms, %.2f times its baseline' % (calibration*1e3, speed))
+    else:
+        print('Calibration: no baseline, the ratios are not checked')
+
+    print('%-36s %10s %10s %10s  %s' % ('benchmark', 'ratio', 'slope', 'baseline', ''))
+
+    for name, results in curves.items():
+        if not name in baselines:
+            print('%-36s %10s %10s %10s  no baseline' % (name, '-', '-', '-'))
+            continue
+
+        base = dict(baselines[name])
+        common = [(n, t) for n, t in results if n in base]
+
+        ratio = s = sb = float('nan')
+        checked = False
+        if common:
+            n, t = max(common)
+            ratio = t/base[n]/(speed or 1)
+            checked = t >= minTime
+        if len(common) > 1:
+            s = slope(common)
+            sb = slope([(n, base[n]) for n, t in common])
+
+        status = '' if checked else 'too fast to check'
+        if checked and (
+                (speed and ratio > tolerance)
+                or (len(common) >= minSizes and s > sb + slopeTolerance)
+                ):
+            status = 'REGRESSION'
+            regressions.append(name)
+
+        print('%-36s %10.2f %10.2f %10.2f  %s' % (name, ratio, s, sb, status))
+
+    return regressions
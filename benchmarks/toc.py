@@ -0,0 +1,96 @@
+""" TABLEOFCONTENTSFILTER BENCHMARK
+
+Measure how the time of the TableOfContentsFilter grows with the number of
+lines of the document, on API references made of many short sections with
+fenced code. The filter must scale linearly: the time per line has to stay
+flat as the document grows.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import timeit
+
+from TableOfContentsFilter import TableOfContentsFilter
+from benchmarks.scaling import slope
+
+SIZES = [1000, 10000, 50000, 100000]
+
+def makeDocument(nLines):
+    """ MAKEDOCUMENT
+    @brief: Create an API reference with headings, text and fenced code.
+
+    @param: nLines Approximate number of lines of the document.
+
+    @return: data Text of the document.
+    """
+
+    blocks = ['[TOC]\n\n# API reference\n\n']
+    i = 0
+    while len(blocks) * 10 < nLines:
+        blocks.append(
+            '## function%d\n\n'
+            'Description of the function %d.\n\n'
+            '### Example\n\n'
+            '```python\n# Not a title\nfunction%d()\n```\n\n' % (i, i, i)
+            )
+        i += 1
+
+    return ''.join(blocks)
+
+def measure(nLines, repeat=3):
+    """ MEASURE
+    @brief: Time the filter and the read of the document from disk.
+
+    @param: nLines Approximate number of lines of the document.
+          : repeat Number of measures, the best one is used.
+
+    @return: times Tuple (filter, read) with the best time of each one.
+    """
+
+    data = makeDocument(nLines)
+    f = TableOfContentsFilter()
+
+    fd, filename = tempfile.mkstemp(suffix='.mdoc')
+    with os.fdopen(fd,'w') as out:
+        out.write(data)
+
+    def read():
+        with open(filename,'r') as inp:
+            return inp.readlines()
+
+    def toc():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return f.run(data)
+
+    try:
+        filterTime = min(timeit.repeat(toc, number=1, repeat=repeat))
+        readTime = min(timeit.repeat(read, number=1, repeat=repeat))
+    finally:
+        os.remove(filename)
+
+    return (filterTime, readTime)
+
+def main():
+    """ MAIN
+    @brief: Run the benchmark and print the scaling table.
+
+    @return: status 0 if the filter scales linearly.
+    """
+
+    results = []
+
+    print('%10s %12s %12s %14s' % ('lines', 'toc (ms)', 'read (ms)', 'us per line'))
+    for n in SIZES:
+        t, r = measure(n)
+        results.append((n, t))
+        print('%10d %12.2f %12.2f %14.3f' % (n, t*1e3, r*1e3, t/n*1e6))
+
+    s = slope(results)
+    print('log-log slope: %.2f (1 is linear, 2 is quadratic)' % s)
+
+    return 0 if s < 1.3 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 import click
 import os
+import sys
+import contextlib
+import signal
+import shlex
+import time
 import glob # For searching files in path.
 import re
 
@@ -11,6 +16,17 @@ from RemoveExtraIntroFilter import RemoveExtraIntroFilter
 from CommentFilter import CommentFilter
 from ExecuteCodeFilter import ExecuteCodeFilter
 from TableOfContentsFilter import TableOfContentsFilter
+from Builder import Builder, createPipeline, outputName
+from Manifest import Manifest
+from ExecCache import ExecCache
+from Trace import Trace
+from MatlabPool import MatlabPool
+from Watcher import Watcher
+import RenderClient
+from RenderServer import RenderServer
+from PreviewServer import PreviewServer
+
+serverPools = None # MatlabPool of each MATLAB command, kept by mdoc serve.
 
 class NaturalOrderGroup(click.Group):
     def list_commands(self, ctx):
@@ -33,13 +49,110 @@ def cli():
     4. Remove double intro
     """
 
+def execCache(path, no_cache, refresh):
+    """ EXECCACHE
+    @brief: Set up the cache of executed code stored in PATH/.mdoc-cache.
+    
+    @param: path Root directory of the cache.
+          : no_cache True if we dont want to use the cache.
+          : refresh True if we want to execute the code again and overwrite
+            the cached results.
+            
+    @return: cache ExecCache object, None if the cache is not used.
+    """
+
+    if no_cache:
+        return None
+
+    return ExecCache(os.path.join(path, Manifest.CACHEDIR, 'exec'), refresh = refresh)
+
+def matlabCommand(command):
+    """ MATLABCOMMAND
+    @brief: Split the MATLAB command given in the command line.
+    
+    @param: command Command as it is written in a shell, None for matlab.
+            
+    @return: command List with the program and its arguments, None if no
+             command was given.
+    """
+
+    if not command:
+        return None
+
+    return shlex.split(command)
+
+def sharedPool(command):
+    """ SHAREDPOOL
+    @brief: MATLAB sessions kept between commands by the render server.
+    
+    @param: command Command that runs MATLAB, as a list. None for matlab.
+            
+    @return: pool MatlabPool for the command, None if we are not in the
+             render server.
+    """
+
+    if serverPools is None:
+        return None
+
+    key = tuple(command or [])
+    if not key in serverPools:
+        serverPools[key] = MatlabPool(1, os.getcwd(), command)
+
+    return serverPools[key]
+
+def findFiles(path, recursive, exclude):
+    """ FINDFILES
+    @brief: Find the .mdoc files in a path.
+    
+    @param: path Absolute path to the directory.
+          : recursive True if we want to find the files in the subdirectories.
+          : exclude List of regular expressions of the names of the files
+            to leave out.
+            
+    @return: files List of absolute paths to the .mdoc files.
+    """
+
+    if recursive:
+        files = glob.glob(os.path.join(path,'**','*.mdoc'), recursive = True)
+    else:
+        files = glob.glob(os.path.join(path,'*.mdoc'), recursive = False)
+
+
+    # Remove exclude files from being processed.
+    for expr in exclude:
+        print(expr)
+        pattern = re.compile(expr)
+
+        result = []
+
+        for file in files:
+            filename = os.path.basename(file)
+
+            if not pattern.match(filename):
+                result.append(file)
+
+        files = result
+
+    return files
+
 @cli.command(short_help='Parse a file through the pipeline')
 @click.argument('input', type=click.File('r'))
 @click.option('-o','--output', type=click.File('w'), help="Generate an output file.")
 @click.option('-m','--md', is_flag=True, help="Output a markdown file.")
 @click.option('--no-exec', is_flag=True, help="Do not execute code.")
 @click.option('--intro', is_flag=True, help="Remove double intros.")
-def parse(input, output, md, no_exec, intro):
+@click.option('--no-cache', is_flag=True, help="Do not use the cache of executed code.")
+@click.option('--refresh', is_flag=True, help="Execute all the code again and update the cache.")
+@click.option('--matlab-batch', is_flag=True, help="Send all the MATLAB code to MATLAB at once.")
+@click.option('--matlab-command', envvar='MDOC_MATLAB_COMMAND', help="Command that runs MATLAB, e.g. a stand-in as \"python3 MatlabStandIn.py\" (default: matlab).")
+@click.option('--matlab-timeout', type=click.FloatRange(min=0, min_open=True), help="Interrupt the MATLAB blocks that run longer than this number of seconds.")
+@click.option('--max-output', type=click.IntRange(min=1), help="Cut the output of each block of code to this number of lines.")
+@click.option('--spill', is_flag=True, help="Write the full output of the blocks cut by --max-output to a file linked from the document.")
+@click.option('--parallel-exec', type=click.IntRange(min=1), default=1, show_default=True, help="Number of --independent blocks executed at the same time.")
+@click.option('--toc-depth', type=click.IntRange(min=1, max=TableOfContentsFilter.DEPTH), default=TableOfContentsFilter.DEPTH, show_default=True, help="Deepest level of the titles in the table of contents.")
+@click.option('--stream', is_flag=True, help="Write the output while the input is read.")
+@click.option('--trace', type=click.Path(dir_okay=False, writable=True), help="Write the time and memory used by each filter and block of code to a Chrome trace file.")
+def parse(input, output, md, no_exec, intro, no_cache, refresh, matlab_batch, matlab_command, matlab_timeout, max_output, spill, parallel_exec, toc_depth, stream, trace):
     """ Parse the INPUT file through the pipeline and show the result in the
     stdout. There are options (-o, --md) for creating output files with the result.
 
@@ -53,29 +166,89 @@ def parse(input, output, md, no_exec, intro):
 
     The input file is first processed by the first filter, the output of that
     filter is used as an input for the second filter and so on.
-    """
-    # Read all the file to process.
-    data = input.read()
 
-    # Set up the pipeline of filters.
-    pipeline = Pipeline()
+    The output of the executed code is cached in .mdoc-cache and reused while
+    the code, its options and its watched files do not change.
+
+    With --matlab-batch all the MATLAB blocks of the document are executed in
+    a single round trip to MATLAB, before the first MATLAB block. With
+    --parallel-exec N the shell blocks marked as --independent are executed N
+    at a time, before the rest of the blocks.
+
+    MATLAB is started with the matlab command. Another program that speaks
+    the same protocol can be used with --matlab-command or the
+    MDOC_MATLAB_COMMAND variable, for example MatlabStandIn.py to test
+    without MATLAB. The output of each command is cached apart. With
+    --matlab-timeout SECONDS, a MATLAB block that runs longer is interrupted,
+    and MATLAB is restarted if it does not answer. The output of the block is
+    an error and the rest of the document is executed.
+
+    With --max-output LINES the output of each block of code is cut to its
+    first and last lines. With --spill the full output is written to a file in
+    the OUTPUT.output directory, next to the output file, and linked from
+    the document.
+
+    With --stream the file is processed line by line and the output is
+    written as it is produced, so the memory used does not grow with the size
+    of the file. Only the text after the [TOC] marker is kept until the end,
+    in a temporary file. The messages of the filters are shown in the stderr.
+
+    With --trace FILE the wall time, CPU time, size of the text and peak
+    memory of each filter, and the time of each block of code, are written
+    to FILE in the Chrome trace format (chrome://tracing, Perfetto). In the
+    streaming mode only the blocks of code are recorded.
+    """
+    # If markdown flag is used, output the file as a originalName.md.
+    if md:
+        defaultName = os.path.splitext(input.name)[0] + '.md'
+        output = open(defaultName,'w')
 
-    pipeline.addFilter( CommentFilter() )
-    pipeline.addFilter( IncludeFileFilter() )
-    pipeline.addFilter( TableOfContentsFilter() )
+    # The full outputs are written next to the output file, or next to the
+    # input file if the output is the stdout.
+    target = input.name
+    if output and output.name != '<stdout>':
+        target = output.name
 
-    pipeline.addFilter( ExecuteCodeFilter(no_exec) )
+    # Set up the pipeline of filters.
+    cache = execCache(os.getcwd(), no_cache, refresh)
+    fileTrace = Trace(input.name, memory = True) if trace else None
+    pipeline = createPipeline(
+        no_exec, intro,
+        cache = cache,
+        matlabBatch = matlab_batch,
+        parallelExec = parallel_exec,
+        tocDepth = toc_depth,
+        trace = fileTrace,
+        matlabCommand = matlabCommand(matlab_command),
+        matlabTimeout = matlab_timeout,
+        maxOutput = max_output,
+        spill = spill,
+        spillPath = ExecuteCodeFilter.spillPathFor(target),
+        matlabPool = sharedPool(matlabCommand(matlab_command))
+        )
+
+    if stream:
+        out = output or sys.stdout
+
+        # Keep the messages of the filters out of the output.
+        with contextlib.redirect_stdout(sys.stderr):
+            for chunk in pipeline.stream(input):
+                out.write(chunk)
+
+        out.flush()
+
+        if fileTrace is not None:
+            fileTrace.save(trace)
+        return
 
-    if intro:
-        pipeline.addFilter( RemoveExtraIntroFilter() )
+    # Read all the file to process.
+    data = input.read()
 
     # Run the pipeline.
     data = pipeline.run(data)
 
-    # If markdown flag is used, output the file as a originalName.md.
-    if md:
-        defaultName = os.path.splitext(input.name)[0] + '.md'
-        output = open(defaultName,'w')
+    if fileTrace is not None:
+        fileTrace.save(trace)
 
     if output:
         # Write data into out file.
@@ -91,8 +264,21 @@ def parse(input, output, md, no_exec, intro):
 @click.option('--no-exec', is_flag=True, help="Do not execute code.")
 @click.option('--intro', is_flag=True, help="Remove double intros.")
 @click.option('-e','--exclude', help="Exclude the files from making.", multiple=True)
+@click.option('-j','--jobs', type=click.IntRange(min=1), help="Number of files parsed in parallel (default: number of CPUs).")
+@click.option('-B','--force', is_flag=True, help="Parse all the files even if they are up to date.")
+@click.option('--no-cache', is_flag=True, help="Do not use the cache of executed code.")
+@click.option('--refresh', is_flag=True, help="Execute all the code again and update the cache.")
+@click.option('--matlab-workers', type=click.IntRange(min=1), default=1, show_default=True, help="Number of MATLAB sessions kept running during the build.")
+@click.option('--matlab-batch', is_flag=True, help="Send all the MATLAB code of a file to MATLAB at once.")
+@click.option('--matlab-command', envvar='MDOC_MATLAB_COMMAND', help="Command that runs MATLAB, e.g. a stand-in as \"python3 MatlabStandIn.py\" (default: matlab).")
+@click.option('--matlab-timeout', type=click.FloatRange(min=0, min_open=True), help="Interrupt the MATLAB blocks that run longer than this number of seconds.")
+@click.option('--max-output', type=click.IntRange(min=1), help="Cut the output of each block of code to this number of lines.")
+@click.option('--spill', is_flag=True, help="Write the full output of the blocks cut by --max-output to a file linked from the document.")
+@click.option('--parallel-exec', type=click.IntRange(min=1), default=1, show_default=True, help="Number of --independent blocks executed at the same time.")
+@click.option('--toc-depth', type=click.IntRange(min=1, max=TableOfContentsFilter.DEPTH), default=TableOfContentsFilter.DEPTH, show_default=True, help="Deepest level of the titles in the table of contents.")
+@click.option('--trace', type=click.Path(dir_okay=False, writable=True), help="Write the time and memory used by each filter and block of code to a Chrome trace file.")
 @click.pass_context
-def make(ctx, path, recursive, no_exec, intro, exclude):
+def make(ctx, path, recursive, no_exec, intro, exclude, jobs, force, no_cache, refresh, matlab_workers, matlab_batch, matlab_command, matlab_timeout, max_output, spill, parallel_exec, toc_depth, trace):
     """ Parse all the .mdoc files present in the PATH through the pipeline into
     .md files.
 
@@ -106,51 +292,270 @@ def make(ctx, path, recursive, no_exec, intro, exclude):
 
     The files are first processed by the first filter, the output of that
     filter is used as an input for the second filter and so on.
+
+    The files are parsed in parallel by JOBS worker processes. Each file is
+    parsed with its own directory as the working directory. The command fails
+    if any of the files could not be parsed.
+
+    The files with MATLAB code are parsed by MATLAB_WORKERS workers. Each of
+    them starts MATLAB once and reuses it for all its files, clearing the
+    workspace between files.
+
+    The result of each build is recorded in PATH/.mdoc-cache/manifest.json.
+    A file is only parsed again if it, any file it includes, its output or
+    the options of the pipeline changed since the last build. The output of
+    the executed code is cached in PATH/.mdoc-cache/exec.
+
+    At the end, a table shows the documents, filters and blocks of code that
+    took more time. With --trace FILE the time, CPU time, size of the text
+    and peak memory of each filter on each document, and the time of each
+    block of code, are written to FILE in the Chrome trace format.
     """
 
     # Get the absolute path to avoid problems with relatives ones.
     path = os.path.abspath(path)
 
-    # Move to the path chosed by user.
-    os.chdir(path)
-
     # Get all the .mdoc files to parse.
-    if recursive:
-        files = glob.glob('./**/*.mdoc', recursive = True)
-    else:
-        files = glob.glob('./*.mdoc', recursive = False)
+    files = findFiles(path, recursive, exclude)
 
+    print('Files to be parsed:')
+    print(files)
 
-    # Remove exclude files from being processed.
-    for expr in exclude:
-        print(expr)
-        pattern = re.compile(expr)
+    # Execute parse for all files.
+    options = {
+        'no_exec': no_exec,
+        'intro': intro,
+        'cache': execCache(path, no_cache, refresh),
+        'matlabBatch': matlab_batch,
+        'parallelExec': parallel_exec,
+        'tocDepth': toc_depth,
+        'matlabCommand': matlabCommand(matlab_command),
+        'matlabTimeout': matlab_timeout,
+        'maxOutput': max_output,
+        'spill': spill
+        }
+
+    # Refreshing the cache needs all the files to be parsed.
+    buildTrace = Trace(memory = trace is not None)
+    builder = Builder(
+        jobs, options, Manifest(path), force or refresh, matlab_workers,
+        buildTrace, sharedPool(options['matlabCommand'])
+        )
+    failed = builder.build(files)
+
+    print(buildTrace.summary())
+
+    if trace:
+        buildTrace.save(trace)
+
+    if failed:
+        print('%d of %d files failed:' % (len(failed), len(files)))
+        for file in failed:
+            print(file)
+        ctx.exit(1)
+
+@cli.command(short_help='Parse the .mdoc files in the path again when they change.')
+@click.argument('path',  type=click.Path(exists=True, file_okay=False))
+@click.option('-r','--recursive', is_flag=True, help="Find .mdoc recursively in the path.")
+@click.option('--no-exec', is_flag=True, help="Do not execute code.")
+@click.option('--intro', is_flag=True, help="Remove double intros.")
+@click.option('-e','--exclude', help="Exclude the files from making.", multiple=True)
+@click.option('--no-cache', is_flag=True, help="Do not use the cache of executed code.")
+@click.option('--matlab-command', envvar='MDOC_MATLAB_COMMAND', help="Command that runs MATLAB, e.g. a stand-in as \"python3 MatlabStandIn.py\" (default: matlab).")
+@click.option('--matlab-timeout', type=click.FloatRange(min=0, min_open=True), help="Interrupt the MATLAB blocks that run longer than this number of seconds.")
+@click.option('--max-output', type=click.IntRange(min=1), help="Cut the output of each block of code to this number of lines.")
+@click.option('--spill', is_flag=True, help="Write the full output of the blocks cut by --max-output to a file linked from the document.")
+@click.option('--toc-depth', type=click.IntRange(min=1, max=TableOfContentsFilter.DEPTH), default=TableOfContentsFilter.DEPTH, show_default=True, help="Deepest level of the titles in the table of contents.")
+@click.option('--debounce', type=click.IntRange(min=0), default=100, show_default=True, help="Milliseconds without changes that end a burst of changes.")
+@click.option('--poll', is_flag=True, help="Scan the files for changes instead of using inotify.")
+def watch(path, recursive, no_exec, intro, exclude, no_cache, matlab_command, matlab_timeout, max_output, spill, toc_depth, debounce, poll):
+    """ Parse the .mdoc files present in the PATH, like make, and parse them
+    again each time they or any file they include change. Stop with Ctrl+C.
+
+    The changes are reported by inotify, or the files are scanned every
+    half a second with --poll or if inotify is not available. The changes
+    that come together, like saving several files, are parsed at once after
+    DEBOUNCE milliseconds without changes.
+
+    Only the documents affected by the changes are parsed again. The files
+    are parsed in this process, one after the other, so MATLAB, the cache of
+    executed code and the included files are kept from one change to the
+    next.
+    """
 
-        result = []
+    path = os.path.abspath(path)
 
-        for file in files:
-            filename = os.path.basename(file)
+    options = {
+        'no_exec': no_exec,
+        'intro': intro,
+        'cache': execCache(path, no_cache, False),
+        'tocDepth': toc_depth,
+        'matlabCommand': matlabCommand(matlab_command),
+        'matlabTimeout': matlab_timeout,
+        'maxOutput': max_output,
+        'spill': spill
+        }
+
+    files = set(findFiles(path, recursive, exclude))
+
+    manifest = Manifest(path)
+    matlabPool = MatlabPool(1, os.getcwd(), options['matlabCommand'])
+    builder = Builder(1, options, manifest, matlabPool = matlabPool)
+    watcher = Watcher(poll)
+
+    def isSource(file):
+        # A new .mdoc file in the watched directories.
+        if not file.endswith('.mdoc') or not os.path.isfile(file):
+            return False
+        if os.path.dirname(file) != path and not (recursive and file.startswith(path + os.sep)):
+            return False
+        return not any(re.match(expr, os.path.basename(file)) for expr in exclude)
+
+    def isOutput(file):
+        # Files written by the builds, they do not start a new build.
+        parts = file.split(os.sep)
+        if Manifest.CACHEDIR in parts or any(p.endswith(ExecuteCodeFilter.SPILLSUFFIX) for p in parts):
+            return True
+        return file in set(outputName(f) for f in files)
+
+    try:
+        failed = set(builder.build(sorted(files)))
+        watching = None
+
+        while True:
+            # The directories of the documents and of the files they include.
+            directories = set(os.path.dirname(file) for file in files)
+            directories |= set(os.path.dirname(dep) for dep in manifest.dependencies())
+            if recursive:
+                directories |= set(
+                    root for root, dirs, names in os.walk(path)
+                    if not Manifest.CACHEDIR in root.split(os.sep)
+                    )
+            watcher.watch(directories)
+
+            if watching != (len(files), len(watcher.directories)):
+                watching = (len(files), len(watcher.directories))
+                print('Watching %d files in %d directories%s' % (
+                    watching + (' (scanning)' if watcher.isPolling() else '',)))
+
+            changed = set()
+            while not changed:
+                changed = watcher.changes(debounce/1000)
+
+            start = time.time()
+
+            changed = set(file for file in changed if not isOutput(file))
+
+            files |= set(file for file in changed if isSource(file))
+            files -= set(file for file in changed if not os.path.exists(file))
+
+            # The documents that failed do not know what they include, so
+            # they are parsed again with any change.
+            affected = manifest.dependents(changed) | (changed & files)
+            if changed:
+                affected |= failed
+            affected &= files
+
+            if not affected:
+                continue
+
+            failed = set(builder.build(sorted(affected)))
+
+            print('Parsed %d files in %.0f ms' % (len(affected), (time.time() - start)*1e3))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        matlabPool.stop()
+
+@cli.command(short_help='Run a render server that keeps MATLAB and the caches loaded.')
+@click.option('--socket', 'path', type=click.Path(dir_okay=False), help="Path to the Unix socket (default: MDOC_SOCKET or a private directory in XDG_RUNTIME_DIR or the temporary directory).")
+def serve(path):
+    """ Run a render server on a Unix socket until Ctrl+C.
+
+    While the server runs, the parse and make commands of the mdoc program
+    are sent to it and run there, with the working directory and the MDOC_
+    variables of the caller. The server keeps the modules, the included
+    files, the cache of executed code and the MATLAB sessions loaded, so the
+    commands do not pay the start up of Python and MATLAB.
+
+    The commands are run one at a time. Set MDOC_NO_SERVER to run a command
+    without the server.
+    """
 
-            if not pattern.match(filename):
-                result.append(file)
+    global serverPools
 
-        files = result
+    server = RenderServer(cli, path)
+    serverPools = {}
 
-    print('Files to be parsed:')
-    print(files)
+    # Stop cleanly when killed, so the socket and MATLAB do not stay.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    # Execute parse for all files.
-    for file in files:
-        print('Parsing %s' % file)
+    print('Render server listening on %s' % server.path, flush = True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pool in serverPools.values():
+            pool.stop()
+        serverPools = None
+
+@cli.command(short_help='Serve the output of the .mdoc files in the path over HTTP.')
+@click.argument('path',  type=click.Path(exists=True, file_okay=False))
+@click.option('--host', default='127.0.0.1', show_default=True, help="Address where the server listens.")
+@click.option('--port', type=click.IntRange(min=0, max=65535), default=8000, show_default=True, help="Port where the server listens.")
+@click.option('--no-exec', is_flag=True, help="Do not execute code.")
+@click.option('--intro', is_flag=True, help="Remove double intros.")
+@click.option('--no-cache', is_flag=True, help="Do not use the cache of executed code.")
+@click.option('--matlab-command', envvar='MDOC_MATLAB_COMMAND', help="Command that runs MATLAB, e.g. a stand-in as \"python3 MatlabStandIn.py\" (default: matlab).")
+@click.option('--matlab-timeout', type=click.FloatRange(min=0, min_open=True), help="Interrupt the MATLAB blocks that run longer than this number of seconds.")
+@click.option('--max-output', type=click.IntRange(min=1), help="Cut the output of each block of code to this number of lines.")
+@click.option('--toc-depth', type=click.IntRange(min=1, max=TableOfContentsFilter.DEPTH), default=TableOfContentsFilter.DEPTH, show_default=True, help="Deepest level of the titles in the table of contents.")
+@click.option('--cache-size', type=click.IntRange(min=1), default=64, show_default=True, help="Number of rendered documents kept in memory.")
+def preview(path, host, port, no_exec, intro, no_cache, matlab_command, matlab_timeout, max_output, toc_depth, cache_size):
+    """ Serve the output of the .mdoc files present in the PATH over HTTP
+    until Ctrl+C. PATH/dir/doc.md shows the output of PATH/dir/doc.mdoc and
+    the directories list their documents.
+
+    The documents are parsed when they are requested and kept in memory.
+    They are only parsed again when they or any file they include change,
+    and the clients that already have the last version of a document get a
+    304 Not Modified. The documents are parsed one at a time, with a single
+    MATLAB session and the cache of executed code of PATH, so several people
+    previewing the same documents do not parse them or run their code twice.
+    The output is not written to the disk.
+    """
 
-        # Change chdir to the one needed for the parse command.
-        os.chdir(os.path.dirname(file))
+    path = os.path.abspath(path)
+
+    options = {
+        'no_exec': no_exec,
+        'intro': intro,
+        'cache': execCache(path, no_cache, False),
+        'tocDepth': toc_depth,
+        'matlabCommand': matlabCommand(matlab_command),
+        'matlabTimeout': matlab_timeout,
+        'maxOutput': max_output
+        }
+
+    matlabPool = MatlabPool(1, os.getcwd(), options['matlabCommand'])
+    server = PreviewServer((host, port), path, options, matlabPool, cache_size)
 
-        fd = open(os.path.basename(file),'r')
-        ctx.invoke(parse, input = fd, output = False, md = True, no_exec = no_exec, intro = intro)
+    # Stop cleanly when killed, so MATLAB does not stay.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-        # Change back the chdir to the main one.
-        os.chdir(path)
+    print('Preview of %s at http://%s:%d/' % (path, host, server.server_address[1]), flush = True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        matlabPool.stop()
 
 @cli.command(short_help='Include text filter')
 @click.argument('input', type=click.File('r'))
@@ -192,7 +597,13 @@ def include(input,output):
 @click.argument('input', type=click.File('r'))
 @click.argument('output', type=click.File('w'))
 @click.option('--no-exec', is_flag=True, help="Do not execute code.")
-def exec(input,output,no_exec):
+@click.option('--matlab-batch', is_flag=True, help="Send all the MATLAB code to MATLAB at once.")
+@click.option('--matlab-command', envvar='MDOC_MATLAB_COMMAND', help="Command that runs MATLAB, e.g. a stand-in as \"python3 MatlabStandIn.py\" (default: matlab).")
+@click.option('--matlab-timeout', type=click.FloatRange(min=0, min_open=True), help="Interrupt the MATLAB blocks that run longer than this number of seconds.")
+@click.option('--max-output', type=click.IntRange(min=1), help="Cut the output of each block of code to this number of lines.")
+@click.option('--spill', is_flag=True, help="Write the full output of the blocks cut by --max-output to a file linked from the document.")
+@click.option('--parallel-exec', type=click.IntRange(min=1), default=1, show_default=True, help="Number of --independent blocks executed at the same time.")
+def exec(input,output,no_exec,matlab_batch,matlab_command,matlab_timeout,max_output,spill,parallel_exec):
     """ Parse the INPUT file through the execute code filter and generate the
     OUTPUT file
 
@@ -206,6 +617,9 @@ def exec(input,output,no_exec):
     Where LANGUAGE is the programming language of the code. Currently only
     MATLAB and BASH code are supported. 
 
+    All the shell blocks of a document are executed in the same shell, so
+    changes of directory and variables are kept from one block to the next.
+
     Pro Tip: you can execute python code if you execute like a bash command:
 
     \b
@@ -221,6 +635,20 @@ def exec(input,output,no_exec):
     \t --no-code \t Do not return the code itself.
     \t --no-echo \t Do not return the result of the code.
     \t --raw \t\t Print the output of the command as it is, without the ```
+    \t --stderr \t Append the error output of the command to its output.
+    \t --independent \t Execute the shell code in its own shell. With
+    \t\t\t --parallel-exec these blocks are executed at the same time.
+    \t --no-cache \t Always execute the code, do not use the cache.
+    \t --watch FILE \t Execute the code again when FILE changes.
+    \t --timeout SECONDS
+    \t\t\t Stop the code if it runs longer. For MATLAB it
+    \t\t\t overrides --matlab-timeout. A shell that does not
+    \t\t\t finish in time is started again.
+    \t --max-output LINES
+    \t\t\t Cut the output to its first and last lines. It
+    \t\t\t overrides --max-output of the command.
+    \t --spill \t Write the full output of the block to a file linked
+    \t\t\t from the document when it is cut.
 
     For example:
 
@@ -239,7 +667,16 @@ def exec(input,output,no_exec):
     # Set up the pipeline of filters.
     pipeline = Pipeline()
 
-    pipeline.addFilter( ExecuteCodeFilter(no_exec) )
+    pipeline.addFilter( ExecuteCodeFilter(
+        no_exec,
+        matlabBatch = matlab_batch,
+        parallelExec = parallel_exec,
+        matlabCommand = matlabCommand(matlab_command),
+        matlabTimeout = matlab_timeout,
+        maxOutput = max_output,
+        spill = spill,
+        spillPath = ExecuteCodeFilter.spillPathFor(output.name)
+        ) )
 
     # Run the pipeline.
     data = pipeline.run(data)
@@ -330,7 +767,8 @@ def remove_intro(input,output):
 @cli.command(short_help='Create a table of contents')
 @click.argument('input', type=click.File('r'))
 @click.argument('output', type=click.File('w'))
-def toc(input,output):
+@click.option('--toc-depth', type=click.IntRange(min=1, max=TableOfContentsFilter.DEPTH), default=TableOfContentsFilter.DEPTH, show_default=True, help="Deepest level of the titles in the table of contents.")
+def toc(input,output,toc_depth):
     """ Parse the INPUT file through the table of contents filter and
     generate the OUTPUT file
 
@@ -350,6 +788,9 @@ def toc(input,output):
     \t * [Installation](#installation)
     \t \t * [System requirement](#system-requirement)
     \t * [Usage](#usage)
+
+    The titles in fenced code are not included. With --toc-depth N only the
+    titles up to level N are included.
     """
 
     # Read all the file to process
@@ -358,7 +799,7 @@ def toc(input,output):
     # Set up the pipeline of filters.
     pipeline = Pipeline()
 
-    pipeline.addFilter( TableOfContentsFilter() )
+    pipeline.addFilter( TableOfContentsFilter(toc_depth) )
 
     # Run the pipeline.
     data = pipeline.run(data)
@@ -368,4 +809,4 @@ def toc(input,output):
     output.flush()
        
 if __name__ == '__main__':
-    cli(obj={})
+    RenderClient.main(cli)
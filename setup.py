@@ -3,13 +3,37 @@ from setuptools import setup
 setup(
     name='matlab-documenter',
     version='0.1',
-    py_modules=['mdoc'],
+    py_modules=[
+        'mdoc',
+        'Builder',
+        'CommentFilter',
+        'Document',
+        'ExecCache',
+        'ExecuteCodeFilter',
+        'Filter',
+        'IncludeFileFilter',
+        'IncludeStore',
+        'Manifest',
+        'MatlabPool',
+        'MatlabSession',
+        'MatlabStandIn',
+        'Pipeline',
+        'PreviewServer',
+        'RemoveExtraIntroFilter',
+        'Render',
+        'RenderClient',
+        'RenderServer',
+        'ShellSession',
+        'TableOfContentsFilter',
+        'Trace',
+        'Watcher'
+    ],
     include_package_data=True,
     install_requires=[
         'click'
     ],
     entry_points='''
         [console_scripts]
-        mdoc=mdoc:cli
+        mdoc=RenderClient:main
     ''',
 )